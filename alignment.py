@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+LOCAL_TZ = 'America/Los_Angeles'
+DEFAULT_TOLERANCE = pd.Timedelta('500ms')
+
+
+def to_utc_ns(times, tz=LOCAL_TZ):
+    #Java unix ms, RC+S localTime (naive local or tz-aware) -> int64 UTC ns
+    s = pd.Series(times)
+    if pd.api.types.is_integer_dtype(s) or pd.api.types.is_float_dtype(s):
+        s = pd.to_datetime(s, unit='ms', utc=True)
+    else:
+        s = pd.to_datetime(s)
+        if s.dt.tz is None:
+            s = s.dt.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+        s = s.dt.tz_convert('UTC')
+    return s.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+def _nearest(ref, query):
+    #index into sorted ref of the nearest neighbour of every query time
+    pos = np.clip(np.searchsorted(ref, query), 1, len(ref) - 1)
+    left = ref[pos - 1]
+    right = ref[pos]
+    return np.where(np.abs(query - left) <= np.abs(right - query), pos - 1, pos)
+
+
+def estimate_clock_model(ref_events, events, max_lag=2.0, n_iter=3):
+    #fit ref = events + offset + drift * (events - events[0]) from matched event
+    #times (seconds); e.g. controller state changes vs. adaptive state changes
+    ref = np.sort(np.asarray(ref_events, dtype=np.float64))
+    ev = np.sort(np.asarray(events, dtype=np.float64))
+    if len(ref) < 2 or len(ev) < 2:
+        return {'offset': 0.0, 'drift': 0.0, 't0': float(ev[0]) if len(ev) else 0.0,
+                'n_matched': 0, 'residual_sd': np.nan}
+    t0 = ev[0]
+    #coarse offset from the median nearest-neighbour lag of all event pairs
+    lag = ref[_nearest(ref, ev)] - ev
+    offset = np.median(lag[np.abs(lag) <= max_lag]) if np.any(np.abs(lag) <= max_lag) else 0.0
+    drift = 0.0
+    tol = max_lag
+    matched = np.zeros(len(ev), dtype=bool)
+    resid = np.empty(0)
+    for _ in range(n_iter):
+        pred = ev + offset + drift * (ev - t0)
+        nn = ref[_nearest(ref, pred)]
+        resid_all = nn - pred
+        matched = np.abs(resid_all) <= tol
+        if matched.sum() < 2:
+            break
+        x = ev[matched] - t0
+        y = nn[matched] - ev[matched]
+        A = np.column_stack([np.ones_like(x), x])
+        (offset, drift), *_ = np.linalg.lstsq(A, y, rcond=None)
+        resid = y - (offset + drift * x)
+        #tighten the gate around the fitted line for the next pass
+        tol = max(4 * np.median(np.abs(resid)) * 1.4826, 1e-3)
+    return {'offset': float(offset), 'drift': float(drift), 't0': float(t0),
+            'n_matched': int(matched.sum()),
+            'residual_sd': float(np.std(resid)) if len(resid) else np.nan}
+
+
+def apply_clock_model(t_ns, model):
+    t = np.asarray(t_ns, dtype=np.int64)
+    offset = np.asarray(model['offset'])
+    drift = np.asarray(model['drift'])
+    t0 = np.asarray(model['t0'])
+    corr = offset + drift * (t / 1e9 - t0)
+    return t + np.round(corr * 1e9).astype(np.int64)
+
+
+def _session_clock(frame, key, clock):
+    #per-session models broadcast to rows, sessions without a model stay as is
+    cols = {}
+    for param in ('offset', 'drift', 't0'):
+        cols[param] = frame[key].map({k: m[param] for k, m in clock.items()}).fillna(0.0).to_numpy()
+    return cols
+
+
+def align_streams(controller, neural, left_on='time_ms', right_on='localTime', by=None,
+                  tolerance=DEFAULT_TOLERANCE, direction='nearest', clock=None,
+                  suffixes=('', '_neural')):
+    #as-of join of every controller update to the nearest neural sample, for any
+    #number of sessions/blocks at once; clock is one model or {session: model}
+    keys = [by] if isinstance(by, str) else list(by or [])
+    if clock is not None and 'offset' not in clock and not keys:
+        raise ValueError(f'a per-session clock {{session: model}} needs by= to name the '
+                         f'session column, got by={by!r}')
+    left = controller.copy()
+    right = neural.copy()
+    left['_t'] = to_utc_ns(left[left_on])
+    right['_t'] = to_utc_ns(right[right_on])
+    if clock is not None:
+        if 'offset' not in clock:
+            clock = _session_clock(left, keys[0], clock)
+        left['_t'] = apply_clock_model(left['_t'].to_numpy(), clock)
+
+    #missing timestamps (-1 ms from the log parser, NaT) cannot be matched
+    left = left[left['_t'] > 0].sort_values('_t', kind='stable')
+    right = right[right['_t'] > 0].sort_values('_t', kind='stable')
+    right['_t_neural'] = right['_t']
+    merged = pd.merge_asof(left, right, on='_t', by=keys or None,
+                           tolerance=int(pd.Timedelta(tolerance).value),
+                           direction=direction, suffixes=suffixes)
+    merged['lag_s'] = (merged['_t_neural'] - merged['_t']) / 1e9
+    merged['time_utc'] = pd.to_datetime(merged['_t'], utc=True)
+    return merged.drop(columns=['_t', '_t_neural']).reset_index(drop=True)
+
+
+def metric_blocks(log, metrics=('arrhythmicity', 'freeze_prob')):
+    #label each controller row with the block whose metric is being reported,
+    #spanning first to last non-NaN value like the per-figure clipping
+    block = pd.Series(pd.NA, index=log.index, dtype='string')
+    for metric in metrics:
+        valid = log[metric].notna().to_numpy()
+        if not valid.any():
+            continue
+        first = np.argmax(valid)
+        last = len(valid) - 1 - np.argmax(valid[::-1])
+        span = np.zeros(len(valid), dtype=bool)
+        span[first:last + 1] = True
+        block[span & block.isna().to_numpy()] = metric
+    return block
+
+
+def align_sessions(sessions, tolerance=DEFAULT_TOLERANCE, clock=None, **kwargs):
+    #sessions: {session: (controller_log, neural_frame)}; one merge for the cohort
+    ctrl, neur = [], []
+    for key, (c, n) in sessions.items():
+        c = c.assign(session=key)
+        if 'block' not in c:
+            c['block'] = metric_blocks(c)
+        ctrl.append(c)
+        neur.append(n.assign(session=key))
+    controller = pd.concat(ctrl, ignore_index=True)
+    neural = pd.concat(neur, ignore_index=True)
+    return align_streams(controller, neural, by='session', tolerance=tolerance,
+                         clock=clock, **kwargs)
@@ -0,0 +1,263 @@
+import os
+import sys
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+#swing peaks of the shank angular velocity mark one stride per leg
+MIN_PEAK_HEIGHT = 50.0      # deg/s
+MIN_PEAK_DISTANCE = 0.5     # s between swing peaks of the same leg
+MAX_STRIDE_TIME = 2.5       # s, longer gaps are not walking and reset the window
+WINDOW_STRIDES = 6          # strides per leg in the sliding window
+MAX_PENDING_PEAKS = 64      # close peaks the stream holds before a run is cut short
+
+LEGS = {'R': 'RZAV', 'L': 'LZAV'}
+
+
+def _greedy(pos, heights, distance):
+    #highest remaining peak first; it suppresses every peak closer than distance
+    keep = np.ones(len(pos), dtype=bool)
+    for i in np.argsort(-heights, kind='stable'):
+        if not keep[i]:
+            continue
+        j = i - 1
+        while j >= 0 and pos[i] - pos[j] < distance:
+            keep[j] = False
+            j -= 1
+        j = i + 1
+        while j < len(pos) and pos[j] - pos[i] < distance:
+            keep[j] = False
+            j += 1
+    return keep
+
+
+def _enforce_distance(pos, heights, distance):
+    #same result as dropping peaks in order of height (ties: the earlier peak wins).
+    #Suppression only reaches across gaps shorter than distance, so every run of such
+    #gaps is resolved on its own and isolated peaks are kept without a python loop
+    keep = np.ones(len(pos), dtype=bool)
+    close = np.diff(pos) < distance
+    if not close.any():
+        return keep
+    starts = np.flatnonzero(np.r_[True, ~close])
+    ends = np.r_[starts[1:], len(pos)]
+    for a, b in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+        keep[a:b] = _greedy(pos[a:b], heights[a:b], distance)
+    return keep
+
+
+def find_swing_peaks(signal, times, min_height=MIN_PEAK_HEIGHT, min_distance=MIN_PEAK_DISTANCE):
+    x = np.asarray(signal, dtype=np.float64)
+    t = np.asarray(times, dtype=np.float64)
+    if len(x) < 3:
+        return np.empty(0, dtype=np.int64)
+    mid = x[1:-1]
+    cand = np.flatnonzero((mid > x[:-2]) & (mid >= x[2:]) & (mid >= min_height)) + 1
+    if len(cand) < 2:
+        return cand
+    #distance is in seconds, so compare on the time axis
+    return cand[_enforce_distance(t[cand], x[cand], min_distance)]
+
+
+def _windowed_cv(strides, valid, n):
+    #coefficient of variation over the last n strides, from cumulative sums
+    m = len(strides)
+    out = np.full(m, np.nan)
+    if m < n:
+        return out
+    s = np.where(valid, strides, 0.0)
+    c1 = np.r_[0.0, np.cumsum(s)]
+    c2 = np.r_[0.0, np.cumsum(s * s)]
+    cv = np.r_[0, np.cumsum(valid)]
+    end = np.arange(n, m + 1)
+    s1 = c1[end] - c1[end - n]
+    s2 = c2[end] - c2[end - n]
+    full = (cv[end] - cv[end - n]) == n
+    mean = s1 / n
+    var = np.maximum(s2 - n * mean * mean, 0.0) / (n - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[n - 1:] = np.where(full, np.sqrt(var) / mean, np.nan)
+    return out
+
+
+def leg_stride_cv(signal, times, min_height=MIN_PEAK_HEIGHT, min_distance=MIN_PEAK_DISTANCE,
+                  max_stride=MAX_STRIDE_TIME, n_strides=WINDOW_STRIDES):
+    t = np.asarray(times, dtype=np.float64)
+    peaks = find_swing_peaks(signal, t, min_height, min_distance)
+    peak_t = t[peaks]
+    strides = np.diff(peak_t)
+    valid = strides <= max_stride
+    return peak_t[1:], strides, _windowed_cv(strides, valid, n_strides)
+
+
+def compute_arrhythmicity(df, time_col='Time', legs=LEGS, **kwargs):
+    #arrhythmicity = mean over legs of the stride time CV, evaluated at every stride end
+    t = df[time_col].to_numpy(dtype=np.float64)
+    events, cvs = [], []
+    for leg, col in legs.items():
+        ev_t, _, cv = leg_stride_cv(df[col].to_numpy(), t, **kwargs)
+        events.append(ev_t)
+        cvs.append(cv)
+
+    grid = np.unique(np.concatenate(events)) if events else np.empty(0)
+    out = pd.DataFrame({'Time': grid})
+    per_leg = []
+    for (leg, _), ev_t, cv in zip(legs.items(), events, cvs):
+        #as-of lookup of the latest window value of each leg
+        pos = np.searchsorted(ev_t, grid, side='right') - 1
+        val = np.where(pos >= 0, cv[np.maximum(pos, 0)] if len(cv) else np.nan, np.nan)
+        out[f'CV_{leg}'] = val
+        per_leg.append(val)
+    out['Arrhythmicity'] = np.mean(per_leg, axis=0) if per_leg else np.empty(0)
+    return out
+
+
+def batch_arrhythmicity(recordings, **kwargs):
+    #recordings: mapping of key -> DataFrame (or csv path) with Time/RZAV/LZAV columns
+    tables = []
+    for key, rec in recordings.items():
+        df = pd.read_csv(rec) if isinstance(rec, (str, os.PathLike)) else rec
+        res = compute_arrhythmicity(df, **kwargs)
+        res.insert(0, 'recording', key)
+        tables.append(res)
+    if not tables:
+        return pd.DataFrame(columns=['recording', 'Time', 'Arrhythmicity'])
+    return pd.concat(tables, ignore_index=True)
+
+
+class _LegTracker:
+    #online swing peak detection plus running sums over the last n strides
+
+    def __init__(self, min_height, min_distance, max_stride, n_strides):
+        self.min_height = min_height
+        self.min_distance = min_distance
+        self.max_stride = max_stride
+        self.n = n_strides
+        self.prev = [np.nan, np.nan]
+        self.prev_t = np.nan
+        self.pending = []           # (time, height) of peaks closer than min_distance, not yet final
+        self.checked = 0            # pending peaks before this one have a taller neighbour
+        self.last_peak_t = np.nan   # time of the last finalized peak
+        self.window = deque()
+        self.s1 = 0.0
+        self.s2 = 0.0
+        self.cv = np.nan
+
+    def _push_stride(self, stride):
+        if stride > self.max_stride:
+            self.window.clear()
+            self.s1 = self.s2 = 0.0
+            self.cv = np.nan
+            return
+        self.window.append(stride)
+        self.s1 += stride
+        self.s2 += stride * stride
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            self.s1 -= old
+            self.s2 -= old * old
+        if len(self.window) == self.n:
+            mean = self.s1 / self.n
+            var = max(self.s2 - self.n * mean * mean, 0.0) / (self.n - 1)
+            self.cv = np.sqrt(var) / mean
+        else:
+            self.cv = np.nan
+
+    def _keep(self, peak_t):
+        if not np.isnan(self.last_peak_t):
+            self._push_stride(peak_t - self.last_peak_t)
+        self.last_peak_t = peak_t
+
+    def _resolve(self, peaks):
+        #a complete run of close peaks: resolve it as find_swing_peaks does
+        t, h = np.array(peaks).T
+        for peak_t in t[_enforce_distance(t, h, self.min_distance)]:
+            self._keep(peak_t)
+
+    def _finalize(self):
+        self._resolve(self.pending)
+        self.pending = []
+        self.checked = 0
+        return True
+
+    def _settle(self, now):
+        #a pending peak that beats every peak closer than min_distance (ties: the earlier
+        #wins) is kept by the greedy whatever comes later. It suppresses those neighbours
+        #before they can act, so the peaks before them form a complete run of their own
+        #and the run is split there; this keeps pending short unless heights keep rising
+        new_stride = False
+        d = self.min_distance
+        while self.checked < len(self.pending) and now - self.pending[self.checked][0] >= d:
+            i = self.checked
+            peak_t, height = self.pending[i]
+            a = i
+            while a > 0 and peak_t - self.pending[a - 1][0] < d and self.pending[a - 1][1] < height:
+                a -= 1
+            b = i + 1
+            while b < len(self.pending) and self.pending[b][0] - peak_t < d and self.pending[b][1] <= height:
+                b += 1
+            dominant = (a == 0 or peak_t - self.pending[a - 1][0] >= d) and \
+                (b == len(self.pending) or self.pending[b][0] - peak_t >= d)
+            if not dominant:
+                self.checked += 1
+                continue
+            if a > 0:
+                self._resolve(self.pending[:a])
+            self._keep(peak_t)
+            self.pending = self.pending[b:]
+            self.checked = 0
+            new_stride = True
+        return new_stride
+
+    def update(self, t, x):
+        new_stride = False
+        x0, x1 = self.prev
+        if x1 > x0 and x1 >= x and x1 >= self.min_height:
+            if self.pending and self.prev_t - self.pending[-1][0] >= self.min_distance:
+                new_stride = self._finalize()
+            self.pending.append((self.prev_t, x1))
+        #later peaks are at t or after, too far to join the run
+        if self.pending and t - self.pending[-1][0] >= self.min_distance:
+            new_stride = self._finalize() or new_stride
+        elif self.pending:
+            new_stride = self._settle(t) or new_stride
+            #a run that keeps rising is resolved early to bound the greedy; only then
+            #can the stream differ from find_swing_peaks
+            if len(self.pending) > MAX_PENDING_PEAKS:
+                new_stride = self._finalize() or new_stride
+        self.prev = [x1, x]
+        self.prev_t = t
+        return new_stride
+
+
+class ArrhythmicityStream:
+    #per-sample O(1) arrhythmicity for real-time use (at most MAX_PENDING_PEAKS peaks are
+    #held); a stride is reported once min_distance has passed after its swing peak
+
+    def __init__(self, min_height=MIN_PEAK_HEIGHT, min_distance=MIN_PEAK_DISTANCE,
+                 max_stride=MAX_STRIDE_TIME, n_strides=WINDOW_STRIDES, legs=LEGS):
+        self.legs = {leg: _LegTracker(min_height, min_distance, max_stride, n_strides)
+                     for leg in legs}
+        self.value = np.nan
+
+    def update(self, t, *samples):
+        changed = False
+        for tracker, x in zip(self.legs.values(), samples):
+            changed = tracker.update(t, x) or changed
+        if changed:
+            self.value = float(np.mean([tr.cv for tr in self.legs.values()]))
+        return self.value
+
+    def update_block(self, times, *channels):
+        out = np.empty(len(times))
+        for i, t in enumerate(times):
+            out[i] = self.update(t, *(c[i] for c in channels))
+        return out
+
+
+if __name__ == '__main__':
+    #python arrhythmicity.py data/titrations/shankav_*.csv > arr_table.csv
+    files = sys.argv[1:]
+    table = batch_arrhythmicity({os.path.basename(f): f for f in files})
+    table.to_csv(sys.stdout, index=False)
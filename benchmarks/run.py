@@ -0,0 +1,300 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+os.environ['KADBS_HEADLESS'] = '1'
+#stages time the transformations themselves, not derived_cache hits (read at import)
+os.environ['KADBS_DERIVED_CACHE'] = '0'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+import plot_config
+from cohort import cohort_store
+from export import export_figure
+from harmonize import sip_long, tbc_long
+from ingest import clear_cache, load_table
+from java_log import read_java_log
+from kinstore import KinStore, open_store, write_store
+from safety import tabulate_symptoms
+from spectral import state_spectra
+from synth import SCALES, SHANK_LEVELS, time_domain, write_cohort
+from titration import load_titrations, therapeutic_windows
+
+#times and memory-profiles every pipeline stage on synthetic cohorts of increasing size
+#and compares the medians with a stored baseline; nothing here is committed output
+
+BENCH_DIR = os.path.join(ROOT, '.cache', 'bench')
+BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+TOLERANCE = 0.25        # relative slowdown / memory growth flagged as a regression
+MIN_DELTA_S = 0.01      # ignore timing noise below this
+MIN_DELTA_MB = 1.0
+METRICS = ('freezes', 'full_arrhythm', 'mean_shank_av')
+
+
+def _register_patients(patients):
+    #synthetic patients reuse the real palette so plot_trajectories can draw them
+    palette = list(plot_config.PATIENT_COLORS.values())
+    for i, pid in enumerate(patients):
+        plot_config.PATIENT_COLORS.setdefault(pid, palette[i % len(palette)])
+
+
+def _trajectory_figure(long, patients):
+    fig, axes = plt.subplots(1, len(METRICS), figsize=(7.3, 2.4))
+    for ax, metric in zip(axes, METRICS):
+        plot_config.style_axis(ax)
+        plot_config.plot_trajectories(ax, long, patients, metric)
+    return fig
+
+
+#every stage: ctx -> (setup, run); setup() is untimed and its result is passed to run()
+def stage_load_cold(ctx):
+    cache = os.path.join(ctx['tmp'], 'cache')
+    return (lambda: clear_cache(cache)), (lambda _: load_table(ctx['sip_xlsx'], cache_dir=cache))
+
+
+def stage_load_warm(ctx):
+    cache = os.path.join(ctx['tmp'], 'cache')
+    load_table(ctx['sip_xlsx'], cache_dir=cache)
+    return (lambda: None), (lambda _: load_table(ctx['sip_xlsx'], cache_dir=cache))
+
+
+def stage_reshape_sip(ctx):
+    raw = load_table(ctx['sip_xlsx'], cache_dir=os.path.join(ctx['tmp'], 'cache'))
+    return (lambda: None), (lambda _: sip_long(raw))
+
+
+def stage_reshape_tbc(ctx):
+    raw = load_table(ctx['tbc_csv'], cache_dir=os.path.join(ctx['tmp'], 'cache'))
+    return (lambda: None), (lambda _: tbc_long(raw))
+
+
+def stage_trajectories(ctx):
+    long = sip_long(load_table(ctx['sip_xlsx'], cache_dir=os.path.join(ctx['tmp'], 'cache')))
+
+    def run(data):
+        fig = _trajectory_figure(data, ctx['patients'])
+        fig.canvas.draw()
+        plt.close(fig)
+    return (lambda: long), run
+
+
+def stage_trajectories_cohort(ctx):
+    long = sip_long(load_table(ctx['sip_xlsx'], cache_dir=os.path.join(ctx['tmp'], 'cache')))
+
+    def run(store):
+        fig = _trajectory_figure(store, ctx['patients'])
+        fig.canvas.draw()
+        plt.close(fig)
+    return (lambda: cohort_store(long)), run
+
+
+def stage_safety(ctx):
+    cache = os.path.join(ctx['tmp'], 'cache')
+    sources = {name: load_table(ctx[f'redcap_{name.lower()}'], cache_dir=cache)
+               for name in ('SIP', 'TBC')}
+    pids = list(range(1, len(ctx['patients']) + 1))
+    cohorts = {
+        'arr': ('SIP', 'set_a_kadbsi__140h_arm_6', pids),
+        'fog': ('TBC', 'set_a_kadbsi__140h_arm_7', pids),
+        'cdbs': ('SIP', 'set_a_oldbs140_hz_arm_6', pids),
+    }
+    return (lambda: None), (lambda _: tabulate_symptoms(sources, cohorts))
+
+
+def stage_export(ctx):
+    long = sip_long(load_table(ctx['sip_xlsx'], cache_dir=os.path.join(ctx['tmp'], 'cache')))
+    out = os.path.join(ctx['tmp'], 'figures')
+
+    def run(fig):
+        export_figure(fig, 'trajectories', formats=('png', 'svg'), dpi=300, out_dir=out,
+                      verbose=False)
+        plt.close(fig)
+    return (lambda: _trajectory_figure(long.copy(), ctx['patients'])), run
+
+
+def stage_java_log(ctx):
+    return (lambda: None), (lambda _: [read_java_log(p) for p in ctx['java_logs']])
+
+
+def stage_titration(ctx):
+    return (lambda: None), (lambda _: therapeutic_windows(load_titrations(ctx['data'])))
+
+
+def stage_shankav_convert(ctx):
+    cache = os.path.join(ctx['tmp'], 'kin')
+    return (lambda: shutil.rmtree(cache, ignore_errors=True)), \
+        (lambda _: [open_store(p, cache_dir=cache) for p in ctx['shankav']])
+
+
+def stage_shankav_window(ctx):
+    cache = os.path.join(ctx['tmp'], 'kin')
+    for p in ctx['shankav']:
+        open_store(p, cache_dir=cache)
+
+    def run(_):
+        for p in ctx['shankav']:
+            t, ch = open_store(p, cache_dir=cache).head(15, ['RZAV', 'LZAV'])
+            ch['RZAV'].max()
+    return (lambda: None), run
+
+
+def stage_spectral(ctx):
+    #one session of trial length, read chunk by chunk from a memory-mapped store
+    path = os.path.join(ctx['tmp'], 'td')
+    td, states = time_domain(ctx['duration_s'], np.random.default_rng(0))
+    write_store(path, td['time_s'].to_numpy(), {c: td[c].to_numpy() for c in td.columns[1:]})
+    del td
+    return (lambda: KinStore(path)), (lambda store: state_spectra(store, {'state': states}))
+
+
+STAGES = {
+    'load_cold': stage_load_cold,
+    'load_warm': stage_load_warm,
+    'reshape_sip': stage_reshape_sip,
+    'reshape_tbc': stage_reshape_tbc,
+    'trajectories': stage_trajectories,
+    'trajectories_cohort': stage_trajectories_cohort,
+    'safety': stage_safety,
+    'export': stage_export,
+    'java_log': stage_java_log,
+    'titration': stage_titration,
+    'shankav_convert': stage_shankav_convert,
+    'shankav_window': stage_shankav_window,
+    'spectral': stage_spectral,
+}
+
+
+def _context(data, tmp):
+    with open(os.path.join(data, 'cohort.json')) as f:
+        cohort = json.load(f)
+    _register_patients(cohort['patients'])
+    java = os.path.join(data, 'Java')
+    return {
+        'data': data, 'tmp': tmp, 'patients': cohort['patients'],
+        'duration_s': cohort['params']['duration_s'],
+        'sip_xlsx': os.path.join(data, 'MergedSIPMetrics.xlsx'),
+        'tbc_csv': os.path.join(data, 'MergedTBCMetrics.csv'),
+        'redcap_sip': os.path.join(data, 'KaDBS_I_SIP.xlsx'),
+        'redcap_tbc': os.path.join(data, 'KaDBS_I_TBC.xlsx'),
+        'java_logs': [os.path.join(java, f) for f in sorted(os.listdir(java))],
+        'shankav': [os.path.join(data, 'titrations', f'shankav_{lvl}.csv') for lvl in SHANK_LEVELS],
+    }
+
+
+def measure(setup, run, repeat):
+    #wall time over `repeat` runs, then one traced run for the python heap peak
+    #(memory-mapped pages and export's worker processes do not show up here)
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'best_s': min(times), 'median_s': statistics.median(times), 'peak_mb': peak / 1e6}
+
+
+def run_scale(name, params, stages, repeat, data_dir):
+    data = write_cohort(data_dir, params)
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='kadbs-bench-') as tmp:
+        ctx = _context(data, tmp)
+        for stage in stages:
+            setup, run = STAGES[stage](ctx)
+            rows.append({'scale': name, 'stage': stage, **params, **measure(setup, run, repeat)})
+    return rows
+
+
+def compare(rows, baseline, tolerance=TOLERANCE):
+    #rows slower or hungrier than the baseline by more than tolerance (and the noise floor)
+    ref = {(r['scale'], r['stage']): r for r in baseline}
+    out = []
+    for r in rows:
+        b = ref.get((r['scale'], r['stage']))
+        if b is None:
+            continue
+        for key, floor in (('median_s', MIN_DELTA_S), ('peak_mb', MIN_DELTA_MB)):
+            if r[key] > b[key] * (1 + tolerance) and r[key] - b[key] > floor:
+                out.append({'scale': r['scale'], 'stage': r['stage'], 'measure': key,
+                            'baseline': b[key], 'current': r[key], 'ratio': r[key] / b[key]})
+    return out
+
+
+def _scales(args):
+    if args.patients or args.sessions or args.duration:
+        base = dict(SCALES['small'])
+        base.update({k: v for k, v in (('patients', args.patients), ('sessions', args.sessions),
+                                       ('duration_s', args.duration)) if v})
+        return {'custom': base}
+    return {name: SCALES[name] for name in args.scales.split(',')}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='time and memory-profile pipeline stages')
+    parser.add_argument('--scales', default='small,medium', help=', '.join(SCALES))
+    parser.add_argument('--patients', type=int)
+    parser.add_argument('--sessions', type=int)
+    parser.add_argument('--duration', type=float, help='trial / log length in seconds')
+    parser.add_argument('--stages', default=','.join(STAGES), help=', '.join(STAGES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--data-dir', default=os.path.join(BENCH_DIR, 'data'))
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'last.json'))
+    args = parser.parse_args(argv)
+    stages = args.stages.split(',')
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f'unknown stage(s): {", ".join(unknown)}')
+
+    rows = []
+    for name, params in _scales(args).items():
+        for row in run_scale(name, params, stages, args.repeat, args.data_dir):
+            print(f"{row['scale']:8s} {row['stage']:20s} {row['median_s'] * 1e3:10.1f} ms "
+                  f"(best {row['best_s'] * 1e3:.1f}) {row['peak_mb']:9.1f} MB", flush=True)
+            rows.append(row)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(rows, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(rows, f, indent=1)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(rows, json.load(f), args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r['scale']} {r['stage']} {r['measure']}: "
+              f"{r['baseline']:.4g} -> {r['current']:.4g} ({r['ratio']:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from plot_config import EVENT_MAP, PATIENT_COLORS
+from safety import SYMPTOM_MAPPING
+
+#synthetic inputs with the columns, file names and layout of data/, at any cohort size;
+#the real cohort is 7-8 patients, 4 conditions and minute-long trials
+
+SCALES = {
+    'small': {'patients': 8, 'sessions': 1, 'duration_s': 60},
+    'medium': {'patients': 100, 'sessions': 4, 'duration_s': 600},
+    'large': {'patients': 400, 'sessions': 8, 'duration_s': 3600},
+}
+VISITS = list(EVENT_MAP) + ['screening']     # screening rows are dropped by harmonize
+REAL_PATIENTS = sorted(PATIENT_COLORS)
+STIM_LEVELS = [0, 25, 50, 75, 90, 100, 110]
+SHANK_LEVELS = [0, 50, 75, 90, 100]
+SHANK_FS = 128.0
+JAVA_PERIOD_MS = 100
+TD_FS = 500.0
+TD_CHANNELS = 4
+
+
+def patient_ids(n):
+    #the real ids first so harmonize's per-patient rules still apply
+    extra = [f'SYN{i:04d}' for i in range(max(0, n - len(REAL_PATIENTS)))]
+    return (REAL_PATIENTS + extra)[:n]
+
+
+def _visit_rows(patients, sessions):
+    #one row per patient x visit x repeated session
+    n = len(patients) * len(VISITS) * sessions
+    return pd.DataFrame({
+        'patient_num': np.repeat(patients, len(VISITS) * sessions),
+        'stringvisit': np.tile(np.repeat(VISITS, sessions), len(patients)),
+    }), n
+
+
+def merged_sip(patients, sessions, rng):
+    df, n = _visit_rows(patients, sessions)
+    df['freezes'] = rng.uniform(0, 80, n)
+    df['full_arrhythm'] = np.where(rng.random(n) < 0.05, np.nan, rng.uniform(5, 40, n))
+    df['short_arrhythm'] = rng.uniform(5, 40, n)
+    df['mean_shank_av'] = rng.uniform(150, 300, n)
+    df['Percent_Freezing_HD'] = rng.uniform(0, 80, n)
+    df['Average_Arrhythmicity_HD'] = rng.uniform(5, 40, n)
+    return df
+
+
+def merged_tbc(patients, sessions, rng):
+    df, n = _visit_rows(patients, sessions)
+    for prefix in ('E', 'eig'):
+        df[f'{prefix}mean_freezing'] = rng.uniform(0, 60, n)
+        df[f'{prefix}arrhythmicity_new'] = np.where(rng.random(n) < 0.1, np.nan,
+                                                    rng.uniform(0.05, 0.4, n))
+        df[f'{prefix}mean_shankav'] = rng.uniform(100, 250, n)
+    return df
+
+
+def redcap_symptoms(n_patients, sessions, arm, rng):
+    #REDCap export: one row per participant x event, 0/1 symptom checkboxes
+    events = [f'set_a_kadbsi__140h_arm_{arm}', f'set_a_oldbs140_hz_arm_{arm}', 'baseline_arm_1']
+    n = n_patients * len(events) * sessions
+    df = pd.DataFrame({
+        'patientid': np.repeat(np.arange(1, n_patients + 1), len(events) * sessions),
+        'redcap_event_name': np.tile(np.repeat(events, sessions), n_patients),
+    })
+    none = rng.random(n) < 0.6
+    for col, label in SYMPTOM_MAPPING.items():
+        df[col] = none.astype(np.int64) if label == 'None' else \
+            (~none & (rng.random(n) < 0.4)).astype(np.int64)
+    return df
+
+
+def shank_velocity(duration_s, rng, fs=SHANK_FS, t0=1000.0):
+    #alternating legs at ~0.9 Hz with freeze bouts of low amplitude and jittered cadence
+    n = int(duration_s * fs)
+    t = t0 + np.arange(n) / fs
+    freq = 0.9 + 0.1 * rng.standard_normal(n)
+    phase = np.cumsum(2 * np.pi * freq / fs)
+    bouts = np.repeat(rng.random(n // int(fs * 5) + 1) < 0.15, int(fs * 5))[:n]
+    amp = np.where(bouts, 40.0, 250.0)
+    return pd.DataFrame({'Time': t, 'RZAV': amp * np.sin(phase),
+                         'LZAV': amp * np.sin(phase + np.pi)})
+
+
+def time_domain(duration_s, rng, fs=TD_FS, channels=TD_CHANNELS, t0=1000.0):
+    #RC+S-like time-domain channels (time_s, key0..) with a 20 Hz rhythm whose amplitude
+    #follows a three-state controller, and the controller's state reports every 0.4 s
+    n = int(duration_s * fs)
+    t = t0 + np.arange(n) / fs
+    state_t = t0 + np.arange(0.0, duration_s, 0.4)
+    states = rng.integers(0, 3, len(state_t) // 50 + 1).repeat(50)[:len(state_t)]
+    amp = np.array([3.0, 1.0, 0.3], dtype=np.float32)[states[np.searchsorted(state_t, t, 'right') - 1]]
+    td = {'time_s': t}
+    for k in range(channels):
+        td[f'key{k}'] = amp * np.sin(2 * np.pi * 20 * t + k).astype(np.float32) + \
+            rng.standard_normal(n, dtype=np.float32)
+    return pd.DataFrame(td), (state_t, states)
+
+
+def arrhythmicity_table(duration_s, rng):
+    return pd.DataFrame({
+        'Time': pd.date_range('2025-01-01', periods=int(duration_s), freq='1s').astype(str),
+        'Arrhythmicity': rng.uniform(0.02, 0.3, int(duration_s)),
+    })
+
+
+def java_log_lines(duration_s, rng, period_ms=JAVA_PERIOD_MS, t0_ms=1700000000000):
+    #7-line controller records; line 6 holds the metrics, line 7 state and unix ms
+    n = int(duration_s * 1000 / period_ms)
+    arr = np.clip(0.09 + 0.05 * np.sin(np.arange(n) / 80) + rng.normal(0, 0.01, n), 0, None)
+    pfog = rng.uniform(0, 1, n)
+    asym = rng.uniform(0, 0.3, n)
+    state = (arr >= 0.09).astype(np.int64)
+    time_ms = t0_ms + np.arange(n) * period_ms
+    head = '"hdr",x,y\n"a","1,2",b\n"c",d,e\n"1.0",2,3\n"foo",bar,baz\n'
+    metric = np.char.add(np.char.add(np.char.mod('"%.6f","', arr), np.char.mod('%.3f","', asym)),
+                         np.char.mod('%.3f"\n', pfog))
+    last = np.char.add(np.char.mod('"%d","x","', state), np.char.mod('%d"\n', time_ms))
+    return ''.join(np.char.add(np.char.add(head, metric), last).tolist())
+
+
+def titration_table(rng):
+    levels = np.array(STIM_LEVELS, dtype=np.float64)
+    top, mid = rng.uniform(50, 80), rng.uniform(40, 80)
+    freezes = top / (1 + np.exp((levels - mid) / 8)) + rng.uniform(0, 5, len(levels))
+    return pd.DataFrame({'Stim Level': levels, 'freezes': freezes})
+
+
+def _key(params, seed):
+    return f"p{params['patients']}-s{params['sessions']}-d{int(params['duration_s'])}-r{seed}"
+
+
+def write_cohort(out_dir, params, seed=0):
+    #data/-shaped tree for one scale; reused as long as it is complete
+    path = os.path.join(out_dir, _key(params, seed))
+    if os.path.exists(os.path.join(path, 'cohort.json')):
+        return path
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(os.path.join(tmp, 'titrations'))
+    os.makedirs(os.path.join(tmp, 'Java'))
+    rng = np.random.default_rng(seed)
+    patients = patient_ids(params['patients'])
+    sessions, duration = params['sessions'], params['duration_s']
+
+    sip = merged_sip(patients, sessions, rng)
+    sip.to_excel(os.path.join(tmp, 'MergedSIPMetrics.xlsx'), index=False)
+    sip.to_csv(os.path.join(tmp, 'MergedSIPMetrics.csv'), index=False)
+    merged_tbc(patients, sessions, rng).to_csv(os.path.join(tmp, 'MergedTBCMetrics.csv'),
+                                               index=False)
+    for name, arm in (('SIP', 6), ('TBC', 7)):
+        redcap_symptoms(len(patients), sessions, arm, rng).to_excel(
+            os.path.join(tmp, f'KaDBS_I_{name}.xlsx'), index=False)
+    for i in range(len(patients) * sessions):
+        titration_table(rng).to_csv(os.path.join(tmp, f'titrations_Output_{i:05d}.csv'),
+                                    index=False)
+    for level in SHANK_LEVELS:
+        shank_velocity(duration, rng).to_csv(os.path.join(tmp, 'titrations', f'shankav_{level}.csv'),
+                                             index=False)
+    arrhythmicity_table(duration, rng).to_csv(os.path.join(tmp, 'titrations', 'arr_table.csv'),
+                                              index=False)
+    for s in range(sessions):
+        with open(os.path.join(tmp, 'Java', f'session{s:03d}.txt'), 'w') as f:
+            f.write(java_log_lines(duration, rng))
+
+    with open(os.path.join(tmp, 'cohort.json'), 'w') as f:
+        json.dump({'params': params, 'seed': seed, 'patients': patients}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+if __name__ == '__main__':
+    #python benchmarks/synth.py out_dir [small|medium|large]
+    for name in sys.argv[2:] or ['small']:
+        print(write_cohort(sys.argv[1], SCALES[name]))
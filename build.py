@@ -0,0 +1,369 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import runpy
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STAMP_DIR = '.cache/build'      # under KADBS_CACHE when set, see resolve()
+FRESH_WORKERS = sys.version_info >= (3, 11)     # ProcessPoolExecutor(max_tasks_per_child=)
+SHARED_CODE = ['plot_config.py', 'ingest.py', 'export.py', 'derived_cache.py',
+               'instrument.py']
+
+#every target: how to run it, what it reads, what it writes, what must run first;
+#figure targets name their export ('figure') and its formats (the script's defaults,
+#replaced by --formats), written as figures/<figure>.<format>; 'dpi' is optional
+TARGETS = {
+    'fig2a': {
+        'script': 'fig2a_titration_freezing.py',
+        'code': ['titration.py'],
+        'inputs': ['data/titrations_Output_Bertec.csv'],
+        'figure': 'fig2a_titration_freezing',
+        'formats': ['png', 'pdf', 'svg'],
+    },
+    'fig2b': {
+        'script': 'fig2b_arrhythmicity_threshold.py',
+        'code': ['decimate.py', 'kinstore.py'],
+        'inputs': ['data/titrations'],
+        'figure': 'fig2b_arrhythmicity_threshold',
+        'formats': ['png', 'svg'],
+    },
+    'fig3': {
+        'cmd': ['matlab', '-batch', "run('fig3_realtime_demo.m')"],
+        'code': ['fig3_realtime_demo.m'],
+        'inputs': ['data/Java', 'data/Neural'],
+        'outputs': [],
+    },
+    'fig4': {
+        'script': 'fig4_safety.py',
+        'code': ['safety.py'],
+        'inputs': ['data/KaDBS_I_SIP.xlsx', 'data/KaDBS_I_TBC.xlsx'],
+        'cached': ['data/KaDBS_I_SIP.xlsx', 'data/KaDBS_I_TBC.xlsx'],
+        'figure': 'fig4_safety',
+        'formats': ['png', 'pdf', 'svg'],
+    },
+    'fig5': {
+        'script': 'fig5_sip_gait.py',
+        'code': ['harmonize.py', 'cohort.py'],
+        'inputs': ['data/MergedSIPMetrics.xlsx'],
+        'cached': ['data/MergedSIPMetrics.xlsx'],
+        'figure': 'fig5_sip_gait',
+        'formats': ['svg'],
+    },
+    'fig6': {
+        'script': 'fig6_tbc_gait.py',
+        'code': ['harmonize.py', 'cohort.py'],
+        'inputs': ['data/MergedTBCMetrics.csv'],
+        'cached': ['data/MergedTBCMetrics.csv'],
+        'figure': 'fig6_tbc_gait',
+        'formats': ['svg'],
+    },
+    'long_tables': {
+        'script': 'harmonize.py',
+        'args': ['data'],
+        'inputs': ['data/MergedSIPMetrics.csv', 'data/MergedTBCMetrics.csv'],
+        'cached': ['data/MergedSIPMetrics.csv', 'data/MergedTBCMetrics.csv'],
+        'outputs': ['data/SIPLong.csv', 'data/TBCLong.csv'],
+    },
+    'stats_lmm': {
+        'script': 'stats.py',
+        'args': ['data', 'results'],
+        'code': ['lmm.py', 'resampling.py', 'harmonize.py', 'cohort.py'],
+        'inputs': ['data/MergedSIPMetrics.csv', 'data/MergedTBCMetrics.csv'],
+        'cached': ['data/MergedSIPMetrics.csv', 'data/MergedTBCMetrics.csv'],
+        'outputs': ['results/stats_sip_lmm.txt', 'results/stats_tbc_lmm.txt',
+                    'results/resampling_sip.csv', 'results/resampling_tbc.csv'],
+    },
+    'stats_sip': {
+        'cmd': ['Rscript', 'stats_sip.r'],
+        'args': ['data/SIPLong.csv'],
+        'code': ['stats_sip.r'],
+        'deps': ['long_tables'],
+        'inputs': ['data/SIPLong.csv'],
+        'outputs': ['results/stats_sip.txt'],
+    },
+    'stats_tbc': {
+        'cmd': ['Rscript', 'stats_tbc.r'],
+        'args': ['data/TBCLong.csv'],
+        'code': ['stats_tbc.r'],
+        'deps': ['long_tables'],
+        'inputs': ['data/TBCLong.csv'],
+        'outputs': ['results/stats_tbc.txt'],
+    },
+}
+
+
+def resolve(path):
+    #data/, figures/ and .cache/ follow KADBS_DATA / KADBS_OUT / KADBS_CACHE (kadbs.py
+    #--data / --out / --cache); results/ goes to results/ under KADBS_OUT
+    head, _, rest = path.partition('/')
+    out = os.environ.get('KADBS_OUT')
+    base = {'data': os.environ.get('KADBS_DATA'), 'figures': out,
+            'results': out and os.path.join(out, 'results'),
+            '.cache': os.environ.get('KADBS_CACHE')}.get(head)
+    return os.path.join(base, rest) if base else path
+
+
+def outputs(target):
+    #declared outputs plus one file per export format of a figure target
+    out = list(target.get('outputs', []))
+    if 'figure' in target:
+        out += [f"figures/{target['figure']}.{fmt}" for fmt in target['formats']]
+    return out
+
+
+def _file_digest(path, known):
+    st = os.stat(path)
+    prev = known.get(path)
+    if prev and prev['size'] == st.st_size and prev['mtime_ns'] == st.st_mtime_ns:
+        return prev
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': h.hexdigest()}
+
+
+def _walk(path):
+    if os.path.isdir(path):
+        for base, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(base, name)
+    elif os.path.exists(path):
+        yield path
+
+
+def fingerprint(name, target, known=None):
+    #hash of the command, the code it runs and every input file
+    known = known or {}
+    files = {}
+    code = list(target.get('code', []))
+    if 'script' in target:
+        code = [target['script']] + code + SHARED_CODE
+    for path in code + [resolve(p) for p in target.get('inputs', [])]:
+        for f in _walk(path):
+            files[f] = _file_digest(f, known)
+    h = hashlib.sha1(json.dumps([target.get(k) for k in ('cmd', 'script', 'args', 'formats', 'dpi')] +
+                                [resolve(o) for o in outputs(target)],
+                                sort_keys=True).encode())
+    for f in sorted(files):
+        h.update(f.encode())
+        h.update(files[f]['sha1'].encode())
+    return h.hexdigest(), files
+
+
+def _stamp_path(name):
+    return os.path.join(resolve(STAMP_DIR), f'{name}.json')
+
+
+def _read_stamp(name):
+    try:
+        with open(_stamp_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(name, digest, files):
+    os.makedirs(resolve(STAMP_DIR), exist_ok=True)
+    with open(_stamp_path(name), 'w') as f:
+        json.dump({'digest': digest, 'files': files}, f)
+
+
+def is_current(name, target):
+    stamp = _read_stamp(name)
+    if not stamp or not all(os.path.exists(resolve(o)) for o in outputs(target)):
+        return False
+    digest, _ = fingerprint(name, target, stamp.get('files'))
+    return digest == stamp.get('digest')
+
+
+def _run_target(name, target):
+    #runs inside a fresh worker process, so scripts cannot leak rcParams into each other
+    os.chdir(ROOT)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    os.environ['KADBS_HEADLESS'] = '1'
+    if target.get('formats'):
+        os.environ['KADBS_FORMATS'] = ','.join(target['formats'])
+    if target.get('dpi'):
+        os.environ['KADBS_DPI'] = str(target['dpi'])
+    for out in outputs(target):
+        os.makedirs(os.path.dirname(resolve(out)) or '.', exist_ok=True)
+    os.makedirs(resolve('figures/'), exist_ok=True)
+    log_path = os.path.join(resolve(STAMP_DIR), f'{name}.log')
+    os.makedirs(resolve(STAMP_DIR), exist_ok=True)
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        if 'script' in target:
+            if ROOT not in sys.path:
+                sys.path.insert(0, ROOT)
+            sys.argv = [target['script']] + [resolve(a) for a in target.get('args', [])]
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                runpy.run_path(target['script'], run_name='__main__')
+        else:
+            cmd = target['cmd'] + [resolve(a) for a in target.get('args', [])]
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=log, text=True)
+            log.write(result.stdout)
+            if result.returncode != 0:
+                raise RuntimeError(f'{name}: exit code {result.returncode}, see {log_path}')
+            for out in outputs(target):
+                if out.startswith('results/'):
+                    with open(resolve(out), 'w') as f:
+                        f.write(result.stdout)
+    return time.perf_counter() - start
+
+
+def _run_in_process(name, target):
+    #same as a worker run, minus the fresh interpreter: modules imported by earlier
+    #targets are reused, and environment, cwd, argv and open figures are restored after
+    env, cwd, argv = dict(os.environ), os.getcwd(), list(sys.argv)
+    try:
+        return _run_target(name, target)
+    finally:
+        os.environ.clear()
+        os.environ.update(env)
+        os.chdir(cwd)
+        sys.argv = argv
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
+
+
+def _run_sequential(names, targets, done, report):
+    failed = set()
+    for n in names:
+        if n in done:
+            continue
+        if any(d in failed for d in targets[n].get('deps', [])):
+            failed.add(n)
+            report[n] = 'skipped (dependency failed)'
+            continue
+        try:
+            elapsed = _run_in_process(n, targets[n])
+        except Exception as e:
+            failed.add(n)
+            report[n] = f'failed: {e}'
+            continue
+        digest, files = fingerprint(n, targets[n])
+        _write_stamp(n, digest, files)
+        done.add(n)
+        report[n] = f'built in {elapsed:.1f}s'
+    return report
+
+
+def _warm_cache(targets):
+    #convert every source read through ingest.load_table once, before the workers
+    #start, so concurrent targets only memory-map it
+    from ingest import load_table
+    seen = set()
+    for target in targets.values():
+        for path in map(resolve, target.get('cached', [])):
+            if path not in seen and os.path.exists(path):
+                load_table(path)
+                seen.add(path)
+
+
+def _closure(names):
+    todo, out = list(names), []
+    while todo:
+        name = todo.pop()
+        if name in out:
+            continue
+        out.append(name)
+        todo.extend(TARGETS[name].get('deps', []))
+    return [n for n in TARGETS if n in out]
+
+
+def build(names=None, jobs=None, force=False, dry_run=False, formats=None, dpi=None, warm=False):
+    #warm=True runs the stale targets one after another in this process instead of a pool
+    os.chdir(ROOT)
+    names = _closure(names or list(TARGETS))
+    targets = {n: dict(TARGETS[n]) for n in names}
+    for n, target in targets.items():
+        if 'script' in target:
+            target.update({k: v for k, v in (('formats', formats), ('dpi', dpi)) if v})
+    stale = {n for n in names if force or not is_current(n, targets[n])}
+    #anything downstream of a stale target is stale too
+    changed = True
+    while changed:
+        changed = False
+        for n in names:
+            if n not in stale and any(d in stale for d in targets[n].get('deps', [])):
+                stale.add(n)
+                changed = True
+    report = {n: 'up to date' for n in names if n not in stale}
+    if dry_run or not stale:
+        report.update({n: 'would run' for n in stale})
+        return report
+
+    done = set(n for n in names if n not in stale)
+    if warm:
+        return _run_sequential(names, targets, done, report)
+    _warm_cache({n: targets[n] for n in stale})
+    failed = set()
+    pending = {}
+    ctx = multiprocessing.get_context('spawn')
+    #one fresh worker per target; before python 3.11 workers are reused, and each run
+    #restores the environment and closes its figures as in the warm path
+    if FRESH_WORKERS:
+        pool_kwargs, run = {'max_tasks_per_child': 1}, _run_target
+    else:
+        pool_kwargs, run = {}, _run_in_process
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), mp_context=ctx,
+                             **pool_kwargs) as pool:
+        while len(done) + len(failed) < len(names):
+            for n in names:
+                if n in done or n in failed or n in pending.values():
+                    continue
+                deps = targets[n].get('deps', [])
+                if any(d in failed for d in deps):
+                    failed.add(n)
+                    report[n] = 'skipped (dependency failed)'
+                elif all(d in done for d in deps):
+                    pending[pool.submit(run, n, targets[n])] = n
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                n = pending.pop(fut)
+                try:
+                    elapsed = fut.result()
+                except Exception as e:
+                    failed.add(n)
+                    report[n] = f'failed: {e}'
+                    continue
+                digest, files = fingerprint(n, targets[n])
+                _write_stamp(n, digest, files)
+                done.add(n)
+                report[n] = f'built in {elapsed:.1f}s'
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build figure and stats targets')
+    parser.add_argument('targets', nargs='*', metavar='target',
+                        help='one of: ' + ', '.join(TARGETS))
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--formats', type=lambda s: s.split(','), default=None,
+                        help='comma-separated export formats for all figure targets')
+    parser.add_argument('--dpi', type=float, default=None)
+    args = parser.parse_args(argv)
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f'unknown target(s): {", ".join(unknown)}')
+    report = build(args.targets, args.jobs, args.force, args.dry_run, args.formats, args.dpi)
+    for name, status in report.items():
+        print(f'{name:12s} {status}')
+    return 1 if any(s.startswith(('failed', 'skipped')) for s in report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
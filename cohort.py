@@ -0,0 +1,212 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from derived_cache import memoize
+from instrument import traced
+from plot_config import CONDITION_ORDER
+
+#columnar store for long gait tables (harmonize.sip_long / tbc_long): patient, visit,
+#condition and task as integer codes, metrics as one float32 block (one contiguous row
+#per metric), rows sorted by (patient, condition, task) so every patient, every
+#(patient, condition) and every (patient, condition, task) cell is a contiguous slice
+#found by two lookups in a bounds table. Slices of a metric are views, never copies.
+
+KEYS = {'patient': 'patient_num', 'visit': 'stringvisit', 'condition': 'Condition',
+        'task': 'Task'}
+INDEX = ('patient', 'condition', 'task')
+AGGS = ('first', 'last', 'mean')
+
+
+def _code_dtype(n):
+    return np.int16 if n < np.iinfo(np.int16).max else np.int32
+
+
+class CohortStore:
+
+    def __init__(self, categories, codes, metrics, values):
+        #categories/codes: {key: labels} / {key: int array}, keys as in KEYS
+        #values: (metrics, rows) float32
+        self.categories = categories
+        self.codes = codes
+        self.metrics = list(metrics)
+        self.values = values
+        self._metric = {m: i for i, m in enumerate(self.metrics)}
+        self._label = {k: {c: i for i, c in enumerate(v)} for k, v in categories.items()}
+        self.shape = tuple(len(categories[k]) for k in INDEX)
+        P, C, T = self.shape
+        flat = (codes['patient'].astype(np.int64) * C + codes['condition']) * T + codes['task']
+        self._bounds = np.searchsorted(flat, np.arange(P * C * T + 1))
+        h = hashlib.sha1(repr((categories, self.metrics)).encode())
+        for k in sorted(codes):
+            h.update(codes[k].tobytes())
+        h.update(values.tobytes())
+        self.content_digest = h.hexdigest()
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def __repr__(self):
+        P, C, T = self.shape
+        return (f'CohortStore({len(self)} rows, {P} patients x {C} conditions x {T} tasks, '
+                f'metrics={self.metrics})')
+
+    def _key(self, key):
+        #'patient' or its column name ('patient_num')
+        if key in self.codes:
+            return key
+        for k, col in KEYS.items():
+            if col == key:
+                return k
+        raise KeyError(key)
+
+    def code(self, key, label):
+        return self._label[self._key(key)][label]
+
+    def column(self, name):
+        #metric -> float32 view; key column -> labels per row
+        if name in self._metric:
+            return self.values[self._metric[name]]
+        key = self._key(name)
+        return np.asarray(self.categories[key], dtype=object)[self.codes[key]]
+
+    def rows(self, patient=None, condition=None, task=None):
+        #slice for a (patient[, condition[, task]]) prefix; other combinations are not
+        #contiguous and come back as an index array
+        P, C, T = self.shape
+        if patient is None or (condition is None and task is not None):
+            mask = np.ones(len(self), dtype=bool)
+            for key, label in (('patient', patient), ('condition', condition), ('task', task)):
+                if label is not None:
+                    mask &= self.codes[key] == self.code(key, label)
+            return np.flatnonzero(mask)
+        p = self.code('patient', patient)
+        if condition is None:
+            lo, hi = p * C * T, (p + 1) * C * T
+        else:
+            c = self.code('condition', condition)
+            if task is None:
+                lo, hi = (p * C + c) * T, (p * C + c + 1) * T
+            else:
+                lo = (p * C + c) * T + self.code('task', task)
+                hi = lo + 1
+        return slice(int(self._bounds[lo]), int(self._bounds[hi]))
+
+    def get(self, metric, patient=None, condition=None, task=None):
+        return self.column(metric)[self.rows(patient, condition, task)]
+
+    def take(self, metric, patients=None):
+        #float64 copy of a metric for a set of patients, NaNs dropped
+        values = self.column(metric)
+        if patients is not None:
+            parts = [values[self.rows(p)] for p in patients if p in self._label['patient']]
+            values = np.concatenate(parts) if parts else values[:0]
+        values = values.astype(np.float64)
+        return values[~np.isnan(values)]
+
+    def cells(self, metric, agg='first', conditions=None):
+        #(patients x conditions) float64 matrix of one value per (patient, condition),
+        #NaN where a cell has no valid value; 'first'/'last' follow row order
+        if agg not in AGGS:
+            raise ValueError(f'agg must be one of {AGGS}, not {agg!r}')
+        P, C, _ = self.shape
+        cell = self.codes['patient'].astype(np.int64) * C + self.codes['condition']
+        v = self.column(metric)
+        valid = ~np.isnan(v)
+        ids, vals = cell[valid], v[valid].astype(np.float64)
+        out = np.full(P * C, np.nan)
+        if agg == 'mean':
+            n = np.bincount(ids, minlength=P * C)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = np.where(n > 0, np.bincount(ids, vals, minlength=P * C) / n, np.nan)
+        elif len(ids):
+            if agg == 'last':
+                ids, vals = ids[::-1], vals[::-1]
+            uniq, first = np.unique(ids, return_index=True)
+            out[uniq] = vals[first]
+        out = out.reshape(P, C)
+        if conditions is not None:
+            idx = [self._label['condition'].get(c, -1) for c in conditions]
+            out = np.column_stack([out[:, i] if i >= 0 else np.full(P, np.nan) for i in idx]) \
+                if idx else out[:, :0]
+        return out, list(self.categories['patient'])
+
+    def value_counts(self, key):
+        key = self._key(key)
+        n = np.bincount(self.codes[key], minlength=len(self.categories[key]))
+        return pd.Series(n, index=pd.Index(self.categories[key], name=KEYS[key]), name='count')
+
+    def crosstab(self, index, columns):
+        #pd.crosstab of two key columns: only labels that occur
+        a, b = self._key(index), self._key(columns)
+        na, nb = len(self.categories[a]), len(self.categories[b])
+        n = np.bincount(self.codes[a].astype(np.int64) * nb + self.codes[b],
+                        minlength=na * nb).reshape(na, nb)
+        table = pd.DataFrame(n, index=pd.Index(self.categories[a], name=KEYS[a]),
+                             columns=pd.Index(self.categories[b], name=KEYS[b]))
+        return table.loc[n.sum(axis=1) > 0, n.sum(axis=0) > 0]
+
+    def recode(self, key, levels=None):
+        #(levels, codes) of a key column against another level order, -1 outside it;
+        #default levels: the sorted labels that occur
+        key = self._key(key)
+        cats = self.categories[key]
+        if levels is None:
+            present = np.bincount(self.codes[key], minlength=len(cats)) > 0
+            levels = sorted(c for c, p in zip(cats, present) if p)
+        pos = {c: i for i, c in enumerate(levels)}
+        lookup = np.array([pos.get(c, -1) for c in cats] + [-1], dtype=np.int64)
+        return list(levels), lookup[self.codes[key]]
+
+    def matrix(self, metrics):
+        #(metrics, rows) float64 copy, e.g. the outcome block of an LMM
+        return self.values[[self._metric[m] for m in metrics]].astype(np.float64)
+
+    def frame(self, metrics=None):
+        #long table with categorical key columns (seaborn, csv export)
+        out = {}
+        for key, col in KEYS.items():
+            out[col] = pd.Categorical.from_codes(self.codes[key], self.categories[key])
+        for m in metrics or self.metrics:
+            out[m] = self.column(m)
+        return pd.DataFrame(out)
+
+
+def _categories(series, levels=None):
+    seen = [c for c in pd.unique(series.dropna())]
+    if levels is None:
+        return sorted(seen)
+    return list(levels) + [c for c in seen if c not in levels]
+
+
+@traced('reshape.cohort_store')
+@memoize('cohort_store')
+def cohort_store(long, metrics=None, conditions=CONDITION_ORDER):
+    #long table -> CohortStore; rows with a missing patient/condition/task are dropped
+    #(they belong to no cell). Tasks keep their order of appearance.
+    if metrics is None:
+        metrics = [c for c in long.columns if c not in KEYS.values()]
+    if 'Task' not in long.columns:
+        long = long.assign(Task='all')
+    categories = {
+        'patient': _categories(long['patient_num']),
+        'visit': [c for c in pd.unique(long['stringvisit'].dropna())],
+        'condition': _categories(long['Condition'], conditions),
+        'task': [c for c in pd.unique(long['Task'].dropna())],
+    }
+    codes = {k: pd.Categorical(long[KEYS[k]], categories=categories[k]).codes.astype(
+        _code_dtype(len(categories[k]))) for k in KEYS}
+    keep = np.ones(len(long), dtype=bool)
+    for k in INDEX:
+        keep &= codes[k] >= 0
+    order = np.lexsort([codes[k][keep] for k in reversed(INDEX)])
+    rows = np.flatnonzero(keep)[order]
+    codes = {k: np.ascontiguousarray(v[rows]) for k, v in codes.items()}
+    values = np.empty((len(metrics), len(rows)), dtype=np.float32)
+    for i, m in enumerate(metrics):
+        values[i] = long[m].to_numpy(dtype=np.float32, na_value=np.nan)[rows]
+    return CohortStore(categories, codes, metrics, values)
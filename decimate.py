@@ -0,0 +1,73 @@
+import matplotlib
+import numpy as np
+
+POINTS_PER_PIXEL = 2        # min and max of every pixel column
+RASTER_MIN_POINTS = 5000    # layers still denser than this are rasterized in vector output
+
+
+def minmax_decimate(x, y, n_bins):
+    #keep the min and max sample of every bin, in time order, plus both end points
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_bins < 1 or n <= 2 * n_bins:
+        return x, y
+    width = -(-n // n_bins)
+    n_bins = -(-n // width)
+    padded = np.full(n_bins * width, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_bins, width)
+    filled = ~np.isnan(blocks).all(axis=1)
+    blocks = blocks[filled]
+    base = np.flatnonzero(filled) * width
+    lo = base + np.nanargmin(blocks, axis=1)
+    hi = base + np.nanargmax(blocks, axis=1)
+    idx = np.unique(np.concatenate([[0, n - 1], lo, hi]))
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    #largest-triangle-three-buckets; the bucket loop is short (n_out), the area
+    #search inside each bucket is vectorized
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+    every = (n - 2) / (n_out - 2)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return x[out], y[out]
+
+
+def axis_bins(ax, dpi=None):
+    #pixel columns of the axis in the saved file: at savefig.dpi unless another dpi is
+    #given (the screen dpi only when savefig.dpi is 'figure')
+    if dpi is None:
+        dpi = matplotlib.rcParams['savefig.dpi']
+    if dpi == 'figure':
+        dpi = ax.figure.dpi
+    return max(int(ax.bbox.width / ax.figure.dpi * dpi), 1)
+
+
+def plot_trace(ax, x, y, *args, method='minmax', dpi=None, **kwargs):
+    #ax.plot for long traces: reduced to the axis pixel width, dense layers rasterized
+    x = np.asarray(x)
+    y = np.asarray(y)
+    bins = axis_bins(ax, dpi)
+    if method == 'lttb':
+        x, y = lttb(x, y, bins * POINTS_PER_PIXEL)
+    else:
+        x, y = minmax_decimate(x, y, bins)
+    kwargs.setdefault('rasterized', len(y) > RASTER_MIN_POINTS)
+    return ax.plot(x, y, *args, **kwargs)
@@ -0,0 +1,296 @@
+import collections
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import types
+
+#memoization for derived tables (long tables, pivots, axis limits, symptom tables):
+#results are keyed by the content of the arguments and the code that computes them,
+#kept in an in-memory LRU and a size-capped on-disk LRU under .cache/derived, so
+#re-running a figure after a styling change reuses every transformation.
+#Results are shared between callers: frames are handed out as copy-on-write copies and
+#arrays as read-only views, anything else must be treated as read-only.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('KADBS_CACHE', '.cache')
+MEMORY_ENTRIES = 256
+DISK_LIMIT_MB = float(os.environ.get('KADBS_DERIVED_MB', 256))
+ENABLED = os.environ.get('KADBS_DERIVED_CACHE', '1') != '0'
+FORMAT_VERSION = 2
+
+_memory = collections.OrderedDict()
+_counts = collections.defaultdict(lambda: {'memory': 0, 'disk': 0, 'miss': 0, 'uncacheable': 0})
+_disk = {'evictions': 0, 'bytes': None}
+
+
+class Uncacheable(TypeError):
+    pass
+
+
+def _frame_digest(df):
+    #hashed on every call (O(rows), ~20 ms per 100k rows): a frame can be changed in
+    #place after it was first seen, so nothing about its content is remembered by id
+    import pandas as pd
+    h = hashlib.sha1()
+    h.update(repr((list(map(str, df.columns)), [str(t) for t in df.dtypes])).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _update(h, obj):
+    import numpy as np
+    import pandas as pd
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+    elif isinstance(obj, pd.DataFrame):
+        h.update(b'df:' + _frame_digest(obj).encode())
+    elif isinstance(obj, (pd.Series, pd.Index)):
+        h.update(f'series:{obj.name!r}:{obj.dtype};'.encode())
+        h.update(pd.util.hash_pandas_object(obj, index=isinstance(obj, pd.Series)).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(f'nd:{obj.dtype}:{obj.shape};'.encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else repr(obj.tolist()).encode())
+    elif isinstance(obj, np.generic):
+        h.update(f'np:{obj.dtype}:{obj!r};'.encode())
+    elif isinstance(obj, dict):
+        h.update(f'dict:{len(obj)};'.encode())
+        for k in sorted(obj, key=repr):
+            _update(h, k)
+            _update(h, obj[k])
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = sorted(obj, key=repr) if isinstance(obj, (set, frozenset)) else obj
+        h.update(f'{type(obj).__name__}:{len(obj)};'.encode())
+        for v in items:
+            _update(h, v)
+    elif isinstance(getattr(obj, 'content_digest', None), str):
+        #objects that hash their own content once, e.g. cohort.CohortStore
+        h.update(f'{type(obj).__name__}:{obj.content_digest};'.encode())
+    else:
+        raise Uncacheable(type(obj).__name__)
+
+
+def _own(obj, fn):
+    #functions and classes of this project (not numpy/pandas/...), the code a
+    #transformation can change along with
+    if obj.__module__ == fn.__module__:
+        return True
+    path = getattr(inspect.getmodule(obj), '__file__', None)
+    return bool(path) and os.path.dirname(os.path.abspath(path)) == ROOT
+
+
+def _code_digest(fn, h, seen):
+    #bytecode of fn, plus the project functions, classes and constants it refers to, so
+    #editing a transformation invalidates its entries and editing styling does not
+    fn = inspect.unwrap(fn)
+    if fn in seen:
+        return
+    seen.add(fn)
+    if inspect.isclass(fn):
+        h.update(f'class:{fn.__module__}.{fn.__qualname__};'.encode())
+        for base in fn.__bases__:
+            if _own(base, fn):
+                _code_digest(base, h, seen)
+        for name, attr in sorted(vars(fn).items()):
+            if isinstance(attr, (staticmethod, classmethod)):
+                attr = attr.__func__
+            elif isinstance(attr, property):
+                attr = attr.fget
+            if inspect.isfunction(attr):
+                _code_digest(attr, h, seen)
+            elif not callable(attr) and not name.startswith('__'):
+                try:
+                    h.update(name.encode())
+                    _update(h, attr)
+                except Uncacheable:
+                    pass
+        return
+    h.update(fn.__qualname__.encode())
+    names = set()
+    todo = [fn.__code__]
+    while todo:
+        code = todo.pop()
+        h.update(code.co_code)
+        names.update(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                todo.append(const)
+            else:
+                h.update(repr(const).encode())
+    defaults = (fn.__defaults__, fn.__kwdefaults__)
+    try:
+        _update(h, defaults)
+    except Uncacheable:
+        h.update(repr(defaults).encode())
+    for name in sorted(names):
+        obj = fn.__globals__.get(name)
+        if (inspect.isfunction(obj) or inspect.isclass(obj)) and _own(obj, fn):
+            _code_digest(obj, h, seen)
+        elif not callable(obj) and not isinstance(obj, types.ModuleType):
+            try:
+                h.update(name.encode())
+                _update(h, obj)
+            except Uncacheable:
+                pass
+
+
+def _shared(value):
+    #what a caller gets back: writes to it must not reach the cached value
+    import numpy as np
+    import pandas as pd
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, tuple):
+        return tuple(_shared(v) for v in value)
+    return value
+
+
+def _disk_dir():
+    return os.path.join(os.environ.get('KADBS_CACHE', CACHE_DIR), 'derived')
+
+
+def _disk_entries():
+    try:
+        return [e for e in os.scandir(_disk_dir()) if e.name.endswith('.pkl')]
+    except FileNotFoundError:
+        return []
+
+
+def _evict(limit_bytes):
+    #least recently used files first (hits touch the mtime)
+    if _disk['bytes'] is None:
+        _disk['bytes'] = sum(e.stat().st_size for e in _disk_entries())
+    if _disk['bytes'] <= limit_bytes:
+        return
+    entries = sorted(_disk_entries(), key=lambda e: e.stat().st_mtime_ns)
+    total = sum(e.stat().st_size for e in entries)
+    for e in entries:
+        if total <= limit_bytes:
+            break
+        try:
+            size = e.stat().st_size
+            os.remove(e.path)
+        except OSError:
+            continue
+        total -= size
+        _disk['evictions'] += 1
+    _disk['bytes'] = total
+
+
+def _disk_get(key):
+    path = os.path.join(_disk_dir(), key + '.pkl')
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        os.utime(path)
+        return True, value
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return False, None
+
+
+def _disk_put(key, value):
+    limit = DISK_LIMIT_MB * 1e6
+    try:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return
+    if len(payload) > limit:
+        return
+    os.makedirs(_disk_dir(), exist_ok=True)
+    path = os.path.join(_disk_dir(), key + '.pkl')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+    if _disk['bytes'] is not None:
+        _disk['bytes'] += len(payload)
+    _evict(limit)
+
+
+def _memory_put(key, value):
+    _memory[key] = value
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def memoize(name=None, disk=True):
+    #@memoize() / @memoize('tbc_long', disk=False); arguments that cannot be hashed by
+    #content (figures, axes, open files) make the call run uncached
+    def wrap(fn):
+        label = name or f'{fn.__module__}.{fn.__qualname__}'
+        signature = inspect.signature(fn)
+        code = []
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            if not code:
+                h = hashlib.sha1(f'{FORMAT_VERSION}:{label}'.encode())
+                _code_digest(fn, h, set())
+                code.append(h.hexdigest())
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            h = hashlib.sha1(code[0].encode())
+            try:
+                _update(h, dict(bound.arguments))
+            except Uncacheable:
+                _counts[label]['uncacheable'] += 1
+                return fn(*args, **kwargs)
+            key = h.hexdigest()
+            if key in _memory:
+                _memory.move_to_end(key)
+                _counts[label]['memory'] += 1
+                return _shared(_memory[key])
+            if disk:
+                found, value = _disk_get(key)
+                if found:
+                    _counts[label]['disk'] += 1
+                    _memory_put(key, value)
+                    return _shared(value)
+            _counts[label]['miss'] += 1
+            value = fn(*args, **kwargs)
+            _memory_put(key, value)
+            if disk:
+                _disk_put(key, value)
+            return _shared(value)
+        return inner
+    return wrap
+
+
+def stats():
+    #{function: {'memory': hits, 'disk': hits, 'miss': n, 'uncacheable': n}} plus totals
+    out = {k: dict(v) for k, v in _counts.items()}
+    out['_total'] = {k: sum(v[k] for v in _counts.values())
+                     for k in ('memory', 'disk', 'miss', 'uncacheable')}
+    out['_store'] = {'memory_entries': len(_memory), 'disk_evictions': _disk['evictions'],
+                     'disk_mb': sum(e.stat().st_size for e in _disk_entries()) / 1e6}
+    return out
+
+
+def clear(memory=True, disk=True):
+    if memory:
+        _memory.clear()
+    if disk:
+        for e in _disk_entries():
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+        _disk['bytes'] = None
+
+
+if __name__ == '__main__':
+    #python derived_cache.py [clear]
+    import sys
+    if sys.argv[1:] == ['clear']:
+        clear()
+    entries = _disk_entries()
+    print(f'{_disk_dir()}: {len(entries)} entries, '
+          f'{sum(e.stat().st_size for e in entries) / 1e6:.1f} MB (limit {DISK_LIMIT_MB:g} MB)')
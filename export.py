@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+#KADBS_HEADLESS=1 (set by build.py) renders on Agg and never blocks on plt.show()
+if os.environ.get('KADBS_HEADLESS'):
+    matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(__file__))
+from instrument import traced
+
+OUT_DIR = 'figures'
+NON_INTERACTIVE = {'agg', 'pdf', 'svg', 'ps', 'cairo', 'pgf', 'template'}
+
+_FIGURE = None
+
+
+def headless():
+    return bool(os.environ.get('KADBS_HEADLESS')) or plt.get_backend().lower() in NON_INTERACTIVE
+
+
+def _env_formats(formats):
+    env = os.environ.get('KADBS_FORMATS')
+    return tuple(f.strip() for f in env.split(',') if f.strip()) if env else tuple(formats)
+
+
+def export_dpi(dpi=900):
+    #dpi export_figure writes at for a script default; KADBS_DPI overrides it
+    env = os.environ.get('KADBS_DPI')
+    return float(env) if env else dpi
+
+
+def _save_one(args):
+    fmt, path, dpi, kwargs, payload = args
+    fig = _FIGURE if payload is None else pickle.loads(payload)
+    start = time.perf_counter()
+    fig.savefig(path, format=fmt, dpi=dpi, **kwargs)
+    return fmt, time.perf_counter() - start
+
+
+@traced('export')
+def export_figure(fig, name, formats=('png', 'pdf', 'svg'), dpi=900, out_dir=None,
+                  workers=None, verbose=True, **savefig_kwargs):
+    #write every format of one figure, one worker process per format when headless;
+    #KADBS_FORMATS / KADBS_DPI override the script defaults per build target
+    global _FIGURE
+    formats = _env_formats(formats)
+    dpi = export_dpi(dpi)
+    out_dir = out_dir or os.environ.get('KADBS_OUT', OUT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {fmt: os.path.join(out_dir, f'{name}.{fmt}') for fmt in formats}
+
+    workers = min(workers or len(formats), len(formats))
+    start = time.perf_counter()
+    _FIGURE = fig
+    if workers <= 1 or not headless():
+        timings = dict(_save_one((fmt, paths[fmt], dpi, savefig_kwargs, None))
+                       for fmt in formats)
+    else:
+        #forked workers share the finished figure; other start methods get a pickle
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        payload = None if method == 'fork' else pickle.dumps(fig)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context(method)) as pool:
+            timings = dict(pool.map(_save_one, [(fmt, paths[fmt], dpi, savefig_kwargs, payload)
+                                                for fmt in formats]))
+    _FIGURE = None
+    total = time.perf_counter() - start
+    if verbose:
+        for fmt in formats:
+            print(f'saved {paths[fmt]} ({timings[fmt]:.2f}s)')
+        print(f'exported {name} in {total:.2f}s')
+    return timings
+
+
+def show():
+    if headless():
+        plt.close('all')
+    else:
+        plt.show()
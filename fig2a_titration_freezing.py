@@ -6,12 +6,18 @@ import sys
 
 sys.path.insert(0, os.path.dirname(__file__))
 from plot_config import setup_style
+from ingest import data_path
+from export import export_figure, show
+from titration import therapeutic_windows
+from instrument import span
 
 setup_style()
 
 #load titration data
-df = pd.read_csv('data/titrations_Output_Bertec.csv')
-df = df.sort_values('Stim Level')
+with span('load', source='titrations_Output_Bertec.csv'):
+    df = pd.read_csv(data_path('titrations_Output_Bertec.csv'))
+    df = df.sort_values('Stim Level')
+    window = therapeutic_windows(df.assign(titration='Bertec')).iloc[0]
 
 stim_levels = df['Stim Level'].tolist()
 freezing = df['freezes'].tolist()
@@ -20,10 +26,12 @@ fig, ax = plt.subplots(figsize=(3.65, 3.5))
 fig.patch.set_alpha(0.0)
 ax.patch.set_alpha(0.0)
 
-#therapeutic window shading
-green_start = stim_levels.index(75)
-green_end = stim_levels.index(100)
-ax.axvspan(green_start, green_end, alpha=1, color='#BAC095')
+#therapeutic window shading, from the fitted dose-response (tick positions are categorical)
+#(no window when the fitted curve rises with stimulation)
+if window['decreasing']:
+    green_start = np.interp(window['window_low'], stim_levels, range(len(stim_levels)))
+    green_end = np.interp(window['window_high'], stim_levels, range(len(stim_levels)))
+    ax.axvspan(green_start, green_end, alpha=1, color='#BAC095')
 
 ax.plot(range(len(stim_levels)), freezing, 'k-', linewidth=2.5)
 ax.scatter(range(len(stim_levels)), freezing, s=100, color='black', zorder=5)
@@ -38,8 +46,8 @@ ax.tick_params(axis='both', labelsize=12, width=0.5, length=5, direction='out')
 ax.spines['right'].set_visible(False)
 ax.spines['top'].set_visible(False)
 
-plt.tight_layout()
-os.makedirs('figures', exist_ok=True)
-for ext in ['png', 'pdf', 'svg']:
-    plt.savefig(f'figures/fig2a_titration_freezing.{ext}', dpi=900, transparent=True)
-plt.show()
\ No newline at end of file
+with span('layout'):
+    plt.tight_layout()
+export_figure(fig, 'fig2a_titration_freezing', formats=('png', 'pdf', 'svg'), dpi=900,
+              transparent=True)
+show()
\ No newline at end of file
@@ -6,30 +6,36 @@ import sys
 
 sys.path.insert(0, os.path.dirname(__file__))
 from plot_config import setup_style
+from ingest import data_path
+from export import export_dpi, export_figure, show
+from decimate import plot_trace
+from kinstore import open_store
+from instrument import span
 
 setup_style()
+DPI = export_dpi(900)   # traces are decimated to the pixel columns of the exported figure
 
-data_dir = 'data/titrations'
+data_dir = data_path('titrations')
 
-#load shank velocity data
+#load the first 15 s of shank velocity data (memory-mapped, only those pages are read)
 stim_levels = [0, 50, 75, 90, 100]
 shank_data = []
-for level in stim_levels:
-    df = pd.read_csv(os.path.join(data_dir, f'shankav_{level}.csv'))
-    df['Time'] = df['Time'] - df['Time'].iloc[0]
-    df = df[df['Time'] <= 15]
-    shank_data.append(df)
+with span('load', source='shankav_*.csv'):
+    for level in stim_levels:
+        t, ch = open_store(os.path.join(data_dir, f'shankav_{level}.csv')).head(15, ['RZAV', 'LZAV'])
+        shank_data.append(pd.DataFrame({'Time': t - t[0], **ch}, copy=False))
 
 #global y limits across all traces
 y_min = int(np.floor(min(d[['RZAV','LZAV']].min().min() for d in shank_data)))
 y_max = int(np.ceil(max(d[['RZAV','LZAV']].max().max() for d in shank_data)))
 
 #load arrhythmicity data
-arr = pd.read_csv(os.path.join(data_dir, 'arr_table.csv'))
-arr['Time'] = pd.to_datetime(arr['Time'])
-t0 = arr['Time'].iloc[0]
-arr['Seconds'] = [(t - t0).total_seconds() for t in arr['Time']]
-arr['Arrhythmicity'] = arr['Arrhythmicity'] * 100
+with span('load', source='arr_table.csv'):
+    arr = pd.read_csv(os.path.join(data_dir, 'arr_table.csv'))
+    arr['Time'] = pd.to_datetime(arr['Time'])
+    t0 = arr['Time'].iloc[0]
+    arr['Seconds'] = (arr['Time'] - t0).dt.total_seconds()
+    arr['Arrhythmicity'] = arr['Arrhythmicity'] * 100
 
 fig = plt.figure(figsize=(7.3, 3.5))
 gs = plt.GridSpec(5, 2, width_ratios=[1, 1], height_ratios=[1]*5, hspace=0.5)
@@ -38,8 +44,8 @@ gs = plt.GridSpec(5, 2, width_ratios=[1, 1], height_ratios=[1]*5, hspace=0.5)
 for i, (level, df) in enumerate(zip(stim_levels, shank_data)):
     ax = fig.add_subplot(gs[i, 0])
 
-    ax.plot(df['Time'], df['RZAV'], color='blue', linewidth=1.5)
-    ax.plot(df['Time'], df['LZAV'], color='red', linewidth=1.5)
+    plot_trace(ax, df['Time'], df['RZAV'], color='blue', linewidth=1.5, dpi=DPI)
+    plot_trace(ax, df['Time'], df['LZAV'], color='red', linewidth=1.5, dpi=DPI)
     ax.axhline(0, color='k', linewidth=0.5, alpha=0.5)
 
     ax.set_ylim(y_min, y_max)
@@ -59,7 +65,7 @@ for i, (level, df) in enumerate(zip(stim_levels, shank_data)):
 
 #right panel: arrhythmicity over time
 ax_arr = fig.add_subplot(gs[:, 1])
-ax_arr.plot(arr['Seconds'], arr['Arrhythmicity'], 'k-', linewidth=0.8)
+plot_trace(ax_arr, arr['Seconds'], arr['Arrhythmicity'], 'k-', linewidth=0.8, dpi=DPI)
 
 max_sec = arr['Seconds'].max()
 ax_arr.set_xlim(0, max_sec)
@@ -74,10 +80,10 @@ ax_arr.spines['right'].set_visible(False)
 ax_arr.spines['top'].set_visible(False)
 ax_arr.tick_params(axis='both', labelsize=8, direction='out')
 
-plt.tight_layout()
-fig.subplots_adjust(wspace=0.3, hspace=0.5)
+with span('layout'):
+    plt.tight_layout()
+    fig.subplots_adjust(wspace=0.3, hspace=0.5)
 
-os.makedirs('figures', exist_ok=True)
-for ext in ['png', 'svg']:
-    plt.savefig(f'figures/fig2b_arrhythmicity_threshold.{ext}', dpi=900, bbox_inches='tight')
-plt.show()
\ No newline at end of file
+export_figure(fig, 'fig2b_arrhythmicity_threshold', formats=('png', 'svg'), dpi=DPI,
+              bbox_inches='tight')
+show()
\ No newline at end of file
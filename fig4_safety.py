@@ -1,18 +1,17 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib import rcParams
+from plot_config import setup_style
+from ingest import data_path, load_table
+from export import export_figure, show
+from safety import tabulate_symptoms, cohort_percentages, cohort_counts
+from instrument import span
 
-plt.style.use('default')
-rcParams['font.sans-serif'] = ['Arial']
-rcParams['font.family'] = 'sans-serif'
-rcParams['pdf.fonttype'] = 42
-rcParams['ps.fonttype'] = 42
-rcParams['font.size'] = 12
-rcParams['axes.linewidth'] = 0.5
+setup_style('safety')
 
-data_sip = pd.read_excel('data/KaDBS_I_SIP.xlsx')
-data_tbc = pd.read_excel('data/KaDBS_I_TBC.xlsx')
+with span('load', source='KaDBS_I_SIP.xlsx, KaDBS_I_TBC.xlsx'):
+    data_sip = load_table(data_path('KaDBS_I_SIP.xlsx'))
+    data_tbc = load_table(data_path('KaDBS_I_TBC.xlsx'))
 
 sip_pids = [1, 2, 3, 4, 6, 9, 10, 11]
 tbc_pids = [1, 2, 3, 4, 9, 10, 11]
@@ -21,16 +20,6 @@ kadbs_sip_event = 'set_a_kadbsi__140h_arm_6'
 kadbs_tbc_event = 'set_a_kadbsi__140h_arm_7'
 cdbs_sip_event = 'set_a_oldbs140_hz_arm_6'
 
-symptom_mapping = {
-    'did_have_any_feelings_of_Nausea': 'Nausea',
-    'did_have_any_feelings_of_Pulling': 'Pulling',
-    'did_have_any_feelings_of_Tingling': 'Tingling',
-    'did_have_any_feelings_of_Dizziness': 'Dizziness',
-    'did_have_any_feelings_of_Imbalance': 'Imbalance',
-    'did_have_any_feelings_of_Other': 'Other',
-    'did_have_any_feelings_of_Noneoftheabove': 'None'
-}
-
 colors = {
     "None": "#BDD9BF",
     "Imbalance": "#F39B53",
@@ -42,55 +31,20 @@ colors = {
 }
 
 
-def filter_data(data, pids, event_name):
-    filtered_list = []
-    for pid in pids:
-        subset = data[(data['patientid'] == pid) & (data['redcap_event_name'] == event_name)]
-        if len(subset) > 0:
-            filtered_list.append(subset)
-    if filtered_list:
-        return pd.concat(filtered_list)
-    return pd.DataFrame()
-
-
-def calculate_percentages_by_occurrence(filtered_data):
-    if len(filtered_data) == 0:
-        return {label: 0.0 for label in symptom_mapping.values()}, {}
-
-    counts = {}
-    for col, label in symptom_mapping.items():
-        if col in filtered_data.columns:
-            counts[label] = int(filtered_data[col].sum())
-        else:
-            counts[label] = 0
-
-    total = sum(counts.values())
-    percentages = {}
-    for label, count in counts.items():
-        percentages[label] = (count / total) * 100 if total > 0 else 0.0
-
-    return percentages, counts
-
-
-def calculate_participant_counts(filtered_data):
-    n_total = len(filtered_data)
-    none_col = 'did_have_any_feelings_of_Noneoftheabove'
-    n_none = int(filtered_data[none_col].sum()) if none_col in filtered_data.columns else 0
-    n_any = n_total - n_none
-    return n_total, n_none, n_any
-
-
-filtered_arr = filter_data(data_sip, sip_pids, kadbs_sip_event)
-filtered_fog = filter_data(data_tbc, tbc_pids, kadbs_tbc_event)
-filtered_cdbs = filter_data(data_sip, sip_pids, cdbs_sip_event)
+cohorts = {
+    'arr': ('SIP', kadbs_sip_event, sip_pids),
+    'fog': ('TBC', kadbs_tbc_event, tbc_pids),
+    'cdbs': ('SIP', cdbs_sip_event, sip_pids),
+}
+symptom_table = tabulate_symptoms({'SIP': data_sip, 'TBC': data_tbc}, cohorts)
 
-arr_pct, arr_counts = calculate_percentages_by_occurrence(filtered_arr)
-fog_pct, fog_counts = calculate_percentages_by_occurrence(filtered_fog)
-cdbs_pct, cdbs_counts = calculate_percentages_by_occurrence(filtered_cdbs)
+arr_pct = cohort_percentages(symptom_table, 'arr')
+fog_pct = cohort_percentages(symptom_table, 'fog')
+cdbs_pct = cohort_percentages(symptom_table, 'cdbs')
 
-arr_n, arr_none, _ = calculate_participant_counts(filtered_arr)
-fog_n, fog_none, _ = calculate_participant_counts(filtered_fog)
-cdbs_n, cdbs_none, _ = calculate_participant_counts(filtered_cdbs)
+arr_n, arr_none, _ = cohort_counts(symptom_table, 'arr')
+fog_n, fog_none, _ = cohort_counts(symptom_table, 'fog')
+cdbs_n, cdbs_none, _ = cohort_counts(symptom_table, 'cdbs')
 
 print(f"Arrhythmicity Model: {arr_none}/{arr_n} ({100*arr_none/arr_n:.1f}%) symptom-free")
 print(f"P(FOG) Model: {fog_none}/{fog_n} ({100*fog_none/fog_n:.1f}%) symptom-free")
@@ -131,9 +85,10 @@ def create_donut(ax, data, title):
 fig, axes = plt.subplots(1, 3, figsize=(7.3, 3.2), gridspec_kw={'wspace': 0.05})
 plt.tight_layout(rect=[0, 0.1, 1, 0.95])
 
-create_donut(axes[0], arr_pct, "Arrhythmicity Model")
-create_donut(axes[1], fog_pct, "P(FOG) Model")
-create_donut(axes[2], cdbs_pct, "Clinical cDBS")
+with span('plot.donuts'):
+    create_donut(axes[0], arr_pct, "Arrhythmicity Model")
+    create_donut(axes[1], fog_pct, "P(FOG) Model")
+    create_donut(axes[2], cdbs_pct, "Clinical cDBS")
 
 all_symptoms = set()
 for d in [arr_pct, fog_pct, cdbs_pct]:
@@ -152,9 +107,9 @@ fig.legend(legend_elements, legend_order, loc='lower center',
            bbox_to_anchor=(0.5, 0.1), handlelength=1.0,
            handletextpad=0.4, columnspacing=1.0, fontsize=12)
 
-plt.tight_layout(rect=[0, 0.12, 1, 1])
+with span('layout'):
+    plt.tight_layout(rect=[0, 0.12, 1, 1])
 
-fig.savefig('figures/fig4_safety.png', dpi=900, bbox_inches='tight')
-fig.savefig('figures/fig4_safety.pdf', dpi=900, bbox_inches='tight')
-fig.savefig('figures/fig4_safety.svg', dpi=900, bbox_inches='tight')
-plt.show()
\ No newline at end of file
+export_figure(fig, 'fig4_safety', formats=('png', 'pdf', 'svg'), dpi=900,
+              bbox_inches='tight')
+show()
\ No newline at end of file
@@ -6,47 +6,28 @@ import warnings
 from matplotlib.lines import Line2D
 from matplotlib.patches import Patch
 from plot_config import *
+from ingest import data_path, load_table
+from export import export_figure, show
+from harmonize import tbc_long
+from cohort import cohort_store
+from instrument import span
+
+setup_style()
 
 warnings.filterwarnings('ignore', category=UserWarning)
 
-raw_data = pd.read_csv('data/MergedTBCMetrics.csv')
-raw_filtered = raw_data[raw_data['stringvisit'].isin(EVENT_MAP.keys())].copy()
-
-rows = []
-for _, row in raw_filtered.iterrows():
-    patient = row['patient_num']
-    condition = row['stringvisit']
-
-    rows.append({
-        'patient_num': patient,
-        'stringvisit': condition,
-        'Task': 'Ellipses',
-        'mean_freezing': row.get('Emean_freezing', np.nan),
-        'arrhythmicity_scaled': row.get('Earrhythmicity_new', np.nan) * 100
-            if pd.notna(row.get('Earrhythmicity_new', np.nan)) else np.nan,
-        'mean_shankav': row.get('Emean_shankav', np.nan)
-    })
-
-    rows.append({
-        'patient_num': patient,
-        'stringvisit': condition,
-        'Task': 'Figure8',
-        'mean_freezing': row.get('eigmean_freezing', np.nan),
-        'arrhythmicity_scaled': row.get('eigarrhythmicity_new', np.nan) * 100
-            if pd.notna(row.get('eigarrhythmicity_new', np.nan)) else np.nan,
-        'mean_shankav': row.get('eigmean_shankav', np.nan)
-    })
-
-filtered = pd.DataFrame(rows)
-filtered['Condition'] = filtered['stringvisit'].map(EVENT_MAP)
+with span('load', source='MergedTBCMetrics.csv'):
+    raw_data = load_table(data_path('MergedTBCMetrics.csv'))
+    filtered = tbc_long(raw_data)
+    cohort = cohort_store(filtered)
 
 freezers = ['RCS02', 'RCS03', 'RCS09', 'RCS11']
 nonfreezer = ['RCS01', 'RCS04', 'RCS10']
 available = sorted(filtered['patient_num'].unique())
 
-vel_lim = get_axis_limits(filtered, 'mean_shankav')
-arrh_f_lim = get_axis_limits(filtered, 'arrhythmicity_scaled', freezers)
-arrh_nf_lim = get_axis_limits(filtered, 'arrhythmicity_scaled', nonfreezer)
+vel_lim = get_axis_limits(cohort, 'mean_shankav')
+arrh_f_lim = get_axis_limits(cohort, 'arrhythmicity_scaled', freezers)
+arrh_nf_lim = get_axis_limits(cohort, 'arrhythmicity_scaled', nonfreezer)
 
 fig = plt.figure(figsize=(7.3, 7.2), dpi=600)
 fig.patch.set_alpha(0.0)
@@ -56,17 +37,18 @@ gs = fig.add_gridspec(4, 2, hspace=0.4, wspace=0.3, height_ratios=[1, 1, 1, 0.35
 # A: % time freezing boxplot (both tasks)
 ax_a = fig.add_subplot(gs[0, 0])
 style_axis(ax_a)
-sns.boxplot(data=filtered, x='Condition', y='mean_freezing',
-            order=CONDITION_ORDER, palette=CONDITION_COLORS,
-            width=0.6, ax=ax_a, flierprops={'marker': 'none'},
-            boxprops={'alpha': 0.8, 'linewidth': 1.0},
-            whiskerprops={'linewidth': 1.0}, capprops={'linewidth': 1.0},
-            medianprops={'linewidth': 1.5, 'color': 'white'},
-            hue='Condition', legend=False)
-sns.stripplot(data=filtered, x='Condition', y='mean_freezing',
-              order=CONDITION_ORDER, color='#2C2C2C', size=5, alpha=0.7,
-              jitter=0.25, ax=ax_a, marker='o',
-              edgecolor='white', linewidth=0.5)
+with span('plot.boxplot', metric='mean_freezing'):
+    sns.boxplot(data=filtered, x='Condition', y='mean_freezing',
+                order=CONDITION_ORDER, palette=CONDITION_COLORS,
+                width=0.6, ax=ax_a, flierprops={'marker': 'none'},
+                boxprops={'alpha': 0.8, 'linewidth': 1.0},
+                whiskerprops={'linewidth': 1.0}, capprops={'linewidth': 1.0},
+                medianprops={'linewidth': 1.5, 'color': 'white'},
+                hue='Condition', legend=False)
+    sns.stripplot(data=filtered, x='Condition', y='mean_freezing',
+                  order=CONDITION_ORDER, color='#2C2C2C', size=5, alpha=0.7,
+                  jitter=0.25, ax=ax_a, marker='o',
+                  edgecolor='white', linewidth=0.5)
 ax_a.set_xticks(range(len(CONDITION_ORDER)))
 ax_a.set_xticklabels(CONDITION_ORDER, fontsize=9)
 set_zero_padded_ticks(ax_a, 100)
@@ -76,25 +58,25 @@ ax_a.set_xlabel('')
 # B: freezer trajectories (averaged across tasks)
 ax_b = fig.add_subplot(gs[0, 1])
 style_axis(ax_b)
-traj_freeze = filtered.groupby(['patient_num', 'Condition'])['mean_freezing'].mean().reset_index()
-plot_trajectories(ax_b, traj_freeze, freezers, 'mean_freezing')
+plot_trajectories(ax_b, cohort, freezers, 'mean_freezing', agg='mean')
 set_zero_padded_ticks(ax_b, 100)
 ax_b.set_ylabel('% Time Freezing\n(Baseline Freezers)', fontsize=11)
 
 # C: angular velocity boxplot
 ax_c = fig.add_subplot(gs[1, 0])
 style_axis(ax_c)
-sns.boxplot(data=filtered, x='Condition', y='mean_shankav',
-            order=CONDITION_ORDER, palette=CONDITION_COLORS,
-            width=0.6, ax=ax_c, flierprops={'marker': 'none'},
-            boxprops={'alpha': 0.8, 'linewidth': 1.0},
-            whiskerprops={'linewidth': 1.0}, capprops={'linewidth': 1.0},
-            medianprops={'linewidth': 1.5, 'color': 'white'},
-            hue='Condition', legend=False)
-sns.stripplot(data=filtered, x='Condition', y='mean_shankav',
-              order=CONDITION_ORDER, color='#2C2C2C', size=5, alpha=0.7,
-              jitter=0.25, ax=ax_c, marker='o',
-              edgecolor='white', linewidth=0.5)
+with span('plot.boxplot', metric='mean_shankav'):
+    sns.boxplot(data=filtered, x='Condition', y='mean_shankav',
+                order=CONDITION_ORDER, palette=CONDITION_COLORS,
+                width=0.6, ax=ax_c, flierprops={'marker': 'none'},
+                boxprops={'alpha': 0.8, 'linewidth': 1.0},
+                whiskerprops={'linewidth': 1.0}, capprops={'linewidth': 1.0},
+                medianprops={'linewidth': 1.5, 'color': 'white'},
+                hue='Condition', legend=False)
+    sns.stripplot(data=filtered, x='Condition', y='mean_shankav',
+                  order=CONDITION_ORDER, color='#2C2C2C', size=5, alpha=0.7,
+                  jitter=0.25, ax=ax_c, marker='o',
+                  edgecolor='white', linewidth=0.5)
 ax_c.set_xticks(range(len(CONDITION_ORDER)))
 ax_c.set_xticklabels(CONDITION_ORDER, fontsize=9)
 set_nice_ticks(ax_c, vel_lim[0], vel_lim[1])
@@ -104,24 +86,23 @@ ax_c.set_xlabel('')
 # D: velocity trajectories (freezers & non-freezers)
 ax_d = fig.add_subplot(gs[1, 1])
 style_axis(ax_d)
-traj_vel = filtered.groupby(['patient_num', 'Condition'])['mean_shankav'].mean().reset_index()
-plot_trajectories(ax_d, traj_vel, freezers, 'mean_shankav', marker='o', ls='-')
-plot_trajectories(ax_d, traj_vel, nonfreezer, 'mean_shankav', marker='^', ls='--')
+plot_trajectories(ax_d, cohort, freezers, 'mean_shankav', marker='o', ls='-', agg='mean')
+plot_trajectories(ax_d, cohort, nonfreezer, 'mean_shankav', marker='^', ls='--', agg='mean')
 set_nice_ticks(ax_d, vel_lim[0], vel_lim[1])
 ax_d.set_ylabel('Mean Angular Velocity\n(deg/s)', fontsize=11)
 
 # E: arrhythmicity (freezers)
 ax_e = fig.add_subplot(gs[2, 0])
 style_axis(ax_e)
-traj_arrh = filtered.groupby(['patient_num', 'Condition'])['arrhythmicity_scaled'].mean().reset_index()
-plot_trajectories(ax_e, traj_arrh, freezers, 'arrhythmicity_scaled')
+plot_trajectories(ax_e, cohort, freezers, 'arrhythmicity_scaled', agg='mean')
 set_nice_ticks(ax_e, arrh_f_lim[0], arrh_f_lim[1])
 ax_e.set_ylabel('Arrhythmicity\n(Freezers)', fontsize=11)
 
 # F: arrhythmicity (non-freezers)
 ax_f = fig.add_subplot(gs[2, 1])
 style_axis(ax_f)
-plot_trajectories(ax_f, traj_arrh, nonfreezer, 'arrhythmicity_scaled', marker='^', ls='--')
+plot_trajectories(ax_f, cohort, nonfreezer, 'arrhythmicity_scaled', marker='^', ls='--',
+                  agg='mean')
 set_nice_ticks(ax_f, arrh_nf_lim[0], arrh_nf_lim[1])
 ax_f.set_ylabel('Arrhythmicity\n(Non-Freezers)', fontsize=11)
 
@@ -155,8 +136,9 @@ ax_leg.legend(handles=handles, loc='center',
 
 all_axes = [ax_a, ax_b, ax_c, ax_d, ax_e, ax_f]
 finalize_axes(all_axes)
-plt.tight_layout(pad=1.2)
+with span('layout'):
+    plt.tight_layout(pad=1.2)
 
-fig.savefig('figures/fig6_tbc_gait.svg', format='svg', dpi=900,
-            bbox_inches='tight', transparent=True)
-plt.show()
\ No newline at end of file
+export_figure(fig, 'fig6_tbc_gait', formats=('svg',), dpi=900,
+              bbox_inches='tight', transparent=True)
+show()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+#freezing of gait from shank angular velocity: per-window freeze index (freeze band power
+#over locomotor band power) and amplitude collapse against the trial's own walking,
+#combined into P(FOG); windows of every trial and both legs go through one batched rfft
+
+WINDOW_S = 4.0              # s per analysis window
+STEP_S = 0.5                # s between window starts
+LOCO_BAND = (0.5, 3.0)      # Hz
+FREEZE_BAND = (3.0, 8.0)    # Hz
+POWER_FLOOR = 200.0         # (deg/s)^2 in both bands together, below this the leg is still
+FI_THRESHOLD = 2.0          # freeze index at which the band-ratio term is neutral
+FI_GAIN = 3.0               # per unit of log freeze index
+AMP_COLLAPSE = 0.5          # window RMS / walking RMS at which the amplitude term is neutral
+AMP_GAIN = 4.0
+P_THRESHOLD = 0.5           # windows with P(FOG) at or above this count as freezing
+CHUNK_WINDOWS = 16384       # windows per rfft batch
+
+LEGS = {'R': 'RZAV', 'L': 'LZAV'}
+
+
+def _sample_rate(t):
+    return 1.0 / np.median(np.diff(t))
+
+
+def band_features(frames, fs, bands=(LOCO_BAND, FREEZE_BAND)):
+    #frames: (windows, n); band powers in signal variance units and window RMS
+    n = frames.shape[1]
+    taper = np.hanning(n).astype(np.float32)
+    x = frames - frames.mean(axis=1, keepdims=True)
+    rms = np.sqrt((x * x).mean(axis=1))
+    spec = np.abs(np.fft.rfft(x * taper, axis=1)) ** 2
+    spec *= 2.0 / (n * float((taper * taper).sum()))
+    freqs = np.fft.rfftfreq(n, 1.0 / fs)
+    masks = np.array([(freqs >= lo) & (freqs < hi) for lo, hi in bands], dtype=spec.dtype)
+    return spec @ masks.T, rms
+
+
+def fog_probability(freeze_index, collapse, total_power):
+    z = (FI_GAIN * np.log(np.maximum(freeze_index, 1e-12) / FI_THRESHOLD)
+         + AMP_GAIN * (AMP_COLLAPSE - collapse))
+    p = 1.0 / (1.0 + np.exp(-z))
+    return np.where(total_power < POWER_FLOOR, 0.0, p)
+
+
+def _load(rec):
+    return pd.read_csv(rec) if isinstance(rec, (str, os.PathLike)) else rec
+
+
+def fog_windows(recordings, time_col='Time', legs=LEGS, window_s=WINDOW_S, step_s=STEP_S):
+    #recordings: mapping of key -> DataFrame (or csv path) with Time/RZAV/LZAV columns;
+    #all recordings at one sample rate share the same window length and rfft batches
+    groups = {}
+    for key, rec in recordings.items():
+        df = _load(rec)
+        t = df[time_col].to_numpy(dtype=np.float64)
+        if len(t) < 2:
+            continue
+        fs = round(_sample_rate(t), 3)
+        groups.setdefault(fs, []).append((key, t, df))
+
+    tables = []
+    for fs, recs in groups.items():
+        n = int(round(window_s * fs))
+        step = max(int(round(step_s * fs)), 1)
+        #one flat signal per leg, window starts indexed into it across recordings
+        offsets, starts, keys, centers = 0, [], [], []
+        flats = {leg: [] for leg in legs}
+        for key, t, df in recs:
+            m = len(t)
+            for leg, col in legs.items():
+                flats[leg].append(df[col].to_numpy(dtype=np.float32))
+            if m >= n:
+                s = np.arange(0, m - n + 1, step)
+                starts.append(offsets + s)
+                keys.append(np.full(len(s), key, dtype=object))
+                centers.append(t[s + n // 2])
+            offsets += m
+        if not starts:
+            continue
+        starts = np.concatenate(starts)
+        out = pd.DataFrame({'recording': np.concatenate(keys), 'Time': np.concatenate(centers)})
+        for leg in legs:
+            view = sliding_window_view(np.concatenate(flats[leg]), n)
+            power = np.empty((len(starts), 2), dtype=np.float32)
+            rms = np.empty(len(starts), dtype=np.float32)
+            for lo in range(0, len(starts), CHUNK_WINDOWS):
+                sel = starts[lo:lo + CHUNK_WINDOWS]
+                power[lo:lo + len(sel)], rms[lo:lo + len(sel)] = band_features(view[sel], fs)
+            out[f'loco_{leg}'] = power[:, 0]
+            out[f'freeze_{leg}'] = power[:, 1]
+            out[f'rms_{leg}'] = rms
+        tables.append(out)
+    if not tables:
+        return pd.DataFrame(columns=['recording', 'Time', 'P_FOG'])
+    return score_windows(pd.concat(tables, ignore_index=True), legs)
+
+
+def score_windows(win, legs=LEGS):
+    #amplitude collapse is relative to the median RMS of the trial's walking windows
+    p_legs = []
+    for leg in legs:
+        loco, freeze, rms = win[f'loco_{leg}'], win[f'freeze_{leg}'], win[f'rms_{leg}']
+        total = loco + freeze
+        walking = rms.where((total >= POWER_FLOOR) & (freeze < loco))
+        ref = walking.groupby(win['recording']).transform('median')
+        ref = ref.fillna(rms.groupby(win['recording']).transform('median'))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            win[f'FI_{leg}'] = (freeze / loco).astype(np.float32)
+            win[f'collapse_{leg}'] = (rms / ref).astype(np.float32)
+        p_legs.append(fog_probability(win[f'FI_{leg}'].to_numpy(), win[f'collapse_{leg}'].to_numpy(),
+                                      total.to_numpy()))
+    #freezing in either leg counts
+    win['P_FOG'] = np.max(p_legs, axis=0).astype(np.float32)
+    return win
+
+
+def percent_time_freezing(win, threshold=P_THRESHOLD):
+    #per-trial summary; every window stands for one step of the window grid
+    g = win.assign(freezing=win['P_FOG'] >= threshold).groupby('recording', sort=False)
+    return pd.DataFrame({
+        'n_windows': g.size(),
+        'mean_P_FOG': g['P_FOG'].mean(),
+        'percent_time_freezing': g['freezing'].mean() * 100,
+    }).reset_index()
+
+
+def batch_fog(recordings, **kwargs):
+    win = fog_windows(recordings, **kwargs)
+    return win, percent_time_freezing(win)
+
+
+if __name__ == '__main__':
+    #python fog.py data/titrations/shankav_*.csv > fog_table.csv
+    files = sys.argv[1:]
+    _, trials = batch_fog({os.path.basename(f): f for f in files})
+    trials.to_csv(sys.stdout, index=False)
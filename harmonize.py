@@ -0,0 +1,128 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from derived_cache import memoize
+from instrument import traced
+from plot_config import EVENT_MAP
+
+ID_COLS = ['patient_num', 'stringvisit']
+
+#SIP: one task, metrics are plain columns
+SIP_METRICS = ['freezes', 'full_arrhythm', 'mean_shank_av']
+
+#TBC: column prefix -> task, metric suffix -> canonical name
+TBC_TASKS = {'Ellipses': 'E', 'Figure8': 'eig'}
+TBC_METRICS = {
+    'mean_freezing': 'mean_freezing',
+    'arrhythmicity': 'arrhythmicity_new',
+    'mean_shankav': 'mean_shankav',
+}
+TBC_SCALED = {'arrhythmicity_scaled': ('arrhythmicity', 100)}
+
+#column substitutions: 'fill' only patches missing values, 'replace' overwrites
+SHORT_ARRHYTHM_FALLBACK = {
+    'target': 'full_arrhythm', 'source': 'short_arrhythm', 'mode': 'fill',
+    'patients': ['RCS01', 'RCS09', 'RCS10'], 'visits': ['baseline'],
+}
+RCS10_HD_FREEZES = {
+    'target': 'freezes', 'source': 'Percent_Freezing_HD', 'mode': 'replace',
+    'patients': ['RCS10'],
+}
+RCS10_HD_ARRHYTHM = {
+    'target': 'full_arrhythm', 'source': 'Average_Arrhythmicity_HD', 'mode': 'replace',
+    'patients': ['RCS10'],
+}
+
+#fig5 and stats_sip.r have always patched SIP differently; keep both
+SIP_PLOT_RULES = [SHORT_ARRHYTHM_FALLBACK]
+SIP_STATS_RULES = [RCS10_HD_FREEZES, RCS10_HD_ARRHYTHM]
+
+
+def _column(df, name):
+    if name in df.columns:
+        return df[name]
+    return pd.Series(np.nan, index=df.index)
+
+
+def substitute(df, rules):
+    #apply each rule as one masked whole-column assignment
+    df = df.copy()
+    for rule in rules:
+        mask = pd.Series(True, index=df.index)
+        if rule.get('patients') is not None:
+            mask &= df['patient_num'].isin(rule['patients'])
+        if rule.get('visits') is not None:
+            mask &= df['stringvisit'].isin(rule['visits'])
+        target = _column(df, rule['target']).astype(np.float64)
+        source = _column(df, rule['source']).astype(np.float64)
+        if rule.get('mode', 'fill') == 'fill':
+            mask &= target.isna()
+        df[rule['target']] = target.mask(mask.to_numpy(), source)
+    return df
+
+
+def select_events(df, event_map=EVENT_MAP):
+    out = df[df['stringvisit'].isin(list(event_map))].copy()
+    out['Condition'] = out['stringvisit'].astype(object).map(event_map)
+    return out
+
+
+def melt_tasks(df, tasks, metrics, id_cols=ID_COLS):
+    #wide prefix columns -> one block per task, interleaved back into row order
+    blocks = []
+    for task, prefix in tasks.items():
+        block = df[id_cols].copy()
+        block['Task'] = task
+        for name, suffix in metrics.items():
+            block[name] = _column(df, prefix + suffix).to_numpy(dtype=np.float64)
+        blocks.append(block)
+    long = pd.concat(blocks, keys=range(len(blocks)), names=['_task', '_row'])
+    long = long.reset_index().sort_values(['_row', '_task'], kind='stable')
+    return long.drop(columns=['_task', '_row']).reset_index(drop=True)
+
+
+def scale(df, scaled):
+    for name, (source, factor) in scaled.items():
+        df[name] = df[source] * factor
+    return df
+
+
+def _canonical(df, metrics):
+    cols = ID_COLS + ['Condition', 'Task'] + list(metrics)
+    return df[cols].reset_index(drop=True)
+
+
+@traced('reshape.sip_long')
+@memoize('sip_long')
+def sip_long(raw, rules=SIP_PLOT_RULES):
+    df = select_events(substitute(raw, rules))
+    df['Task'] = 'SIP'
+    return _canonical(df, SIP_METRICS)
+
+
+@traced('reshape.tbc_long')
+@memoize('tbc_long')
+def tbc_long(raw, tasks=TBC_TASKS, metrics=TBC_METRICS, scaled=TBC_SCALED):
+    df = select_events(raw)
+    long = melt_tasks(df, tasks, metrics, ID_COLS + ['Condition'])
+    long = scale(long, scaled)
+    return _canonical(long, list(metrics) + list(scaled))
+
+
+def write_long_tables(data_dir='data'):
+    #canonical long tables read by stats_sip.r / stats_tbc.r
+    from ingest import load_table
+    sip = sip_long(load_table(os.path.join(data_dir, 'MergedSIPMetrics.csv')), SIP_STATS_RULES)
+    tbc = tbc_long(load_table(os.path.join(data_dir, 'MergedTBCMetrics.csv')))
+    sip.to_csv(os.path.join(data_dir, 'SIPLong.csv'), index=False)
+    tbc.to_csv(os.path.join(data_dir, 'TBCLong.csv'), index=False)
+    return sip, tbc
+
+
+if __name__ == '__main__':
+    from ingest import data_path
+    write_long_tables(sys.argv[1] if len(sys.argv) > 1 else data_path())
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from instrument import traced
+
+CACHE_DIR = os.environ.get('KADBS_CACHE', '.cache')
+DATA_DIR = 'data'
+CATEGORICALS = ('patient_num', 'stringvisit', 'redcap_event_name')
+FORMAT_VERSION = 1
+
+
+def _content_hash(path, block=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def data_path(*parts):
+    #inputs live under data/ unless KADBS_DATA (kadbs.py --data) points elsewhere
+    return os.path.join(os.environ.get('KADBS_DATA', DATA_DIR), *parts)
+
+
+def _reader(path, read_kwargs):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xls', '.xlsm'):
+        return pd.read_excel(path, **read_kwargs)
+    return pd.read_csv(path, **read_kwargs)
+
+
+def _entry_dir(path, read_kwargs, cache_dir):
+    key = json.dumps([os.path.abspath(path), read_kwargs], sort_keys=True, default=str)
+    return os.path.join(cache_dir, 'ingest', hashlib.sha1(key.encode()).hexdigest())
+
+
+def _write_entry(df, entry, stat, digest, categoricals):
+    tmp = entry + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        fname = f'c{i}.npy'
+        spec = {'name': name, 'file': fname}
+        if name in categoricals or isinstance(col.dtype, pd.CategoricalDtype):
+            cat = col.astype('category')
+            spec['kind'] = 'category'
+            spec['categories'] = cat.cat.categories.tolist()
+            np.save(os.path.join(tmp, fname), cat.cat.codes.to_numpy())
+        elif isinstance(col.dtype, np.dtype) and col.dtype.kind in 'biufcmM':
+            spec['kind'] = 'array'
+            spec['dtype'] = str(col.dtype)
+            np.save(os.path.join(tmp, fname), col.to_numpy())
+        else:
+            #free text or mixed types keep their python objects
+            spec['kind'] = 'object'
+            np.save(os.path.join(tmp, fname), col.to_numpy(dtype=object), allow_pickle=True)
+        columns.append(spec)
+    manifest = {'version': FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                'sha1': digest, 'rows': len(df), 'columns': columns}
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, default=str)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+
+def _read_entry(entry, manifest):
+    data = {}
+    for spec in manifest['columns']:
+        fname = os.path.join(entry, spec['file'])
+        if spec['kind'] == 'category':
+            codes = np.load(fname, mmap_mode='c')
+            data[spec['name']] = pd.Categorical.from_codes(codes, spec['categories'])
+        elif spec['kind'] == 'object':
+            data[spec['name']] = np.load(fname, allow_pickle=True)
+        else:
+            #copy-on-write maps: no read up front, callers may still assign into them
+            data[spec['name']] = np.load(fname, mmap_mode='c')
+    return pd.DataFrame(data, copy=False)
+
+
+def _load_manifest(entry):
+    try:
+        with open(os.path.join(entry, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == FORMAT_VERSION else None
+
+
+@traced('load.table')
+def load_table(path, cache_dir=None, categoricals=CATEGORICALS, **read_kwargs):
+    #read an Excel/CSV source through a columnar cache keyed by path, size, mtime
+    #and content hash; the source is parsed again only when it changes
+    cache_dir = cache_dir or CACHE_DIR
+    entry = _entry_dir(path, read_kwargs, cache_dir)
+    stat = os.stat(path)
+    manifest = _load_manifest(entry)
+
+    if manifest is not None:
+        if manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns:
+            return _read_entry(entry, manifest)
+        digest = _content_hash(path)
+        if manifest['sha1'] == digest:
+            #touched but unchanged: refresh the stamp, keep the columns
+            manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            with open(os.path.join(entry, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, default=str)
+            return _read_entry(entry, manifest)
+    else:
+        digest = _content_hash(path)
+
+    df = _reader(path, read_kwargs)
+    _write_entry(df, entry, stat, digest, set(categoricals))
+    return _read_entry(entry, _load_manifest(entry))
+
+
+def clear_cache(cache_dir=None):
+    shutil.rmtree(os.path.join(cache_dir or CACHE_DIR, 'ingest'), ignore_errors=True)
@@ -0,0 +1,195 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:     # windows
+    resource = None
+
+#opt-in spans around loading, reshaping, plotting and export. KADBS_TRACE=1 (or a .json
+#path / a directory) writes one JSON trace per run, at exit; KADBS_TRACE_MALLOC=1 adds
+#tracemalloc peaks (slow); KADBS_PROFILE=1 runs every top-level span under cProfile and
+#keeps the profile of the slowest one. Unset, span() hands back one shared no-op object
+#and @traced returns the function untouched.
+
+TRACE_DIR = os.path.join(os.environ.get('KADBS_CACHE', '.cache'), 'trace')
+ENABLED = bool(os.environ.get('KADBS_TRACE'))
+PROFILE = bool(os.environ.get('KADBS_PROFILE'))
+MALLOC = bool(os.environ.get('KADBS_TRACE_MALLOC'))
+
+_state = {'spans': [], 'stack': [], 't0': None, 'pid': None, 'path': None,
+          'hottest': None, 'registered': False}
+
+
+def _rss_peak_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def _rows(obj):
+    shape = getattr(obj, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+def trace_path():
+    #resolved on first write, so build.py workers pick up the script they run
+    if _state['path'] is None:
+        target = os.environ.get('KADBS_TRACE', '1')
+        script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+        name = f"{script}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json"
+        if target.endswith('.json'):
+            _state['path'] = target
+        else:
+            _state['path'] = os.path.join(TRACE_DIR if target == '1' else target, name)
+        _state['path'] = os.path.abspath(_state['path'])
+    return _state['path']
+
+
+def _write():
+    #once, at interpreter exit (spans are only kept in memory until then); forked export
+    #workers inherit the recorder but never write the parent's trace
+    if _state['pid'] != os.getpid() or not _state['spans']:
+        return
+    path = trace_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    out = {'script': sys.argv[0], 'pid': os.getpid(), 'argv': sys.argv[1:],
+           'started': _state['started'], 'malloc': MALLOC, 'spans': _state['spans']}
+    hot = _state['hottest']
+    if hot is not None:
+        prof = os.path.splitext(path)[0] + '.prof'
+        hot[1].dump_stats(prof)
+        out['profile'] = {'span': hot[0]['name'], 'id': hot[0]['id'], 'path': prof}
+    if 'derived_cache' in sys.modules:
+        out['derived_cache'] = sys.modules['derived_cache'].stats()
+    with open(path, 'w') as f:
+        json.dump(out, f, indent=1, default=str)
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.peak = 0
+        self.profiler = None
+
+    def set(self, **attrs):
+        #e.g. span.set(rows=len(df)) once the size is known
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        st = _state
+        if st['pid'] != os.getpid():
+            st.update(spans=[], stack=[], t0=time.perf_counter(), pid=os.getpid(), path=None,
+                      hottest=None, started=time.strftime('%Y-%m-%dT%H:%M:%S'))
+            if MALLOC and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if not st['registered']:
+                atexit.register(_write)
+                st['registered'] = True
+        parent = st['stack'][-1] if st['stack'] else None
+        self.record = {'id': len(st['spans']), 'name': self.name,
+                       'parent': parent.record['id'] if parent else None,
+                       'depth': len(st['stack'])}
+        st['spans'].append(self.record)
+        if MALLOC:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent.peak = max(parent.peak, peak)
+            self.base = current
+            if hasattr(tracemalloc, 'reset_peak'):     # python 3.9+; before, peaks are since start
+                tracemalloc.reset_peak()
+        if PROFILE and parent is None:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:      # another profiler is already active
+                self.profiler = None
+        st['stack'].append(self)
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        if self.profiler is not None:
+            self.profiler.disable()
+        st = _state
+        st['stack'].pop()
+        rec = self.record
+        rec.update(start_s=self.start - st['t0'], wall_s=wall, cpu_s=cpu,
+                   rss_peak_mb=_rss_peak_mb())
+        if MALLOC:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            rec['py_peak_mb'] = (peak - self.base) / 1e6
+            if st['stack']:
+                st['stack'][-1].peak = max(st['stack'][-1].peak, peak)
+        if exc_type is not None:
+            rec['error'] = exc_type.__name__
+        rec.update(self.attrs)
+        if self.profiler is not None and (st['hottest'] is None or wall > st['hottest'][0]['wall_s']):
+            st['hottest'] = (rec, self.profiler)
+        return False
+
+
+def span(name, **attrs):
+    #with span('load', source=path) as s: ...; s.set(rows=len(df))
+    if not ENABLED:
+        return _NULL
+    return _Span(name, attrs)
+
+
+def traced(name=None):
+    #@traced or @traced('plot.trajectories'); rows of a returned frame/array are recorded
+    def wrap(fn, label):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with _Span(label, {}) as s:
+                out = fn(*args, **kwargs)
+                rows = _rows(out)
+                if rows is not None:
+                    s.set(rows=rows)
+                return out
+        return inner
+
+    if callable(name):
+        return wrap(name, f'{name.__module__}.{name.__qualname__}')
+    return lambda fn: wrap(fn, name or f'{fn.__module__}.{fn.__qualname__}')
+
+
+def enable(path=None, profile=False, malloc=False):
+    #programmatic switch (before the instrumented modules are imported, @traced binds then)
+    global ENABLED, PROFILE, MALLOC
+    ENABLED, PROFILE, MALLOC = True, PROFILE or profile, MALLOC or malloc
+    if path is not None:
+        os.environ['KADBS_TRACE'] = path
+        _state['path'] = None
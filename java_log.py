@@ -0,0 +1,126 @@
+import io
+import mmap
+import os
+import traceback
+
+import numpy as np
+import pandas as pd
+
+#the gait controller writes one 7-line record per update; the metrics live on
+#line 6 (arrhythmicity, asymmetry, P(FOG)) and line 7 (state, -, unix ms)
+RECORD_ROWS = 7
+METRIC_ROW = 5
+STATE_ROW = 6
+CHUNK_BYTES = 16 * 1024 * 1024
+
+COLUMNS = {
+    'time_ms': np.int64,
+    'state': np.int8,
+    'arrhythmicity': np.float32,
+    'asymmetry': np.float32,
+    'freeze_prob': np.float32,
+}
+MISSING_STATE = -1
+
+
+def _select_lines(buf, starts, ends, rows):
+    #concatenate the selected lines of a chunk with one boolean byte mask
+    if len(rows) == 0:
+        return b''
+    edges = np.zeros(len(buf) + 1, dtype=np.int8)
+    edges[starts[rows]] = 1
+    edges[ends[rows]] = -1
+    return buf[np.cumsum(edges[:-1], dtype=np.int8) > 0].tobytes()
+
+
+def _parse_lines(raw, usecols):
+    #quotes are handled by the csv tokenizer, not by string replacement
+    if not raw:
+        return np.empty((0, len(usecols)))
+    #as many names as the widest line has fields (commas inside quotes only add spare
+    #columns), so lines with extra fields are read; a trailing row of empty fields that
+    #is dropped again keeps every used column present when all lines are short
+    b = np.frombuffer(raw, dtype=np.uint8)
+    commas = np.cumsum(b == 44)[b == 10]
+    width = max(int(np.diff(commas, prepend=0).max()) + 1, max(usecols) + 1)
+    raw += b',' * (width - 1) + b'\n'
+    opts = dict(header=None, usecols=usecols, names=range(width), engine='c')
+    try:
+        return pd.read_csv(io.BytesIO(raw), dtype=np.float64, **opts).to_numpy()[:-1]
+    except ValueError:
+        #a non-numeric cell somewhere in the chunk, coerce it to NaN
+        table = pd.read_csv(io.BytesIO(raw), dtype=str, **opts)
+        return table.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)[:-1]
+
+
+def _parse_chunk(buf):
+    nl = np.flatnonzero(buf == 10)
+    starts = np.r_[0, nl[:-1] + 1]
+    ends = nl + 1
+    line_no = np.arange(len(nl)) % RECORD_ROWS
+    n_records = len(nl) // RECORD_ROWS
+    metric_rows = np.flatnonzero(line_no == METRIC_ROW)[:n_records]
+    state_rows = np.flatnonzero(line_no == STATE_ROW)[:n_records]
+
+    metrics = _parse_lines(_select_lines(buf, starts, ends, metric_rows), [0, 1, 2])
+    states = _parse_lines(_select_lines(buf, starts, ends, state_rows), [0, 2])
+
+    state = states[:, 0]
+    time_ms = states[:, 1]
+    return {
+        'time_ms': np.where(np.isnan(time_ms), -1, time_ms).astype(np.int64),
+        'state': np.where(np.isnan(state), MISSING_STATE, state).astype(np.int8),
+        'arrhythmicity': metrics[:, 0].astype(np.float32),
+        'asymmetry': metrics[:, 1].astype(np.float32),
+        'freeze_prob': metrics[:, 2].astype(np.float32),
+    }
+
+
+def _record_chunks(mm, chunk_bytes):
+    #yield byte ranges that end on a record boundary
+    size = len(mm)
+    pos = 0
+    while pos < size:
+        end = min(pos + chunk_bytes, size)
+        if end < size:
+            view = np.frombuffer(mm, dtype=np.uint8, count=end - pos, offset=pos)
+            nl = np.flatnonzero(view == 10)
+            n_whole = (len(nl) // RECORD_ROWS) * RECORD_ROWS
+            if n_whole == 0:
+                chunk_bytes *= 2
+                continue
+            end = pos + nl[n_whole - 1] + 1
+        yield pos, end
+        pos = end
+
+
+def read_java_log(path, chunk_bytes=CHUNK_BYTES):
+    #returns one row per controller update with typed columns
+    parts = {name: [] for name in COLUMNS}
+    if os.path.getsize(path) == 0:
+        return pd.DataFrame({name: np.empty(0, dtype=dt) for name, dt in COLUMNS.items()})
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunks = _record_chunks(mm, chunk_bytes)
+        buf = None
+        try:
+            for start, end in chunks:
+                buf = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+                if end == len(mm) and buf[-1] != 10:
+                    buf = np.r_[buf, np.uint8(10)]
+                for name, values in _parse_chunk(buf).items():
+                    parts[name].append(values)
+        except BaseException as e:
+            #the frames of the traceback hold views of mm; without them the mmap closes
+            #and the parse error surfaces instead of a BufferError
+            traceback.clear_frames(e.__traceback__)
+            raise
+        finally:
+            buf = None
+            chunks.close()
+    table = pd.DataFrame({name: np.concatenate(parts[name]).astype(dt, copy=False)
+                          for name, dt in COLUMNS.items()})
+    return table
+
+
+def to_local_time(time_ms, tz='America/Los_Angeles'):
+    return pd.to_datetime(time_ms, unit='ms', utc=True).tz_convert(tz)
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+#single entry point: `python kadbs.py build fig5 fig6 --data DIR --out DIR`. Only the
+#standard library is imported up front; pandas, matplotlib and seaborn load when the
+#first target needs them and stay loaded for every later target of the same run
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STARTUP_BUDGET_S = 0.25     # interpreter + CLI import, measured by `kadbs.py startup`
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib', 'seaborn', 'scipy')
+
+
+def _environment(args):
+    #set before anything reads it: ingest takes KADBS_CACHE at import time
+    for flag, var in (('data', 'KADBS_DATA'), ('out', 'KADBS_OUT'), ('cache', 'KADBS_CACHE')):
+        value = getattr(args, flag, None)
+        if value:
+            os.environ[var] = os.path.abspath(value)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    os.environ['KADBS_HEADLESS'] = '1'
+    if getattr(args, 'trace', False):
+        os.environ.setdefault('KADBS_TRACE', '1')
+
+
+def cmd_build(args):
+    _environment(args)
+    sys.path.insert(0, ROOT)
+    import build
+    unknown = [t for t in args.targets if t not in build.TARGETS]
+    if unknown:
+        sys.exit(f'unknown target(s): {", ".join(unknown)}')
+    start = time.perf_counter()
+    report = build.build(args.targets, args.jobs, args.force, args.dry_run, args.formats,
+                         args.dpi, warm=(args.jobs or 1) <= 1)
+    for name, status in report.items():
+        print(f'{name:12s} {status}')
+    print(f'{len(report)} target(s) in {time.perf_counter() - start:.1f}s')
+    return 1 if any(s.startswith(('failed', 'skipped')) for s in report.values()) else 0
+
+
+def cmd_list(args):
+    sys.path.insert(0, ROOT)
+    from build import TARGETS
+    for name, target in TARGETS.items():
+        runs = target.get('script') or ' '.join(target['cmd'])
+        deps = f" (after {', '.join(target['deps'])})" if target.get('deps') else ''
+        print(f'{name:12s} {runs}{deps}')
+    return 0
+
+
+def cmd_probe(args):
+    #what a bare CLI start costs: the parser and the target table, nothing else
+    sys.path.insert(0, ROOT)
+    from build import TARGETS
+    print(json.dumps({'heavy': [m for m in HEAVY_MODULES if m in sys.modules],
+                      'targets': len(TARGETS)}))
+    return 0
+
+
+def cmd_startup(args):
+    #best of N cold starts of this CLI, against the budget and a bare interpreter
+    def best(argv):
+        times, out = [], ''
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            out = subprocess.run(argv, stdout=subprocess.PIPE, text=True, check=True,
+                                 cwd=ROOT).stdout
+            times.append(time.perf_counter() - start)
+        return min(times), out
+
+    bare, _ = best([sys.executable, '-c', 'pass'])
+    cli, out = best([sys.executable, os.path.join(ROOT, 'kadbs.py'), '_probe'])
+    heavy = json.loads(out)['heavy']
+    print(f'interpreter {bare * 1e3:.0f} ms, kadbs startup {cli * 1e3:.0f} ms '
+          f'(budget {args.budget * 1e3:.0f} ms)')
+    if heavy:
+        print(f'imported at startup: {", ".join(heavy)}')
+    return 0 if cli <= args.budget and not heavy else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='kadbs', description='KaDBS figures and statistics')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    b = sub.add_parser('build', help='regenerate figure/stats targets')
+    b.add_argument('targets', nargs='*', metavar='target')
+    b.add_argument('--data', help='input directory (default: data/)')
+    b.add_argument('--out', help='figure directory, stats go to its results/ '
+                                 '(default: figures/ and results/)')
+    b.add_argument('--cache', help='cache directory (default: .cache/)')
+    b.add_argument('-j', '--jobs', type=int, default=1,
+                   help='>1 builds in a process pool; 1 runs every target in this process')
+    b.add_argument('--force', action='store_true')
+    b.add_argument('--dry-run', action='store_true')
+    b.add_argument('--formats', type=lambda s: s.split(','), default=None)
+    b.add_argument('--dpi', type=float, default=None)
+    b.add_argument('--trace', action='store_true', help='write span traces (see instrument.py)')
+    b.set_defaults(func=cmd_build)
+
+    ls = sub.add_parser('list', help='list targets')
+    ls.set_defaults(func=cmd_list)
+
+    st = sub.add_parser('startup', help='measure CLI startup against the budget')
+    st.add_argument('--budget', type=float, default=STARTUP_BUDGET_S)
+    st.add_argument('--repeat', type=int, default=5)
+    st.set_defaults(func=cmd_startup)
+
+    pr = sub.add_parser('_probe', help=argparse.SUPPRESS)
+    pr.set_defaults(func=cmd_probe)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
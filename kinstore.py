@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from ingest import CACHE_DIR, _content_hash
+from instrument import traced
+
+#binary store for raw kinematic streams: one contiguous float32 file per channel, a float64
+#time file and a sparse time index, all memory-mapped; a time-window read touches only the
+#pages it returns and hands back views, never copies
+FORMAT_VERSION = 1
+INDEX_STRIDE = 4096         # samples between entries of the sparse time index
+CHUNK_ROWS = 1 << 20        # csv rows parsed per conversion step
+EXT = {'float32': 'f32', 'float64': 'f64'}
+
+
+def _store_dir(csv_path, cache_dir, time_col='Time', channels=None):
+    #one store per csv and conversion choice (clock column, channel subset)
+    spec = [os.path.abspath(csv_path), time_col, None if channels is None else list(channels)]
+    key = hashlib.sha1(json.dumps(spec).encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, 'kin', f'{name}-{key}')
+
+
+def _finish(tmp, out_dir, n, channels, dtypes, source=None):
+    #sparse index + meta, then swap the finished directory into place
+    time = np.memmap(os.path.join(tmp, 'time.f64'), dtype=np.float64, mode='r', shape=(n,)) \
+        if n else np.empty(0)
+    np.ascontiguousarray(time[::INDEX_STRIDE]).tofile(os.path.join(tmp, 'index.f64'))
+    meta = {'version': FORMAT_VERSION, 'source': None, 'size': None, 'mtime_ns': None,
+            'sha1': None, 'n': n, 'channels': list(channels),
+            'dtypes': {c: dtypes.get(c, 'float32') for c in channels},
+            'index_stride': INDEX_STRIDE,
+            't_first': float(time[0]) if n else None, 't_last': float(time[-1]) if n else None}
+    if source is not None:
+        stat = os.stat(source)
+        meta.update(source=os.path.abspath(source), size=stat.st_size,
+                    mtime_ns=stat.st_mtime_ns, sha1=_content_hash(source))
+    del time
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return out_dir
+
+
+def _fresh(out_dir):
+    tmp = out_dir + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    return tmp
+
+
+def _fname(channel, dtype):
+    return f'{channel}.{EXT[dtype]}'
+
+
+def write_store(out_dir, time, data, dtypes=None):
+    #arrays already in memory (e.g. decoded device streams) -> store; float32 by default
+    tmp = _fresh(out_dir)
+    dtypes = dict(dtypes or {})
+    np.asarray(time, dtype=np.float64).tofile(os.path.join(tmp, 'time.f64'))
+    for c, values in data.items():
+        dt = dtypes.setdefault(c, 'float32')
+        np.asarray(values, dtype=dt).tofile(os.path.join(tmp, _fname(c, dt)))
+    return _finish(tmp, out_dir, len(time), list(data), dtypes)
+
+
+def convert_csv(csv_path, out_dir, time_col='Time', channels=None, chunk_rows=CHUNK_ROWS):
+    #one streaming pass over the csv: every chunk is appended to the channel files
+    tmp = _fresh(out_dir)
+    files, n = {}, 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            if channels is None:
+                channels = [c for c in chunk.columns
+                            if c != time_col and pd.api.types.is_numeric_dtype(chunk[c])]
+            if not files:
+                files['time'] = open(os.path.join(tmp, 'time.f64'), 'wb')
+                files.update({c: open(os.path.join(tmp, _fname(c, 'float32')), 'wb')
+                              for c in channels})
+            chunk[time_col].to_numpy(dtype=np.float64).tofile(files['time'])
+            for c in channels:
+                chunk[c].to_numpy(dtype=np.float32).tofile(files[c])
+            n += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+    return _finish(tmp, out_dir, n, channels or [], {}, source=csv_path)
+
+
+class KinStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.n = self.meta['n']
+        self.channels = self.meta['channels']
+        self.t_first = self.meta['t_first']
+        self.t_last = self.meta['t_last']
+        self.dtypes = self.meta.get('dtypes', {})
+        self.stride = self.meta['index_stride']
+        self.index = np.fromfile(os.path.join(path, 'index.f64'), dtype=np.float64)
+        self.time = self._map('time.f64', np.float64)
+        self._data = {}
+
+    def _map(self, fname, dtype):
+        if not self.n:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, fname), dtype=dtype, mode='r', shape=(self.n,))
+
+    def channel(self, name):
+        if name not in self._data:
+            if name not in self.channels:
+                raise KeyError(f'{name} not in {self.path} (channels: {", ".join(self.channels)})')
+            dtype = self.dtypes.get(name, 'float32')
+            self._data[name] = self._map(_fname(name, dtype), np.dtype(dtype))
+        return self._data[name]
+
+    def _search(self, t, side):
+        #sparse index narrows the search to one block of the time file
+        b = max(np.searchsorted(self.index, t, side='right') - 1, 0) * self.stride
+        block = self.time[b:b + self.stride + 1]
+        return b + int(np.searchsorted(block, t, side=side))
+
+    def index_range(self, t0=None, t1=None):
+        #samples with t0 <= time <= t1
+        i0 = 0 if t0 is None else self._search(t0, 'left')
+        i1 = self.n if t1 is None else self._search(t1, 'right')
+        return i0, max(i0, i1)
+
+    def window(self, t0=None, t1=None, channels=None):
+        #(time view, {channel: view}) between t0 and t1 seconds on the stored clock
+        i0, i1 = self.index_range(t0, t1)
+        return self.time[i0:i1], {c: self.channel(c)[i0:i1] for c in (channels or self.channels)}
+
+    def head(self, seconds, channels=None):
+        #first `seconds` of the recording
+        return self.window(self.t_first, self.t_first + seconds, channels)
+
+    def frame(self, t0=None, t1=None, channels=None, time_col='Time'):
+        t, data = self.window(t0, t1, channels)
+        return pd.DataFrame({time_col: t, **data}, copy=False)
+
+
+@traced('load.kinstore')
+def open_store(csv_path, cache_dir=None, **convert_kwargs):
+    #KinStore for a csv, converted on first use and again only when the csv changes
+    out_dir = _store_dir(csv_path, cache_dir or CACHE_DIR, convert_kwargs.get('time_col', 'Time'),
+                         convert_kwargs.get('channels'))
+    stat = os.stat(csv_path)
+    try:
+        with open(os.path.join(out_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = None
+    if meta is None or meta.get('version') != FORMAT_VERSION:
+        convert_csv(csv_path, out_dir, **convert_kwargs)
+    elif (meta['size'], meta['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        if meta['sha1'] != _content_hash(csv_path):
+            convert_csv(csv_path, out_dir, **convert_kwargs)
+        else:
+            meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+    return KinStore(out_dir)
+
+
+def clear_cache(cache_dir=None):
+    shutil.rmtree(os.path.join(cache_dir or CACHE_DIR, 'kin'), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    #python kinstore.py data/titrations/shankav_*.csv   (one-time conversion)
+    for path in sys.argv[1:]:
+        store = open_store(path)
+        print(f'{path}: {store.n} samples, {", ".join(store.channels)} -> {store.path}')
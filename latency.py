@@ -0,0 +1,205 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from alignment import _session_clock, apply_clock_model, metric_blocks, to_utc_ns
+from replay import ARR_CONTROLLER, PFOG_CONTROLLER
+
+#closed-loop timing from controller logs and RC+S adaptive streams: threshold crossings,
+#controller state transitions and stimulation amplitude ramps are extracted for the whole
+#cohort at once and linked by as-of joins, so every session goes through the same diffs
+
+CONTROLLERS = {'arrhythmicity': ARR_CONTROLLER, 'freeze_prob': PFOG_CONTROLLER}
+AMP_COL = 'Adaptive_CurrentProgramAmplitudesInMilliamps_0'
+MAX_LATENCY = pd.Timedelta('10s')   # events further apart are not treated as cause and effect
+QUANTILES = (0.05, 0.5, 0.95)
+
+
+def _same_group(codes):
+    #True where a row continues the group of the previous row
+    return np.r_[False, codes[1:] == codes[:-1]]
+
+
+def _controller_frame(sessions, clock=None):
+    frames = []
+    for key, (log, _) in sessions.items():
+        c = log.assign(session=key)
+        if 'block' not in c:
+            c['block'] = metric_blocks(c)
+        frames.append(c)
+    ctrl = pd.concat(frames, ignore_index=True)
+    ctrl['_t'] = to_utc_ns(ctrl['time_ms'])
+    if clock is not None:
+        model = clock if 'offset' in clock else _session_clock(ctrl, 'session', clock)
+        ctrl['_t'] = apply_clock_model(ctrl['_t'].to_numpy(), model)
+    ctrl = ctrl[(ctrl['_t'] > 0) & ctrl['block'].notna()]
+    return ctrl.sort_values(['session', '_t'], kind='stable').reset_index(drop=True)
+
+
+def _neural_frame(sessions, time_col='localTime'):
+    frames = [n.assign(session=key) for key, (_, n) in sessions.items()]
+    neur = pd.concat(frames, ignore_index=True)
+    neur['_t'] = to_utc_ns(neur[time_col])
+    neur = neur[neur['_t'] > 0]
+    return neur.sort_values(['session', '_t'], kind='stable').reset_index(drop=True)
+
+
+def threshold_crossings(ctrl, controllers=CONTROLLERS):
+    #upward crossings of the on threshold (+1) and downward crossings of the off threshold (-1)
+    block = ctrl['block'].astype(object).to_numpy()
+    x = np.full(len(ctrl), np.nan)
+    on = np.full(len(ctrl), np.nan)
+    off = np.full(len(ctrl), np.nan)
+    for metric, params in controllers.items():
+        rows = block == metric
+        x[rows] = ctrl.loc[rows, metric].to_numpy(dtype=np.float64)
+        on[rows] = params['on_threshold']
+        off[rows] = params['off_threshold']
+    key = ctrl['session'].astype(str).to_numpy() + '|' + block.astype(str)
+    #compare against the last reported value, metrics are NaN between reports
+    prev = pd.Series(x).groupby(key).shift(1).groupby(key).ffill().to_numpy()
+    with np.errstate(invalid='ignore'):
+        up = (prev < on) & (x >= on)
+        down = (prev > off) & (x <= off)
+    rows = np.flatnonzero(up | down)
+    return pd.DataFrame({'session': ctrl['session'].to_numpy()[rows], 'block': block[rows],
+                         'direction': np.where(up[rows], 1, -1), '_t': ctrl['_t'].to_numpy()[rows],
+                         'value': x[rows]})
+
+
+def state_transitions(ctrl):
+    #changes of the logged controller state; missing states (-1) hold the previous one
+    state = ctrl['state'].to_numpy(dtype=np.float64)
+    state[state < 0] = np.nan
+    key = ctrl['session'].astype(str).to_numpy()
+    prev = pd.Series(state).groupby(key).shift(1).groupby(key).ffill().to_numpy()
+    with np.errstate(invalid='ignore'):
+        change = ~np.isnan(state) & ~np.isnan(prev) & (state != prev)
+    rows = np.flatnonzero(change)
+    return pd.DataFrame({'session': key[rows], 'block': ctrl['block'].astype(object).to_numpy()[rows],
+                         'direction': np.sign(state[rows] - prev[rows]).astype(np.int64),
+                         '_t': ctrl['_t'].to_numpy()[rows],
+                         'state_from': prev[rows], 'state_to': state[rows]})
+
+
+def amplitude_ramps(neur, amp_col=AMP_COL):
+    #maximal runs of same-direction amplitude steps; a ramp starts at the last sample of
+    #the old plateau and ends at the first sample of the new one
+    amp = neur[amp_col].to_numpy(dtype=np.float64)
+    t = neur['_t'].to_numpy()
+    same = _same_group(neur['session'].astype(str).to_numpy())
+    step = np.where(same, np.sign(np.r_[0.0, np.diff(amp)]), 0.0)
+    step[np.isnan(step)] = 0
+    starts = np.flatnonzero((step != 0) & (np.r_[0.0, step[:-1]] != step))
+    ends = np.flatnonzero((step != 0) & (np.r_[step[1:], 0.0] != step))
+    return pd.DataFrame({
+        'session': neur['session'].to_numpy()[starts],
+        'direction': step[starts].astype(np.int64),
+        '_t': t[starts - 1],
+        'ramp_end_t': t[ends],
+        'amp_from': amp[starts - 1],
+        'amp_to': amp[ends],
+        'ramp_s': (t[ends] - t[starts - 1]) / 1e9,
+    })
+
+
+def _asof(left, right, direction, cols):
+    #nearest right event per left event within MAX_LATENCY, same session and direction
+    right = right[['session', 'direction', '_t'] + cols].rename(columns={'_t': '_t_match'})
+    return pd.merge_asof(left.sort_values('_t'), right.sort_values('_t_match'),
+                         left_on='_t', right_on='_t_match', by=['session', 'direction'],
+                         direction=direction, tolerance=int(MAX_LATENCY.value))
+
+
+def duty_cycles(ctrl, neur, amp_col=AMP_COL):
+    #time-weighted fraction of each block spent in state 1 / above the mid amplitude
+    key = ctrl['session'].astype(str) + '|' + ctrl['block'].astype(str)
+    t = ctrl['_t'].to_numpy()
+    nxt = pd.Series(t).groupby(key.to_numpy()).shift(-1).to_numpy()
+    dur = np.nan_to_num((nxt - t) / 1e9)
+    on = (ctrl['state'].to_numpy() == 1) * dur
+    g = pd.DataFrame({'session': ctrl['session'], 'block': ctrl['block'].astype(object),
+                      'dur': dur, 'on': on}).groupby(['session', 'block'])
+    out = g[['dur', 'on']].sum()
+    out['duty_state'] = out['on'] / out['dur']
+
+    #neural samples take the block of the controller row they follow
+    spans = ctrl[['session', '_t', 'block']].astype({'block': object})
+    n = pd.merge_asof(neur[['session', '_t', amp_col]].sort_values('_t'), spans.sort_values('_t'),
+                      on='_t', by='session', direction='backward')
+    n = n.dropna(subset=['block']).sort_values(['session', '_t'])
+    nkey = n['session'].astype(str) + '|' + n['block'].astype(str)
+    nt = n['_t'].to_numpy()
+    ndur = np.nan_to_num((pd.Series(nt).groupby(nkey.to_numpy()).shift(-1).to_numpy() - nt) / 1e9)
+    amp = n[amp_col].to_numpy(dtype=np.float64)
+    lo = n.groupby('session')[amp_col].transform('min').to_numpy()
+    hi = n.groupby('session')[amp_col].transform('max').to_numpy()
+    high = (hi > lo) & (amp > (lo + hi) / 2)
+    a = pd.DataFrame({'session': n['session'], 'block': n['block'], 'dur': ndur,
+                      'on': high * ndur}).groupby(['session', 'block'])[['dur', 'on']].sum()
+    out['duty_amp'] = a['on'] / a['dur']
+    out = out.rename(columns={'dur': 'duration_s'}).drop(columns='on')
+    return out.reset_index()
+
+
+def session_latencies(sessions, clock=None, amp_col=AMP_COL, neural_time='localTime',
+                      controllers=CONTROLLERS):
+    #sessions: {session: (read_java_log table, rcs_loader adaptive frame)}
+    ctrl = _controller_frame(sessions, clock)
+    neur = _neural_frame(sessions, neural_time)
+    crossings = threshold_crossings(ctrl, controllers)
+    transitions = state_transitions(ctrl)
+    ramps = amplitude_ramps(neur, amp_col)
+
+    #latest crossing before each transition, first ramp after it
+    tr = _asof(transitions, crossings, 'backward', ['value'])
+    tr['crossing_to_state_s'] = (tr['_t'] - tr['_t_match']) / 1e9
+    tr = tr.drop(columns=['_t_match', 'value'])
+    tr = _asof(tr, ramps, 'forward', ['ramp_end_t', 'ramp_s', 'amp_from', 'amp_to'])
+    tr['state_to_ramp_s'] = (tr['_t_match'] - tr['_t']) / 1e9
+    tr['state_to_amplitude_s'] = (tr['ramp_end_t'] - tr['_t']) / 1e9
+    tr['time_utc'] = pd.to_datetime(tr['_t'], utc=True)
+    tr = tr.drop(columns=['_t', '_t_match', 'ramp_end_t'])
+
+    ramps['time_utc'] = pd.to_datetime(ramps['_t'], utc=True)
+    crossings['time_utc'] = pd.to_datetime(crossings['_t'], utc=True)
+    return {
+        'transitions': tr.sort_values(['session', 'time_utc']).reset_index(drop=True),
+        'crossings': crossings.drop(columns='_t'),
+        'ramps': ramps.drop(columns=['_t', 'ramp_end_t']),
+        'duty': duty_cycles(ctrl, neur, amp_col),
+    }
+
+
+def latency_distribution(transitions, measures=('crossing_to_state_s', 'state_to_ramp_s',
+                                                'state_to_amplitude_s', 'ramp_s'),
+                         quantiles=QUANTILES):
+    #per session and cohort-wide ('all'), by block and direction
+    long = transitions.melt(id_vars=['session', 'block', 'direction'], value_vars=list(measures),
+                            var_name='measure', value_name='seconds').dropna(subset=['seconds'])
+    both = pd.concat([long, long.assign(session='all')], ignore_index=True)
+    g = both.groupby(['session', 'block', 'direction', 'measure'])['seconds']
+    out = g.agg(['count', 'mean', 'max'])
+    q = g.quantile(list(quantiles)).unstack()
+    q.columns = [f'p{int(round(c * 100)):02d}' for c in q.columns]
+    return out.join(q).reset_index()
+
+
+if __name__ == '__main__':
+    #python latency.py out_dir log1.txt DeviceDir1 [log2.txt DeviceDir2 ...]
+    from java_log import read_java_log
+    from rcs_loader import load_session
+    out_dir, pairs = sys.argv[1], sys.argv[2:]
+    sessions = {os.path.basename(os.path.normpath(dev)):
+                (read_java_log(log), load_session(dev, streams=('adaptive',))['adaptive'])
+                for log, dev in zip(pairs[::2], pairs[1::2])}
+    res = session_latencies(sessions)
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ('transitions', 'ramps', 'duty'):
+        res[name].to_csv(os.path.join(out_dir, f'latency_{name}.csv'), index=False)
+    dist = latency_distribution(res['transitions'])
+    dist.to_csv(os.path.join(out_dir, 'latency_distribution.csv'), index=False)
+    print(dist[dist['session'] == 'all'].to_string(index=False))
@@ -0,0 +1,324 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+#random-intercept linear mixed model, y ~ fixed factors + (1 | group), fit by REML
+#for many outcome columns at once; reproduces the lmerTest / emmeans / effectsize
+#output used in stats_sip.r and stats_tbc.r (Satterthwaite df, Sidak contrasts)
+
+THETA_GRID = np.r_[0.0, np.logspace(-3, 2, 60)]
+GOLDEN_ITER = 80
+STEP = 1e-4
+
+
+def _factor(data, f, lv=None):
+    #(levels, codes); a cohort.CohortStore keeps its factors coded already
+    if hasattr(data, 'cells'):
+        return data.recode(f, lv or None)
+    lv = lv or sorted(pd.unique(data[f].dropna()))
+    return list(lv), pd.Categorical(data[f], categories=lv).codes
+
+
+def design_matrix(data, factors, levels=None):
+    #treatment coding, first level is the reference (R's contr.treatment)
+    levels = dict(levels or {})
+    cols = [np.ones(len(data))]
+    names = ['(Intercept)']
+    terms = {}
+    for f in factors:
+        lv, codes = _factor(data, f, levels.get(f))
+        levels[f] = lv
+        idx = []
+        for k, level in enumerate(lv[1:], start=1):
+            cols.append((codes == k).astype(np.float64))
+            idx.append(len(names))
+            names.append(f'{f}{level}')
+        terms[f] = idx
+    return np.column_stack(cols), names, terms, levels
+
+
+def _sufficient_stats(X, Y, groups):
+    #everything REML needs, per outcome, as group sums (n x n never formed)
+    M = ~np.isnan(Y)
+    Y0 = np.where(M, Y, 0.0)
+    Mf = M.astype(np.float64)
+    codes, uniq = pd.factorize(groups)
+    Z = np.zeros((len(groups), len(uniq)))
+    Z[np.arange(len(groups)), codes] = 1.0
+    return {
+        'n': Mf.sum(axis=1),
+        'XtX': np.einsum('on,np,nq->opq', Mf, X, X),
+        'Xty': np.einsum('on,np->op', Y0, X),
+        'yty': (Y0 * Y0).sum(axis=1),
+        'N': Mf @ Z,
+        'S': np.einsum('on,ng,np->ogp', Mf, Z, X),
+        'T': Y0 @ Z,
+        'p': X.shape[1],
+        'groups': uniq,
+    }
+
+
+def _gls(st, lam):
+    #A = X'V0^-1 X, b = X'V0^-1 y, q = y'V0^-1 y with V0 = I + lam ZZ'
+    c = lam[:, None] / (1.0 + lam[:, None] * st['N'])
+    A = st['XtX'] - np.einsum('og,ogp,ogq->opq', c, st['S'], st['S'])
+    b = st['Xty'] - np.einsum('og,ogp,og->op', c, st['S'], st['T'])
+    q = st['yty'] - (c * st['T'] ** 2).sum(axis=1)
+    beta = np.linalg.solve(A, b[..., None])[..., 0]
+    rss = q - (b * beta).sum(axis=1)
+    return A, beta, rss
+
+
+def _profiled_deviance(st, theta):
+    lam = theta ** 2
+    A, _, rss = _gls(st, lam)
+    logdet_v = np.log1p(lam[:, None] * st['N']).sum(axis=1)
+    _, logdet_a = np.linalg.slogdet(A)
+    dof = st['n'] - st['p']
+    return logdet_v + logdet_a + dof * np.log(np.maximum(rss, 1e-300) / dof)
+
+
+def _deviance(st, theta, sigma):
+    #REML deviance in lme4's (theta, sigma) parameters, constants dropped
+    lam = theta ** 2
+    s2 = sigma ** 2
+    A, _, rss = _gls(st, lam)
+    logdet_v = np.log1p(lam[:, None] * st['N']).sum(axis=1)
+    _, logdet_a = np.linalg.slogdet(A)
+    return (st['n'] - st['p']) * np.log(s2) + logdet_v + logdet_a + rss / s2
+
+
+def _vcov(st, theta, sigma):
+    A, _, _ = _gls(st, theta ** 2)
+    return sigma[:, None, None] ** 2 * np.linalg.inv(A)
+
+
+def _optimize_theta(st):
+    #coarse grid then golden section, vectorized over outcomes
+    n_out = len(st['n'])
+    grid = np.array([_profiled_deviance(st, np.full(n_out, t)) for t in THETA_GRID])
+    k = np.nanargmin(grid, axis=0)
+    lo = THETA_GRID[np.maximum(k - 1, 0)]
+    hi = THETA_GRID[np.minimum(k + 1, len(THETA_GRID) - 1)]
+    g = (np.sqrt(5) - 1) / 2
+    a, b = lo.copy(), hi.copy()
+    c, d = b - g * (b - a), a + g * (b - a)
+    fc, fd = _profiled_deviance(st, c), _profiled_deviance(st, d)
+    for _ in range(GOLDEN_ITER):
+        left = fc < fd
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        c_new = b - g * (b - a)
+        d_new = a + g * (b - a)
+        c, d = np.where(left, c_new, d), np.where(left, c, d_new)
+        fc_new = _profiled_deviance(st, c)
+        fd_new = _profiled_deviance(st, d)
+        fc, fd = np.where(left, fc_new, fd), np.where(left, fc, fd_new)
+    theta = (a + b) / 2
+    #a zero variance component (singular fit) sits on the boundary
+    at_zero = _profiled_deviance(st, np.zeros(n_out)) <= _profiled_deviance(st, theta) + 1e-8
+    return np.where(at_zero, 0.0, theta)
+
+
+def _hessian(f, x, h):
+    #central second differences of f: (O, k) -> (O,), vectorized over outcomes
+    k = x.shape[1]
+    H = np.empty((x.shape[0], k, k))
+    f0 = f(x)
+    for i in range(k):
+        ei = np.zeros(k)
+        ei[i] = 1
+        di = h[:, i:i + 1] * ei
+        H[:, i, i] = (f(x + di) - 2 * f0 + f(x - di)) / h[:, i] ** 2
+        for j in range(i + 1, k):
+            ej = np.zeros(k)
+            ej[j] = 1
+            dj = h[:, j:j + 1] * ej
+            H[:, i, j] = H[:, j, i] = (f(x + di + dj) - f(x + di - dj) - f(x - di + dj)
+                                       + f(x - di - dj)) / (4 * h[:, i] * h[:, j])
+    return H
+
+
+def _jacobian(f, x, h):
+    k = x.shape[1]
+    out = []
+    for i in range(k):
+        ei = np.zeros(k)
+        ei[i] = 1
+        di = h[:, i:i + 1] * ei
+        out.append((f(x + di) - f(x - di)) / (2 * h[:, i].reshape((-1,) + (1,) * (f(x).ndim - 1))))
+    return np.stack(out, axis=1)
+
+
+class MixedModelFit:
+    #results for all outcomes; per-outcome tables through the methods below
+
+    def __init__(self, outcomes, names, terms, levels, st, theta, sigma, beta, vcov,
+                 jac, varpar_cov):
+        self.outcomes = list(outcomes)
+        self.names = names
+        self.terms = terms
+        self.levels = levels
+        self.st = st
+        self.theta = theta
+        self.sigma = sigma
+        self.beta = beta
+        self.vcov = vcov
+        self.jac = jac
+        self.varpar_cov = varpar_cov
+
+    def _index(self, outcome):
+        return self.outcomes.index(outcome)
+
+    def satterthwaite(self, o, L):
+        #df for each row of L (contrast vectors) of outcome o
+        L = np.atleast_2d(L)
+        var = np.einsum('kp,pq,kq->k', L, self.vcov[o], L)
+        grad = np.einsum('kp,ipq,kq->ki', L, self.jac[o], L)
+        denom = np.einsum('ki,ij,kj->k', grad, self.varpar_cov[o], grad)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return var, 2 * var ** 2 / denom
+
+    def _contest(self, o, L):
+        #multi-df F test of L beta = 0 (lmerTest contestMD)
+        VL = L @ self.vcov[o] @ L.T
+        d, P = np.linalg.eigh(VL)
+        keep = d > 1e-8 * max(d.max(), 1e-300)
+        d, P = d[keep], P[:, keep]
+        PL = P.T @ L
+        t2 = (PL @ self.beta[o]) ** 2 / d
+        q = len(d)
+        F = t2.sum() / q
+        _, nu = self.satterthwaite(o, PL)
+        if q == 1 or np.allclose(nu, nu[0], atol=1e-8):
+            ddf = nu[0]
+        elif np.any(nu <= 2):
+            ddf = 2.0
+        else:
+            E = np.sum(nu / (nu - 2))
+            ddf = 2 * E / (E - q)
+        return F, q, ddf
+
+    def anova(self, outcome):
+        o = self._index(outcome)
+        rows = []
+        for term, idx in self.terms.items():
+            L = np.zeros((len(idx), len(self.names)))
+            L[np.arange(len(idx)), idx] = 1.0
+            F, q, ddf = self._contest(o, L)
+            s2 = self.sigma[o] ** 2
+            rows.append({'term': term, 'Sum Sq': F * q * s2, 'Mean Sq': F * s2, 'NumDF': q,
+                         'DenDF': ddf, 'F value': F, 'Pr(>F)': stats.f.sf(F, q, ddf)})
+        return pd.DataFrame(rows).set_index('term')
+
+    def eta_squared(self, outcome):
+        #partial eta squared from F (effectsize::F_to_eta2)
+        a = self.anova(outcome)
+        eta = a['F value'] * a['NumDF'] / (a['F value'] * a['NumDF'] + a['DenDF'])
+        return pd.DataFrame({'Eta2_partial': eta})
+
+    def fixef(self, outcome):
+        o = self._index(outcome)
+        L = np.eye(len(self.names))
+        var, df = self.satterthwaite(o, L)
+        se = np.sqrt(var)
+        t = self.beta[o] / se
+        return pd.DataFrame({'Estimate': self.beta[o], 'Std. Error': se, 'df': df,
+                             't value': t, 'Pr(>|t|)': 2 * stats.t.sf(np.abs(t), df)},
+                            index=self.names)
+
+    def varcomp(self, outcome):
+        o = self._index(outcome)
+        sigma = self.sigma[o]
+        return pd.DataFrame({'Variance': [(self.theta[o] * sigma) ** 2, sigma ** 2],
+                             'Std.Dev.': [self.theta[o] * sigma, sigma]},
+                            index=['patient_num (Intercept)', 'Residual'])
+
+    def _emm_matrix(self, factor):
+        #reference grid rows for each level of factor, other factors averaged equally
+        rows = []
+        for k in range(len(self.levels[factor])):
+            row = np.zeros(len(self.names))
+            row[0] = 1.0
+            for term, idx in self.terms.items():
+                if term == factor:
+                    if k > 0:
+                        row[idx[k - 1]] = 1.0
+                else:
+                    row[idx] = 1.0 / len(self.levels[term])
+            rows.append(row)
+        return np.array(rows)
+
+    def emmeans(self, outcome, factor='Condition', level=0.95):
+        o = self._index(outcome)
+        L = self._emm_matrix(factor)
+        var, df = self.satterthwaite(o, L)
+        est = L @ self.beta[o]
+        se = np.sqrt(var)
+        tq = stats.t.ppf(0.5 + level / 2, df)
+        return pd.DataFrame({'emmean': est, 'SE': se, 'df': df, 'lower.CL': est - tq * se,
+                             'upper.CL': est + tq * se},
+                            index=pd.Index(self.levels[factor], name=factor))
+
+    def contrasts(self, outcome, factor='Condition', ref=None, adjust='sidak'):
+        #treatment vs control, p values Sidak-adjusted over the family
+        o = self._index(outcome)
+        lv = self.levels[factor]
+        ref = lv[0] if ref is None else ref
+        E = self._emm_matrix(factor)
+        r = lv.index(ref)
+        others = [k for k in range(len(lv)) if k != r]
+        L = E[others] - E[r]
+        var, df = self.satterthwaite(o, L)
+        est = L @ self.beta[o]
+        se = np.sqrt(var)
+        t = est / se
+        p = 2 * stats.t.sf(np.abs(t), df)
+        if adjust == 'sidak':
+            p = 1 - (1 - p) ** len(others)
+        return pd.DataFrame({'estimate': est, 'SE': se, 'df': df, 't.ratio': t, 'p.value': p},
+                            index=pd.Index([f'{lv[k]} - {ref}' for k in others], name='contrast'))
+
+    def report(self, outcome, factor='Condition', ref=None):
+        parts = [f'=== {outcome} ===',
+                 f'REML fit, {int(self.st["n"][self._index(outcome)])} observations',
+                 '', 'random effects:', self.varcomp(outcome).to_string(),
+                 '', 'fixed effects:', self.fixef(outcome).to_string(),
+                 '', 'ANOVA (type III, Satterthwaite):', self.anova(outcome).to_string(),
+                 '', 'partial eta squared:', self.eta_squared(outcome).to_string(),
+                 '', 'estimated marginal means:', self.emmeans(outcome, factor).to_string(),
+                 '', f'post-hoc vs {ref or self.levels[factor][0]} (sidak):',
+                 self.contrasts(outcome, factor, ref).to_string()]
+        return '\n'.join(parts)
+
+
+def fit_outcomes(data, outcomes, factors, group='patient_num', levels=None):
+    #one REML pass over every outcome column against a shared design matrix
+    X, names, terms, levels = design_matrix(data, factors, levels)
+    #lmer drops incomplete rows model by model; here they are masked per outcome
+    if hasattr(data, 'cells'):
+        Y = data.matrix(outcomes)
+        incomplete = np.zeros(len(data), dtype=bool)
+        for key in list(factors) + [group]:
+            incomplete |= data.recode(key)[1] < 0
+        groups = data.column(group)
+    else:
+        Y = np.array(data[list(outcomes)], dtype=np.float64).T
+        incomplete = data[list(factors) + [group]].isna().any(axis=1).to_numpy()
+        groups = data[group].to_numpy()
+    Y[:, incomplete] = np.nan
+    st = _sufficient_stats(X, Y, groups)
+
+    theta = _optimize_theta(st)
+    lam = theta ** 2
+    _, beta, rss = _gls(st, lam)
+    sigma = np.sqrt(rss / (st['n'] - st['p']))
+
+    x0 = np.column_stack([theta, sigma])
+    h = STEP * np.maximum(np.abs(x0), 1e-2)
+    H = _hessian(lambda x: _deviance(st, x[:, 0], x[:, 1]), x0, h)
+    varpar_cov = 2 * np.linalg.pinv(H)
+    jac = _jacobian(lambda x: _vcov(st, x[:, 0], x[:, 1]), x0, h)
+    vcov = _vcov(st, theta, sigma)
+    return MixedModelFit(outcomes, names, terms, levels, st, theta, sigma, beta, vcov,
+                         jac, varpar_cov)
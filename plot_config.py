@@ -1,18 +1,46 @@
-import matplotlib.pyplot as plt
+import os
+import sys
+
 import numpy as np
 
-plt.style.use('default')
-plt.rcParams['font.sans-serif'] = ['Arial', 'Helvetica']
-plt.rcParams['font.size'] = 8
-plt.rcParams['axes.linewidth'] = 1.0
-plt.rcParams['xtick.major.width'] = 1.0
-plt.rcParams['ytick.major.width'] = 1.0
-plt.rcParams['lines.linewidth'] = 1.8
-plt.rcParams['patch.linewidth'] = 0.8
-plt.rcParams['figure.facecolor'] = 'none'
-plt.rcParams['axes.facecolor'] = 'none'
-plt.rcParams['savefig.facecolor'] = 'none'
-plt.rcParams['savefig.transparent'] = True
+sys.path.insert(0, os.path.dirname(__file__))
+from derived_cache import memoize
+from instrument import traced
+
+#rcParams per figure family, applied by setup_style(); importing this module (e.g. for
+#EVENT_MAP in harmonize/stats) neither loads matplotlib nor touches global state
+STYLES = {
+    'default': {
+        'font.sans-serif': ['Arial', 'Helvetica'],
+        'font.size': 8,
+        'axes.linewidth': 1.0,
+        'xtick.major.width': 1.0,
+        'ytick.major.width': 1.0,
+        'lines.linewidth': 1.8,
+        'patch.linewidth': 0.8,
+        'figure.facecolor': 'none',
+        'axes.facecolor': 'none',
+        'savefig.facecolor': 'none',
+        'savefig.transparent': True,
+    },
+    'safety': {
+        'font.sans-serif': ['Arial'],
+        'font.family': 'sans-serif',
+        'pdf.fonttype': 42,
+        'ps.fonttype': 42,
+        'font.size': 12,
+        'axes.linewidth': 0.5,
+    },
+}
+
+
+def setup_style(name='default'):
+    #reset to matplotlib defaults first, so targets run in one process never inherit
+    #the previous figure's style
+    import matplotlib.pyplot as plt
+    plt.style.use('default')
+    plt.rcParams.update(STYLES[name])
+
 
 CONDITION_COLORS = {
     "OFF": "#E69F00",
@@ -43,10 +71,16 @@ EVENT_MAP = {
 }
 
 
+@traced('plot.get_axis_limits')
+@memoize('get_axis_limits', disk=False)
 def get_axis_limits(data, metric, group_patients=None):
-    if group_patients:
-        data = data[data['patient_num'].isin(group_patients)]
-    values = data[metric].dropna()
+    if hasattr(data, 'cells'):
+        #cohort.CohortStore: per-patient slices instead of a mask over the table
+        values = data.take(metric, group_patients or None)
+    else:
+        if group_patients:
+            data = data[data['patient_num'].isin(group_patients)]
+        values = data[metric].dropna()
     if len(values) == 0:
         return -5, 15
     ymin = max(-5, values.min() - max(1, values.min() * 0.05))
@@ -54,6 +88,7 @@ def get_axis_limits(data, metric, group_patients=None):
     return ymin, ymax
 
 
+@traced('plot.set_nice_ticks')
 def set_nice_ticks(ax, ymin, ymax):
     r = ymax - ymin
     if r <= 20:
@@ -74,6 +109,7 @@ def set_nice_ticks(ax, ymin, ymax):
     ax.set_ylim(ymin - max(step * 0.2, r * 0.08), ymax + step * 0.4)
 
 
+@traced('plot.set_zero_padded_ticks')
 def set_zero_padded_ticks(ax, ymax, pad=5):
     if ymax <= 20:
         step = 5
@@ -91,6 +127,7 @@ def set_zero_padded_ticks(ax, ymax, pad=5):
     ax.set_ylim(-pad, ymax + step * 0.4)
 
 
+@traced('plot.style_axis')
 def style_axis(ax):
     ax.spines[['right', 'top']].set_visible(False)
     ax.tick_params(axis='both', which='major', labelsize=9, pad=3)
@@ -99,6 +136,7 @@ def style_axis(ax):
     ax.patch.set_alpha(0.0)
 
 
+@traced('plot.finalize_axes')
 def finalize_axes(axes):
     for ax in axes:
         ax.tick_params(direction='out', pad=4, labelsize=9, width=1.0)
@@ -108,22 +146,45 @@ def finalize_axes(axes):
         ax.margins(x=0.03)
 
 
-def plot_trajectories(ax, data, patients, metric, marker='o', ls='-'):
+#pivots are shared by every panel drawn from the same data, within a run and across runs
+@traced('plot.trajectory_pivot')
+@memoize('trajectory_pivot')
+def trajectory_pivot(data, metric, agg='first'):
+    pivot = data.pivot_table(index='patient_num', columns='Condition', values=metric,
+                             aggfunc=agg, observed=True)
+    return pivot.reindex(columns=CONDITION_ORDER).astype(float)
+
+
+@traced('plot.plot_trajectories')
+def plot_trajectories(ax, data, patients, metric, marker='o', ls='-', agg='first'):
+    from matplotlib.collections import LineCollection
+    if hasattr(data, 'cells'):
+        #cohort.CohortStore answers the patient x condition matrix directly
+        values, rows = data.cells(metric, agg, CONDITION_ORDER)
+    else:
+        pivot = trajectory_pivot(data, metric, agg)
+        values, rows = pivot.to_numpy(), pivot.index
+    row = {pid: i for i, pid in enumerate(rows)}
+    xs = np.arange(len(CONDITION_ORDER))
+    segments, line_colors, points, point_colors = [], [], [], []
     for pid in patients:
-        if pid not in data['patient_num'].unique():
+        if pid not in row:
             continue
-        pdata = data[data['patient_num'] == pid]
-        xs, ys = [], []
-        for i, cond in enumerate(CONDITION_ORDER):
-            row = pdata[pdata['Condition'] == cond]
-            if len(row) > 0 and not np.isnan(row[metric].iloc[0]):
-                xs.append(i)
-                ys.append(row[metric].iloc[0])
-        if len(xs) > 1:
-            ax.plot(xs, ys, color=PATIENT_COLORS[pid],
-                    marker=marker, linewidth=2.2, markersize=7, alpha=0.9,
-                    markerfacecolor=PATIENT_COLORS[pid],
-                    markeredgecolor='white', markeredgewidth=1.0,
-                    linestyle=ls)
+        ys = values[row[pid]]
+        valid = ~np.isnan(ys)
+        if valid.sum() > 1:
+            seg = np.column_stack([xs[valid], ys[valid]])
+            segments.append(seg)
+            points.append(seg)
+            line_colors.append(PATIENT_COLORS[pid])
+            point_colors.extend([PATIENT_COLORS[pid]] * len(seg))
+    if segments:
+        #one artist for all lines and one for all markers of the group
+        ax.add_collection(LineCollection(segments, colors=line_colors, linewidths=2.2,
+                                         linestyles=ls, alpha=0.9))
+        pts = np.concatenate(points)
+        ax.scatter(pts[:, 0], pts[:, 1], s=7 ** 2, c=point_colors, marker=marker,
+                   alpha=0.9, edgecolors='white', linewidths=1.0, zorder=3)
+        ax.autoscale_view()
     ax.set_xticks(range(len(CONDITION_ORDER)))
-    ax.set_xticklabels(CONDITION_ORDER, fontsize=9)
\ No newline at end of file
+    ax.set_xticklabels(CONDITION_ORDER, fontsize=9)
@@ -0,0 +1,267 @@
+import json
+import os
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from kinstore import write_store
+
+#streaming reader for Summit RC+S session folders (e.g. DeviceNPC700519H): the json
+#arrays are decoded one packet at a time, only the selected fields are kept, and packet
+#and sample times are rebuilt from the device clock in whole-array passes
+
+CHUNK_CHARS = 1 << 20       # text read per refill of the decode buffer
+TICK_S = 1e-4               # systemTick resolution
+TICK_ROLLOVER = 1 << 16     # systemTick is a uint16
+MAX_CLOCK_SLIP = 1.0        # s between tick and timestamp clocks before a new segment starts
+LOCAL_TZ = 'America/Los_Angeles'
+
+TD_RATES = {0: 250.0, 1: 500.0, 2: 1000.0}
+
+#output column -> path inside one AdaptiveLog record, names as in createCombinedTable
+ADAPTIVE_FIELDS = {
+    'Adaptive_CurrentAdaptiveState': ('AdaptiveUpdate', 'CurrentAdaptiveState'),
+    'Adaptive_Ld0_output': ('AdaptiveUpdate', 'Ld0Status', 'output'),
+    'Adaptive_Ld1_output': ('AdaptiveUpdate', 'Ld1Status', 'output'),
+    'Adaptive_CurrentProgramAmplitudesInMilliamps': ('AdaptiveUpdate',
+                                                     'CurrentProgramAmplitudesInMilliamps'),
+    'Adaptive_StimRateInHz': ('AdaptiveUpdate', 'StimRateInHz'),
+}
+#detector outputs exceed float32 integer precision
+WIDE_FIELDS = ('Adaptive_Ld0_output', 'Adaptive_Ld1_output')
+
+STREAMS = {
+    'td': {'file': 'RawDataTD.json', 'key': 'TimeDomainData', 'root': ()},
+    'adaptive': {'file': 'AdaptiveLog.json', 'key': None, 'root': ('AdaptiveUpdate',)},
+}
+
+
+def iter_array(path, key=None, chunk_chars=CHUNK_CHARS):
+    #elements of the json array under `key` (the outermost array if None), decoded one at a
+    #time from a bounded text buffer; a truncated final packet ends the stream quietly
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8', errors='replace') as f:
+        buf, pos, eof = '', 0, False
+
+        def refill():
+            nonlocal buf, pos, eof
+            more = f.read(chunk_chars)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            return not eof
+
+        marker = '[' if key is None else f'"{key}"'
+        while True:
+            #find the next array to stream
+            at = buf.find(marker, pos)
+            while at < 0:
+                keep = len(marker)
+                pos = max(pos, len(buf) - keep)
+                if not refill():
+                    return
+                at = buf.find(marker, pos)
+            pos = at
+            if key is not None:
+                pos += len(marker)
+                while '[' not in buf[pos:]:
+                    if not refill():
+                        return
+                pos = buf.index('[', pos)
+            pos += 1
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos >= len(buf):
+                    if not refill():
+                        return
+                    continue
+                if buf[pos] == ']':
+                    pos += 1
+                    break
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not refill():
+                        return
+                    continue
+                yield obj
+                pos = end
+            if key is None:
+                return
+
+
+def _get(obj, path):
+    for p in path:
+        if not isinstance(obj, dict) or p not in obj:
+            return np.nan
+        obj = obj[p]
+    return obj
+
+
+def _header(rec, root):
+    base = _get(rec, root) if root else rec
+    h = base.get('Header', {}) if isinstance(base, dict) else {}
+    return (h.get('systemTick', 0), h.get('timestamp', {}).get('seconds', 0),
+            h.get('dataTypeSequence', 0), base.get('PacketGenTime', -1) if isinstance(base, dict) else -1)
+
+
+def packet_times(system_tick, seconds, packet_gen_ms):
+    #unix seconds of every packet: unwrapped systemTick within stretches where it agrees
+    #with the 1 s timestamp clock, each stretch anchored to the median PacketGenTime offset
+    tick = np.asarray(system_tick, dtype=np.int64)
+    sec = np.asarray(seconds, dtype=np.float64)
+    gen = np.asarray(packet_gen_ms, dtype=np.float64) / 1000.0
+    if not len(tick):
+        return np.empty(0)
+    dt = np.r_[0, np.mod(np.diff(tick), TICK_ROLLOVER)] * TICK_S
+    dsec = np.r_[0.0, np.diff(sec)]
+    new_seg = (np.abs(dsec - dt) > MAX_CLOCK_SLIP) | (dsec < 0)
+    new_seg[0] = True
+    seg = np.cumsum(new_seg) - 1
+    elapsed = np.cumsum(dt)
+    device = elapsed - elapsed[np.flatnonzero(new_seg)][seg]
+    offsets = pd.Series(np.where(gen > 0, gen - device, np.nan)).groupby(seg).median()
+    #stretches without PacketGenTime fall back to the device timestamp (s since 2000-03-01)
+    fallback = pd.Series(sec + 951868800.0 - device).groupby(seg).median()
+    anchor = offsets.fillna(fallback).to_numpy()
+    return anchor[seg] + device
+
+
+def sample_times(t_packet, n_samples, fs):
+    #last sample of a packet is stamped at the packet time, earlier ones 1/fs apart;
+    #built in place with one temporary alive at a time, sessions run to 1e8+ samples
+    n = np.asarray(n_samples, dtype=np.int64)
+    fs = np.broadcast_to(np.asarray(fs, dtype=np.float64), n.shape)
+    out = np.arange(n.sum(), dtype=np.float64)
+    out -= np.repeat(np.cumsum(n) - n, n)
+    out /= np.repeat(fs, n)
+    out += np.repeat(np.asarray(t_packet) - (n - 1) / fs, n)
+    return out
+
+
+def _unique_packets(tick, seq, t):
+    #packets re-sent by the relay repeat tick and sequence number; keep the first, time order
+    order = np.argsort(t, kind='stable')
+    key = np.stack([np.asarray(tick)[order], np.asarray(seq)[order]])
+    dup = np.r_[False, (np.diff(key, axis=1) == 0).all(axis=0)]
+    return order[~dup]
+
+
+def read_adaptive(path, fields=ADAPTIVE_FIELDS):
+    cols = {name: [] for name in fields}
+    heads = array('d')
+    for rec in iter_array(path, STREAMS['adaptive']['key']):
+        heads.extend(_header(rec, STREAMS['adaptive']['root']))
+        for name, p in fields.items():
+            cols[name].append(_get(rec, p))
+    heads = np.frombuffer(heads, dtype=np.float64).reshape(-1, 4)
+    t = packet_times(heads[:, 0], heads[:, 1], heads[:, 3])
+    keep = _unique_packets(heads[:, 0], heads[:, 2], t)
+    out = {'time_s': t[keep]}
+    for name, values in cols.items():
+        dtype = np.float64 if name in WIDE_FIELDS else np.float32
+        if values and any(isinstance(v, list) for v in values):
+            #fixed-width lists (program amplitudes) become one column per element
+            width = max(len(v) for v in values if isinstance(v, list))
+            arr = np.full((len(values), width), np.nan, dtype=dtype)
+            for i, v in enumerate(values):
+                if isinstance(v, list):
+                    arr[i, :len(v)] = v
+            for j in range(width):
+                out[f'{name}_{j}'] = arr[keep, j]
+        else:
+            out[name] = np.asarray(values, dtype=dtype)[keep]
+    return pd.DataFrame(out)
+
+
+def _ranges(starts, lengths):
+    #concatenated arange(start, start + length) for every pair, without a python loop
+    lengths = np.asarray(lengths, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return np.repeat(np.asarray(starts, dtype=np.int64) - (ends - lengths), lengths) + \
+        np.arange(ends[-1] if len(ends) else 0)
+
+
+def read_time_domain(path, channels=None):
+    #samples of each channel key appended to flat float32 buffers (no per-packet arrays),
+    #sample times rebuilt per packet
+    heads, counts, rates = array('d'), array('q'), array('d')
+    samples = {}
+    total = 0
+    for rec in iter_array(path, STREAMS['td']['key']):
+        heads.extend(_header(rec, ()))
+        rates.append(TD_RATES.get(rec.get('SampleRate'), np.nan))
+        n = 0
+        seen = set()
+        for ch in rec.get('ChannelSamples', []):
+            k = ch['Key']
+            if channels is not None and k not in channels:
+                continue
+            if k not in samples:
+                samples[k] = array('f', [np.nan]) * total
+            samples[k].extend(ch['Value'])
+            n = len(ch['Value'])
+            seen.add(k)
+        for k in samples.keys() - seen:
+            samples[k].extend([np.nan] * n)
+        counts.append(n)
+        total += n
+    heads = np.frombuffer(heads, dtype=np.float64).reshape(-1, 4)
+    counts = np.frombuffer(counts, dtype=np.int64)
+    t = packet_times(heads[:, 0], heads[:, 1], heads[:, 3])
+    keep = _unique_packets(heads[:, 0], heads[:, 2], t)
+    out = {'time_s': sample_times(t[keep], counts[keep], np.frombuffer(rates)[keep])}
+    #packets normally arrive once and in order, then the buffers are used as they are
+    idx = None if np.array_equal(keep, np.arange(len(counts))) else \
+        _ranges((np.cumsum(counts) - counts)[keep], counts[keep])
+    for k in sorted(samples):
+        #release each raw buffer as soon as its channel is gathered
+        flat = np.frombuffer(samples.pop(k), dtype=np.float32)
+        out[f'key{k}'] = flat if idx is None else flat[idx]
+    return pd.DataFrame(out, copy=False)
+
+
+def with_local_time(df, tz=LOCAL_TZ):
+    #localTime as in ProcessRCS, for alignment.align_streams
+    df['localTime'] = pd.to_datetime(df['time_s'], unit='s', utc=True).dt.tz_convert(tz)
+    return df
+
+
+def _read_streams(device_dir, streams, adaptive_fields=ADAPTIVE_FIELDS, td_channels=None):
+    #(name, DataFrame) of each stream present in the device folder, read one at a time
+    for name in streams:
+        path = os.path.join(device_dir, STREAMS[name]['file'])
+        if not os.path.exists(path):
+            continue
+        if name == 'adaptive':
+            yield name, read_adaptive(path, adaptive_fields)
+        else:
+            yield name, read_time_domain(path, td_channels)
+
+
+def load_session(device_dir, streams=('td', 'adaptive'), adaptive_fields=ADAPTIVE_FIELDS,
+                 td_channels=None):
+    #{stream: DataFrame} for the requested streams of one device folder
+    return {name: with_local_time(df)
+            for name, df in _read_streams(device_dir, streams, adaptive_fields, td_channels)}
+
+
+def convert_session(device_dir, out_dir, streams=('td', 'adaptive'), **kwargs):
+    #typed, memory-mapped copies (kinstore format) of the selected streams; one stream is
+    #decoded at a time and no localTime column is built, the store keeps time_s
+    paths = {}
+    for name, df in _read_streams(device_dir, streams, **kwargs):
+        data = {c: df[c].to_numpy() for c in df.columns if c != 'time_s'}
+        dtypes = {c: str(v.dtype) for c, v in data.items()}
+        paths[name] = write_store(os.path.join(out_dir, name), df['time_s'].to_numpy(), data, dtypes)
+        del df, data
+    return paths
+
+
+if __name__ == '__main__':
+    #python rcs_loader.py data/Neural/DeviceNPC700519H out_dir
+    for name, path in convert_session(sys.argv[1], sys.argv[2]).items():
+        print(f'{name}: {path}')
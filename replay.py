@@ -0,0 +1,141 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#controller settings used in the study (Fig 3)
+ARR_CONTROLLER = {'on_threshold': 0.09, 'off_threshold': 0.09}
+PFOG_CONTROLLER = {'on_threshold': 0.7, 'off_threshold': 0.3}
+
+DEFAULTS = {
+    'on_threshold': 0.5,
+    'off_threshold': 0.5,
+    'ramp_rate': np.inf,     # mA/s, inf switches the amplitude instantly
+    'dwell': 0.0,            # s a state must be held before it can change
+    'amp_off': 0.0,          # mA
+    'amp_on': 3.0,           # mA
+    'pulse_width': 60.0,     # us
+    'stim_rate': 140.0,      # Hz
+}
+PARAMS = list(DEFAULTS)
+CHUNK_SIZE = 4096
+
+
+def _as_params(params, n=None):
+    out = {}
+    for name, default in DEFAULTS.items():
+        val = np.asarray(params.get(name, default), dtype=np.float64)
+        out[name] = val
+    n = n or max(v.size for v in out.values())
+    return {k: np.broadcast_to(v, (n,)).copy() for k, v in out.items()}, n
+
+
+def replay(times, signal, params, initial_state=0):
+    #re-run the on/off state machine over one recorded trace for P parameter sets
+    #at once; time advances sample by sample, parameters are vectorized
+    t = np.asarray(times, dtype=np.float64)
+    x = np.asarray(signal, dtype=np.float64)
+    p, n = _as_params(params)
+
+    state = np.full(n, bool(initial_state))
+    held = np.full(n, np.inf)
+    amp = np.where(state, p['amp_on'], p['amp_off'])
+    time_on = np.zeros(n)
+    amp_integral = np.zeros(n)
+    switches = np.zeros(n, dtype=np.int64)
+    instant = np.isinf(p['ramp_rate'])
+    rate = np.where(instant, 0.0, p['ramp_rate'])
+
+    for i in range(len(t)):
+        dt = t[i] - t[i - 1] if i else 0.0
+        time_on += dt * state
+        amp_integral += dt * amp
+        held += dt
+        xi = x[i]
+        if xi == xi:
+            free = held >= p['dwell']
+            turn_on = ~state & (xi > p['on_threshold']) & free
+            turn_off = state & (xi < p['off_threshold']) & free
+            flip = turn_on | turn_off
+            if flip.any():
+                state ^= flip
+                held[flip] = 0.0
+                switches += flip
+        target = np.where(state, p['amp_on'], p['amp_off'])
+        step = np.where(instant, np.inf, rate * dt)
+        amp = amp + np.clip(target - amp, -step, step)
+
+    duration = t[-1] - t[0] if len(t) else 0.0
+    result = pd.DataFrame({name: p[name] for name in PARAMS})
+    result['duration_s'] = duration
+    result['time_on_s'] = time_on
+    result['fraction_on'] = time_on / duration if duration > 0 else np.nan
+    result['switches'] = switches
+    #mA * us = nC per pulse, times pulses per second and seconds -> uC
+    result['charge_uC'] = amp_integral * p['pulse_width'] * p['stim_rate'] / 1000.0
+    return result
+
+
+def parameter_grid(**ranges):
+    #cartesian product of parameter ranges as flat arrays; scalars are held fixed
+    names = list(ranges)
+    axes = [np.atleast_1d(np.asarray(ranges[k], dtype=np.float64)) for k in names]
+    mesh = np.meshgrid(*axes, indexing='ij')
+    grid = {k: m.ravel() for k, m in zip(names, mesh)}
+    if 'off_threshold' not in grid and 'on_threshold' in grid:
+        #single-threshold controller unless a hysteresis band is given
+        grid['off_threshold'] = grid['on_threshold']
+    if 'off_threshold' in grid and 'on_threshold' in grid:
+        #an off threshold above the on threshold is not a hysteresis band
+        ok = grid['off_threshold'] <= grid['on_threshold']
+        grid = {k: v[ok] for k, v in grid.items()}
+    return grid
+
+
+def log_trace(log, metric):
+    #controller trace from read_java_log, clipped to the span the metric was reported
+    valid = log[metric].notna().to_numpy()
+    if not valid.any():
+        return np.empty(0), np.empty(0)
+    first = np.argmax(valid)
+    last = len(valid) - 1 - np.argmax(valid[::-1])
+    block = log.iloc[first:last + 1]
+    return block['time_ms'].to_numpy() / 1000.0, block[metric].to_numpy(dtype=np.float64)
+
+
+def _replay_task(args):
+    key, times, signal, chunk = args
+    res = replay(times, signal, chunk)
+    res.insert(0, 'session', key)
+    return res
+
+
+def sweep(traces, grid, workers=None, chunk_size=CHUNK_SIZE):
+    #traces: {session: (times, signal)}; every session is replayed under every
+    #parameter set, parameter chunks and sessions are spread over a process pool
+    grid, n = _as_params(grid)
+    tasks = []
+    for key, (times, signal) in traces.items():
+        for start in range(0, n, chunk_size):
+            chunk = {k: v[start:start + chunk_size] for k, v in grid.items()}
+            tasks.append((key, times, signal, chunk))
+    if not tasks:
+        return pd.DataFrame()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        parts = [_replay_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(_replay_task, tasks))
+    return pd.concat(parts, ignore_index=True)
+
+
+def best_parameters(results, max_fraction_on=None, by='session', score='switches'):
+    #per-session parameter set with the fewest switches (or other score) that keeps
+    #time on stim under max_fraction_on
+    res = results
+    if max_fraction_on is not None:
+        res = res[res['fraction_on'] <= max_fraction_on]
+    idx = res.groupby(by)[score].idxmin()
+    return res.loc[idx].reset_index(drop=True)
@@ -0,0 +1,123 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from plot_config import CONDITION_ORDER
+
+#resampling inference for paired condition contrasts: within-patient permutations of the
+#two compared labels (sign flips of the paired differences) for p values, patient-level
+#(cluster) bootstrap for confidence intervals; resamples are index/sign matrices
+#evaluated in chunks, optionally across processes
+
+CHUNK = 5000
+TREATMENT = 'KaDBS'
+CONTROLS = ('OFF', 'cDBS', 'iDBS')
+
+
+def cell_means(data, outcomes, condition='Condition', group='patient_num',
+               levels=CONDITION_ORDER):
+    #patient x condition x outcome means (tasks and repeat visits averaged first)
+    if hasattr(data, 'cells'):
+        #cohort.CohortStore: one bincount per outcome
+        cells = [data.cells(o, 'mean', levels) for o in outcomes]
+        return np.stack([c[0] for c in cells], axis=2), cells[0][1]
+    means = data.groupby([group, condition], observed=True)[list(outcomes)].mean()
+    patients = sorted(means.index.get_level_values(0).unique())
+    full = pd.MultiIndex.from_product([patients, list(levels)])
+    cells = means.reindex(full).to_numpy(dtype=np.float64)
+    return cells.reshape(len(patients), len(levels), len(outcomes)), patients
+
+
+def sign_flips(n, n_patients, n_contrasts, rng):
+    #(n, patients, contrasts) of +-1: swapping the two compared labels of a patient
+    #(for every outcome at once) flips the sign of that patient's paired differences
+    return np.where(rng.random((n, n_patients, n_contrasts)) < 0.5, -1.0, 1.0)
+
+
+def bootstrap_indices(n_patients, n, rng):
+    #(n, patients): patients drawn with replacement
+    return rng.integers(0, n_patients, size=(n, n_patients))
+
+
+def _contrast_stat(d):
+    #mean paired difference over the patients with both cells; d: (..., patients, K, O)
+    valid = ~np.isnan(d)
+    with np.errstate(invalid='ignore'):
+        return np.where(valid, d, 0.0).sum(axis=-3) / valid.sum(axis=-3)
+
+
+def _perm_chunk(args):
+    diffs, observed_stat, n, seed = args
+    rng = np.random.default_rng(seed)
+    signs = sign_flips(n, diffs.shape[0], diffs.shape[1], rng)
+    stat = _contrast_stat(signs[..., None] * diffs)
+    return (np.abs(stat) >= np.abs(observed_stat) - 1e-12).sum(axis=0)
+
+
+def _boot_chunk(args):
+    diffs, n, seed = args
+    rng = np.random.default_rng(seed)
+    idx = bootstrap_indices(diffs.shape[0], n, rng)
+    #index matrix -> resample counts, so each chunk is one matrix product
+    counts = np.zeros((n, diffs.shape[0]))
+    np.add.at(counts, (np.arange(n)[:, None], idx), 1.0)
+    valid = ~np.isnan(diffs)
+    flat = np.where(valid, diffs, 0.0).reshape(diffs.shape[0], -1)
+    with np.errstate(invalid='ignore'):
+        stat = (counts @ flat) / (counts @ valid.reshape(diffs.shape[0], -1))
+    return stat.reshape((n,) + diffs.shape[1:])
+
+
+def _chunks(n, chunk, seed):
+    sizes = [min(chunk, n - i) for i in range(0, n, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return sizes, seeds
+
+
+def _run(fn, jobs, workers):
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, jobs))
+    return [fn(j) for j in jobs]
+
+
+def resample_contrasts(data, outcomes, treatment=TREATMENT, controls=CONTROLS,
+                       n_perm=10000, n_boot=10000, level=0.95, chunk=CHUNK, workers=None,
+                       seed=0, condition='Condition', group='patient_num', levels=CONDITION_ORDER):
+    #every outcome x (treatment - control) contrast at once; results do not depend on
+    #the number of workers, each chunk has its own seed
+    cells, patients = cell_means(data, outcomes, condition, group, levels)
+    levels = list(levels)
+    pairs = np.array([(levels.index(treatment), levels.index(c)) for c in controls])
+    diffs = cells[:, pairs[:, 0]] - cells[:, pairs[:, 1]]
+    estimate = _contrast_stat(diffs)
+    n_pairs = (~np.isnan(diffs)).sum(axis=0)
+
+    sizes, seeds = _chunks(n_perm, chunk, [seed, 0])
+    hits = sum(_run(_perm_chunk, [(diffs, estimate, n, s) for n, s in zip(sizes, seeds)],
+                    workers))
+    p_perm = (hits + 1) / (n_perm + 1)
+
+    sizes, seeds = _chunks(n_boot, chunk, [seed, 1])
+    boot = np.concatenate(_run(_boot_chunk, [(diffs, n, s) for n, s in zip(sizes, seeds)],
+                               workers))
+    alpha = (1 - level) / 2
+    lo, hi = np.nanquantile(boot, [alpha, 1 - alpha], axis=0)
+
+    k, o = np.meshgrid(np.arange(len(controls)), np.arange(len(outcomes)), indexing='ij')
+    k, o = k.ravel(), o.ravel()
+    return pd.DataFrame({
+        'outcome': np.asarray(outcomes)[o],
+        'contrast': [f'{treatment} - {controls[i]}' for i in k],
+        'estimate': estimate[k, o],
+        'n_patients': n_pairs[k, o],
+        'ci_low': lo[k, o],
+        'ci_high': hi[k, o],
+        'p_perm': p_perm[k, o],
+        'n_perm': n_perm,
+        'n_boot': n_boot,
+    })
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from derived_cache import memoize
+from instrument import traced
+
+SYMPTOM_MAPPING = {
+    'did_have_any_feelings_of_Nausea': 'Nausea',
+    'did_have_any_feelings_of_Pulling': 'Pulling',
+    'did_have_any_feelings_of_Tingling': 'Tingling',
+    'did_have_any_feelings_of_Dizziness': 'Dizziness',
+    'did_have_any_feelings_of_Imbalance': 'Imbalance',
+    'did_have_any_feelings_of_Other': 'Other',
+    'did_have_any_feelings_of_Noneoftheabove': 'None'
+}
+NONE_LABEL = 'None'
+
+
+@traced('reshape.tabulate_symptoms')
+@memoize('tabulate_symptoms')
+def tabulate_symptoms(sources, cohorts, symptoms=SYMPTOM_MAPPING,
+                      id_col='patientid', event_col='redcap_event_name'):
+    #sources: {name: REDCap export}; cohorts: {cohort: (source, event, pids)}
+    #one isin prefilter, one join and one groupby for every (event, cohort) pair
+    if isinstance(sources, pd.DataFrame):
+        sources = {None: sources}
+    cols = [c for c in symptoms]
+    frames = []
+    for name, df in sources.items():
+        part = df.reindex(columns=[id_col, event_col] + cols)
+        part.insert(0, 'source', name)
+        frames.append(part)
+    data = pd.concat(frames, ignore_index=True)
+    data[event_col] = data[event_col].astype(object)
+
+    keys = pd.DataFrame([(cohort, src, event, pid)
+                         for cohort, (src, event, pids) in cohorts.items() for pid in pids],
+                        columns=['cohort', 'source', event_col, id_col])
+    data = data[data[event_col].isin(keys[event_col].unique()) &
+                data[id_col].isin(keys[id_col].unique())]
+    rows = keys.merge(data, on=['source', event_col, id_col], how='inner')
+
+    cohort_index = pd.Index(list(cohorts), name='cohort')
+    counts = rows.groupby('cohort', sort=False)[cols].sum().reindex(cohort_index).fillna(0)
+    counts = counts.astype(np.int64).rename(columns=symptoms)
+    n_total = rows.groupby('cohort', sort=False).size().reindex(cohort_index).fillna(0)
+
+    total = counts.sum(axis=1).to_numpy()[:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = np.where(total > 0, counts.to_numpy() / total * 100, 0.0)
+    percent = pd.DataFrame(pct, index=counts.index, columns=counts.columns)
+
+    table = counts.stack().rename('count').to_frame()
+    table['percent'] = percent.stack()
+    table = table.reset_index().rename(columns={'level_1': 'symptom'})
+    table['source'] = table['cohort'].map({c: v[0] for c, v in cohorts.items()})
+    table['event'] = table['cohort'].map({c: v[1] for c, v in cohorts.items()})
+    table['n_participants'] = table['cohort'].map(n_total).astype(np.int64)
+    table['n_symptom_free'] = table['cohort'].map(counts[NONE_LABEL]).astype(np.int64)
+    return table[['cohort', 'source', 'event', 'symptom', 'count', 'percent',
+                  'n_participants', 'n_symptom_free']]
+
+
+def cohort_percentages(table, cohort):
+    sub = table[table['cohort'] == cohort]
+    return dict(zip(sub['symptom'], sub['percent']))
+
+
+def cohort_counts(table, cohort):
+    #(n participants, n symptom-free, n with any symptom)
+    sub = table[table['cohort'] == cohort].iloc[0]
+    n, n_none = int(sub['n_participants']), int(sub['n_symptom_free'])
+    return n, n_none, n - n_none
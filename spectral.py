@@ -0,0 +1,261 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+from scipy.signal.windows import dpss
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fog import P_THRESHOLD
+from rcs_loader import TD_RATES
+
+#power spectra of RC+S time-domain channels split by aligned labels (adaptive state,
+#freezing vs walking). Segments are strided views over every channel at once; each chunk
+#of segments is tapered and transformed in one float32 rfft batch, and only per-label
+#sums leave the chunk, so memory is bounded by the chunk size however long the session.
+#Averaging the segment periodograms of a label is Welch's estimate for that label
+#(or the multitaper estimate with method='multitaper').
+
+SEGMENT_S = 1.0             # s per periodogram (1 Hz resolution)
+STEP_S = 0.5                # s between segment starts (50% overlap)
+FMAX = 100.0                # Hz kept in the spectra tables
+MT_NW = 2.0                 # multitaper time-bandwidth product, 2 * NW - 1 tapers
+GAP_SAMPLES = 2             # segments spanning more missing samples than this are dropped
+LABEL_MAX_AGE_S = 5.0       # a label older than this at the segment centre is unknown
+CHUNK_SAMPLES = 1 << 22     # tapered samples per rfft batch (16 MB of float32)
+BANDS = {'beta': (13.0, 30.0)}
+STATE_COL = 'Adaptive_CurrentAdaptiveState'
+
+
+def tapers(n, method='welch', nw=MT_NW):
+    #(K, n) float32, every taper with the same energy
+    if method == 'welch':
+        return np.hanning(n)[None].astype(np.float32)
+    if method == 'multitaper':
+        return np.atleast_2d(dpss(n, nw, Kmax=max(int(2 * nw) - 1, 1))).astype(np.float32)
+    raise ValueError(f"method must be 'welch' or 'multitaper', not {method!r}")
+
+
+def periodograms(frames, fs, taper):
+    #frames: (..., n) float32 -> (..., n // 2 + 1) one-sided power density, float32
+    n = frames.shape[-1]
+    x = frames - frames.mean(axis=-1, keepdims=True)
+    spec = sp_fft.rfft(x[..., None, :] * taper, axis=-1, workers=-1)
+    p = (spec.real * spec.real + spec.imag * spec.imag).mean(axis=-2)
+    p *= 2.0 / (fs * float((taper[0] * taper[0]).sum()))
+    p[..., 0] /= 2
+    if n % 2 == 0:
+        p[..., -1] /= 2
+    return p
+
+
+def _source(td, channels=None):
+    #rcs_loader.read_time_domain frame or its kinstore copy (rcs_loader.convert_session);
+    #store channels stay memory-mapped and are read one chunk at a time
+    if hasattr(td, 'channel'):
+        names = list(channels or [c for c in td.channels if c.startswith('key')])
+        return td.time, [td.channel(c) for c in names], names
+    names = list(channels or [c for c in td.columns if c.startswith('key')])
+    return td['time_s'].to_numpy(dtype=np.float64), \
+        [td[c].to_numpy(dtype=np.float32) for c in names], names
+
+
+def sample_rate(t, probe=100000):
+    #median sample interval, snapped to the nearest RC+S rate
+    fs = 1.0 / np.median(np.diff(np.asarray(t[:probe], dtype=np.float64)))
+    rates = np.array(sorted(set(TD_RATES.values())))
+    nearest = rates[np.argmin(np.abs(rates - fs))]
+    return float(nearest) if abs(nearest - fs) < 0.05 * nearest else float(fs)
+
+
+def iter_psd(td, channels=None, fs=None, segment_s=SEGMENT_S, step_s=STEP_S,
+             method='welch', fmax=FMAX, chunk_samples=CHUNK_SAMPLES):
+    #yields (segment centres (w,), psd (w, channels, freqs) float32, freqs, names) per chunk;
+    #segments across a gap in the sample clock are skipped
+    time, data, names = _source(td, channels)
+    if len(time) < 2 or not names:
+        return
+    fs = fs or sample_rate(time)
+    n = int(round(segment_s * fs))
+    step = max(int(round(step_s * fs)), 1)
+    taper = tapers(n, method)
+    freqs = sp_fft.rfftfreq(n, 1.0 / fs)
+    keep = freqs <= fmax
+    total = (len(time) - n) // step + 1 if len(time) >= n else 0
+    per_chunk = max(chunk_samples // (n * len(names) * len(taper)), 1)
+    for w0 in range(0, total, per_chunk):
+        w = min(per_chunk, total - w0)
+        i0, i1 = w0 * step, (w0 + w - 1) * step + n
+        t = np.asarray(time[i0:i1], dtype=np.float64)
+        starts = np.arange(w) * step
+        ok = (t[starts + n - 1] - t[starts]) * fs <= n - 1 + GAP_SAMPLES
+        if not ok.any():
+            continue
+        x = np.empty((len(names), i1 - i0), dtype=np.float32)
+        for j, ch in enumerate(data):
+            x[j] = ch[i0:i1]
+        frames = sliding_window_view(x, n, axis=1)[:, ::step][:, ok]
+        psd = periodograms(frames, fs, taper)[..., keep]
+        yield t[starts[ok] + n // 2], np.moveaxis(psd, 0, 1), freqs[keep], names
+
+
+def _step_labels(labels):
+    #{name: (times, values)} -> {name: (sorted times, value codes, categories)}
+    out = {}
+    for name, (times, values) in labels.items():
+        times = np.asarray(times, dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        codes, cats = pd.factorize(pd.Series(np.asarray(values)[order]), sort=True)
+        out[name] = (times[order], codes, list(cats))
+    return out
+
+
+def _label_codes(t, steps, max_age_s):
+    #label codes at t, (len(t), labels), -1 where no label is recent enough
+    codes = np.empty((len(t), len(steps)), dtype=np.int64)
+    for j, (times, vcodes, _) in enumerate(steps.values()):
+        if not len(times):
+            codes[:, j] = -1
+            continue
+        i = np.searchsorted(times, t, side='right') - 1
+        ok = (i >= 0) & (t - times[np.maximum(i, 0)] <= max_age_s)
+        codes[:, j] = np.where(ok, vcodes[np.maximum(i, 0)], -1)
+    return codes
+
+
+def state_spectra(td, labels=None, channels=None, bands=BANDS, max_age_s=LABEL_MAX_AGE_S,
+                  **kwargs):
+    #mean PSD per combination of labels and channel, plus band power of every segment.
+    #labels: {name: (times, values)} on the td clock, e.g. state_labels(adaptive);
+    #segments where any label is unknown are left out of the spectra
+    steps = _step_labels(labels or {})
+    categories = {name: v[2] for name, v in steps.items()}
+    sums, counts, windows = {}, {}, []
+    freqs = names = None
+    for t, psd, freqs, names in iter_psd(td, channels, **kwargs):
+        codes = _label_codes(t, steps, max_age_s)
+        power = {}
+        df = freqs[1] - freqs[0]
+        for band, (lo, hi) in bands.items():
+            sel = (freqs >= lo) & (freqs < hi)
+            power[band] = psd[..., sel].sum(axis=-1) * np.float32(df)
+        windows.append((t, codes, power))
+        known = (codes >= 0).all(axis=1)
+        if not known.any():
+            continue
+        groups, inverse = np.unique(codes[known], axis=0, return_inverse=True)
+        p = psd[known]
+        finite = np.isfinite(p).all(axis=2)
+        for g, key in enumerate(map(tuple, groups)):
+            sel = inverse.ravel() == g
+            part = np.where(finite[sel][..., None], p[sel], 0)
+            if key not in sums:
+                sums[key] = np.zeros(p.shape[1:])
+                counts[key] = np.zeros(p.shape[1], dtype=np.int64)
+            sums[key] += part.sum(axis=0, dtype=np.float64)
+            counts[key] += finite[sel].sum(axis=0)
+
+    label_cols = list(steps)
+    if names is None:
+        return (pd.DataFrame(columns=label_cols + ['channel', 'freq', 'psd', 'n_segments']),
+                pd.DataFrame(columns=['time_s'] + label_cols))
+    rows = []
+    for key in sorted(sums):
+        n = counts[key]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums[key] / n[:, None]
+        block = pd.DataFrame({
+            'channel': np.repeat(names, len(freqs)),
+            'freq': np.tile(freqs, len(names)),
+            'psd': mean.ravel().astype(np.float32),
+            'n_segments': np.repeat(n, len(freqs)),
+        })
+        for col, code in zip(label_cols, key):
+            block.insert(label_cols.index(col), col, categories[col][code])
+        rows.append(block)
+    spectra = pd.concat(rows, ignore_index=True) if rows else \
+        pd.DataFrame(columns=label_cols + ['channel', 'freq', 'psd', 'n_segments'])
+
+    #names is set once a chunk has been read, so windows is not empty here
+    per_segment = {'time_s': np.concatenate([w[0] for w in windows])}
+    codes = np.concatenate([w[1] for w in windows])
+    for j, col in enumerate(label_cols):
+        per_segment[col] = pd.Categorical.from_codes(codes[:, j], categories[col])
+    for band in bands:
+        power = np.concatenate([w[2][band] for w in windows])
+        for j, ch in enumerate(names):
+            per_segment[f'{ch}_{band}'] = power[:, j]
+    return spectra, pd.DataFrame(per_segment)
+
+
+def band_power(spectra, bands=BANDS):
+    #integrate the spectra over each band, one row per label combination and channel
+    by = [c for c in spectra.columns if c not in ('freq', 'psd', 'n_segments')]
+    freqs = np.unique(spectra['freq'])
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else 1.0
+    out = spectra.groupby(by, sort=False, observed=True)['n_segments'].first().to_frame()
+    for band, (lo, hi) in bands.items():
+        sel = spectra[(spectra['freq'] >= lo) & (spectra['freq'] < hi)]
+        out[band] = sel.groupby(by, sort=False, observed=True)['psd'].sum() * df
+    return out.reset_index()
+
+
+def pooled(spectra, by):
+    #segment-weighted mean spectra over everything not in `by` (e.g. across sessions)
+    keys = list(by) + ['channel', 'freq']
+    w = spectra.assign(_w=spectra['psd'].astype(np.float64) * spectra['n_segments'])
+    g = w.groupby(keys, sort=True, observed=True)
+    out = g[['_w', 'n_segments']].sum()
+    out['psd'] = (out['_w'] / out['n_segments']).astype(np.float32)
+    return out.drop(columns='_w').reset_index()[keys + ['psd', 'n_segments']]
+
+
+def state_labels(adaptive, col=STATE_COL, time_col='time_s'):
+    #adaptive controller state from rcs_loader.read_adaptive, already on the td clock
+    valid = adaptive[col].notna() & (adaptive[col] >= 0)
+    sub = adaptive.loc[valid]
+    return sub[time_col].to_numpy(dtype=np.float64), sub[col].to_numpy().astype(np.int64)
+
+
+def fog_labels(win, offset_s=0.0, threshold=P_THRESHOLD):
+    #fog.fog_windows output -> 'freezing' / 'walking' on the td clock; offset_s is the
+    #device time of kinematic t = 0 (from alignment)
+    t = win['Time'].to_numpy(dtype=np.float64) + offset_s
+    return t, np.where(win['P_FOG'].to_numpy() >= threshold, 'freezing', 'walking')
+
+
+def batch_spectra(sessions, **kwargs):
+    #sessions: {name: (td, labels)}; one pass per session, tables stacked with a session column
+    spectra, segments = [], []
+    for name, (td, labels) in sessions.items():
+        s, w = state_spectra(td, labels, **kwargs)
+        spectra.append(s.assign(session=name))
+        segments.append(w.assign(session=name))
+    if not spectra:
+        return pd.DataFrame(), pd.DataFrame()
+    spectra = pd.concat(spectra, ignore_index=True)
+    segments = pd.concat(segments, ignore_index=True)
+    first = ['session']
+    return spectra[first + [c for c in spectra.columns if c not in first]], \
+        segments[first + [c for c in segments.columns if c not in first]]
+
+
+if __name__ == '__main__':
+    #python spectral.py data/Neural/DeviceNPC700519H [out_dir]
+    #the session is converted to a kinstore copy under out_dir/session first, so the
+    #spectra read the td channels chunk by chunk from the memory map
+    from kinstore import KinStore
+    from rcs_loader import convert_session
+    device_dir = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else '.'
+    paths = convert_session(device_dir, os.path.join(out_dir, 'session'))
+    labels = {}
+    if 'adaptive' in paths:
+        labels['state'] = state_labels(KinStore(paths['adaptive']).frame(time_col='time_s'))
+    spectra, segments = state_spectra(KinStore(paths['td']), labels)
+    os.makedirs(out_dir, exist_ok=True)
+    spectra.to_csv(os.path.join(out_dir, 'state_spectra.csv'), index=False)
+    segments.to_csv(os.path.join(out_dir, 'segment_band_power.csv'), index=False)
+    print(band_power(spectra).to_string(index=False))
@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+import harmonize
+from cohort import cohort_store
+from lmm import fit_outcomes
+from resampling import resample_contrasts
+from ingest import data_path, load_table
+from plot_config import CONDITION_ORDER
+
+#in-process version of stats_sip.r / stats_tbc.r: same models, one REML pass per analysis
+ANALYSES = {
+    'sip': {'outcomes': ['freezes', 'full_arrhythm', 'mean_shank_av'],
+            'factors': ['Condition']},
+    'tbc': {'outcomes': ['mean_freezing', 'arrhythmicity', 'mean_shankav'],
+            'factors': ['Condition', 'Task']},
+}
+OUT_DIR = 'results'
+
+
+def long_table(name, data_dir='data'):
+    if name == 'sip':
+        raw = load_table(os.path.join(data_dir, 'MergedSIPMetrics.csv'))
+        return harmonize.sip_long(raw, harmonize.SIP_STATS_RULES)
+    return harmonize.tbc_long(load_table(os.path.join(data_dir, 'MergedTBCMetrics.csv')))
+
+
+def run_analysis(name, data=None, data_dir='data'):
+    #data: long table or cohort.CohortStore
+    spec = ANALYSES[name]
+    data = long_table(name, data_dir) if data is None else data
+    store = data if hasattr(data, 'cells') else cohort_store(data)
+    fit = fit_outcomes(store, spec['outcomes'], spec['factors'],
+                       levels={'Condition': CONDITION_ORDER})
+    parts = [fit.report(o, 'Condition', 'OFF') for o in spec['outcomes']]
+    counts = store.value_counts('Condition').reindex(CONDITION_ORDER, fill_value=0)
+    parts.append('sample sizes per condition:\n' + counts.to_string())
+    if 'Task' in spec['factors']:
+        n = store.crosstab('patient_num', 'Condition').reindex(columns=CONDITION_ORDER)
+        parts.append('n points per patient/condition:\n' + n.to_string())
+    return fit, '\n\n'.join(parts)
+
+
+def write_results(names=('sip', 'tbc'), data_dir='data', out_dir=None, n_resamples=10000):
+    out_dir = out_dir or OUT_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    for name in names:
+        data = cohort_store(long_table(name, data_dir))
+        _, text = run_analysis(name, data)
+        path = os.path.join(out_dir, f'stats_{name}_lmm.txt')
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        print(f'saved {path}')
+        #permutation p values and cluster bootstrap CIs for KaDBS vs each control
+        table = resample_contrasts(data, ANALYSES[name]['outcomes'],
+                                   n_perm=n_resamples, n_boot=n_resamples)
+        path = os.path.join(out_dir, f'resampling_{name}.csv')
+        table.to_csv(path, index=False)
+        print(f'saved {path}')
+
+
+if __name__ == '__main__':
+    names = [a for a in sys.argv[1:] if a in ANALYSES] or list(ANALYSES)
+    #python stats.py [sip|tbc] [data_dir [out_dir]]
+    dirs = [a for a in sys.argv[1:] if a not in ANALYSES]
+    write_results(names, dirs[0] if dirs else data_path(), dirs[1] if len(dirs) > 1 else None)
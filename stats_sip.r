@@ -4,29 +4,13 @@ library(emmeans)
 library(effectsize)
 library(dplyr)
 
-raw_data <- read.csv("data/MergedSIPMetrics.csv")
-
-filtered_events <- c('baseline', 'olDBS', 'iolDBSI', 'KaDBSI')
-filtered_data <- raw_data %>% filter(stringvisit %in% filtered_events)
-
-event_name_mapping <- c(
-    'baseline' = 'OFF',
-    'olDBS' = 'cDBS',
-    'KaDBSI' = 'KaDBS',
-    'iolDBSI' = 'iDBS'
-)
-
-filtered_data$Condition <- event_name_mapping[filtered_data$stringvisit]
+# long table from harmonize.py (RCS10 uses the _HD columns)
+# Rscript stats_sip.r [path]; build.py passes the table under --data
+args <- commandArgs(trailingOnly = TRUE)
+filtered_data <- read.csv(if (length(args) > 0) args[1] else "data/SIPLong.csv")
 filtered_data$Condition <- factor(filtered_data$Condition, levels = c("OFF", "cDBS", "KaDBS", "iDBS"))
 filtered_data$patient_num <- factor(filtered_data$patient_num)
 
-for(i in 1:nrow(filtered_data)) {
-  if(filtered_data$patient_num[i] == "RCS10") {
-    filtered_data$freezes[i] = filtered_data$Percent_Freezing_HD[i]
-    filtered_data$full_arrhythm[i] = filtered_data$Average_Arrhythmicity_HD[i]
-  }
-}
-
 outcome_vars <- c("freezes", "full_arrhythm", "mean_shank_av")
 
 run_analysis <- function(outcome_var) {
@@ -38,7 +22,9 @@ run_analysis <- function(outcome_var) {
 
     anova_result <- anova(model)
     eta_sq <- effectsize::eta_squared(model, partial = TRUE)
-    emm <- emmeans(model, "Condition")
+    # Satterthwaite df, as in the anova above and in lmm.py (the emmeans default for
+    # lmer fits is Kenward-Roger)
+    emm <- emmeans(model, "Condition", lmer.df = "satterthwaite")
 
     contrasts <- contrast(emm, method = "trt.vs.ctrl", ref = "OFF", adjust = "sidak")
 
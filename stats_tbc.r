@@ -5,39 +5,10 @@ library(effectsize)
 library(dplyr)
 library(tidyr)
 
-raw_data <- read.csv("data/MergedTBCMetrics.csv")
-
-filtered_events <- c('baseline', 'olDBS', 'iolDBSI', 'KaDBSI')
-raw_filtered <- raw_data %>% filter(stringvisit %in% filtered_events)
-
-event_name_mapping <- c(
-    'baseline' = 'OFF',
-    'olDBS' = 'cDBS',
-    'KaDBSI' = 'KaDBS',
-    'iolDBSI' = 'iDBS'
-)
-
-ellipses <- raw_filtered %>%
-  transmute(
-    patient_num = patient_num,
-    Condition = event_name_mapping[stringvisit],
-    Task = "Ellipses",
-    mean_freezing = Emean_freezing,
-    arrhythmicity = Earrhythmicity_new,
-    mean_shankav = Emean_shankav
-  )
-
-figure8 <- raw_filtered %>%
-  transmute(
-    patient_num = patient_num,
-    Condition = event_name_mapping[stringvisit],
-    Task = "Figure8",
-    mean_freezing = eigmean_freezing,
-    arrhythmicity = eigarrhythmicity_new,
-    mean_shankav = eigmean_shankav
-  )
-
-filtered_data <- bind_rows(ellipses, figure8)
+# long table from harmonize.py, one row per patient/visit/task
+# Rscript stats_tbc.r [path]; build.py passes the table under --data
+args <- commandArgs(trailingOnly = TRUE)
+filtered_data <- read.csv(if (length(args) > 0) args[1] else "data/TBCLong.csv")
 filtered_data$Condition <- factor(filtered_data$Condition, levels = c("OFF", "cDBS", "KaDBS", "iDBS"))
 filtered_data$Task <- factor(filtered_data$Task)
 filtered_data$patient_num <- factor(filtered_data$patient_num)
@@ -53,7 +24,9 @@ run_analysis <- function(outcome_var) {
 
     anova_result <- anova(model)
     eta_sq <- effectsize::eta_squared(model, partial = TRUE)
-    emm <- emmeans(model, "Condition")
+    # Satterthwaite df, as in the anova above and in lmm.py (the emmeans default for
+    # lmer fits is Kenward-Roger)
+    emm <- emmeans(model, "Condition", lmer.df = "satterthwaite")
 
     contrasts <- contrast(emm, method = "trt.vs.ctrl", ref = "OFF", adjust = "sidak")
 
@@ -0,0 +1,149 @@
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from arrhythmicity import (LEGS, MAX_STRIDE_TIME, MIN_PEAK_DISTANCE, MIN_PEAK_HEIGHT,
+                           WINDOW_STRIDES, find_swing_peaks)
+
+#stride events from sagittal shank angular velocity: the swing peak is mid-swing, the
+#first trough after it is heel strike, the last trough before it is toe-off
+MAX_SWING_TIME = 0.8        # s from toe-off or to heel strike around a swing peak
+MAX_TROUGH = 0.0            # deg/s, troughs above this are not gait events
+
+
+def _troughs(x, max_value=MAX_TROUGH):
+    mid = x[1:-1]
+    return np.flatnonzero((mid < x[:-2]) & (mid <= x[2:]) & (mid <= max_value)) + 1
+
+
+def leg_events(signal, times, min_height=MIN_PEAK_HEIGHT, min_distance=MIN_PEAK_DISTANCE,
+               max_swing=MAX_SWING_TIME, max_stride=MAX_STRIDE_TIME):
+    #one row per swing peak: toe-off, swing peak and heel-strike times, swing and stride time
+    x = np.asarray(signal, dtype=np.float64)
+    t = np.asarray(times, dtype=np.float64)
+    peaks = find_swing_peaks(x, t, min_height, min_distance)
+    troughs = _troughs(x)
+    peak_t = t[peaks]
+    nan = np.full(len(peaks), np.nan)
+    to_t, hs_t = nan.copy(), nan.copy()
+    if len(troughs):
+        trough_t = t[troughs]
+        after = np.searchsorted(troughs, peaks, side='right')
+        before = after - 1
+        ok = after < len(troughs)
+        hs = trough_t[np.minimum(after, len(troughs) - 1)]
+        hs_t = np.where(ok & (hs - peak_t <= max_swing), hs, np.nan)
+        ok = before >= 0
+        to = trough_t[np.maximum(before, 0)]
+        to_t = np.where(ok & (peak_t - to <= max_swing), to, np.nan)
+    #stride time between consecutive heel strikes of the same leg
+    stride = np.diff(hs_t, prepend=np.nan)
+    stride[stride > max_stride] = np.nan
+    return pd.DataFrame({'toe_off': to_t, 'swing_peak': peak_t, 'heel_strike': hs_t,
+                         'swing_time': hs_t - to_t, 'stride_time': stride})
+
+
+def gait_asymmetry(right, left):
+    #100 * |ln(R / L)|, 0 for perfectly symmetric gait
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * np.abs(np.log(np.asarray(right) / np.asarray(left)))
+
+
+def _windowed_mean(values, n):
+    v = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(v)
+    c = np.r_[0.0, np.cumsum(np.where(valid, v, 0.0))]
+    k = np.r_[0, np.cumsum(valid)]
+    out = np.full(len(v), np.nan)
+    if len(v) >= n:
+        end = np.arange(n, len(v) + 1)
+        cnt = k[end] - k[end - n]
+        with np.errstate(invalid='ignore'):
+            out[n - 1:] = np.where(cnt == n, (c[end] - c[end - n]) / n, np.nan)
+    return out
+
+
+def pair_strides(right, left, max_stride=MAX_STRIDE_TIME):
+    #each right stride paired with the first left swing peak after it (within one stride)
+    if not len(left):
+        right = right.iloc[:0]
+    pos = np.searchsorted(left['swing_peak'].to_numpy(), right['swing_peak'].to_numpy())
+    ok = pos < len(left)
+    lp = left.iloc[np.minimum(pos, len(left) - 1)].reset_index(drop=True)
+    ok &= (lp['swing_peak'].to_numpy() - right['swing_peak'].to_numpy()) <= max_stride
+    r = right[ok].reset_index(drop=True)
+    l = lp[ok].reset_index(drop=True)
+    return pd.DataFrame({
+        'Time': np.maximum(r['swing_peak'], l['swing_peak']),
+        'stride_R': r['stride_time'], 'stride_L': l['stride_time'],
+        'swing_R': r['swing_time'], 'swing_L': l['swing_time'],
+    })
+
+
+def compute_strides(df, time_col='Time', legs=LEGS, n_strides=WINDOW_STRIDES, **kwargs):
+    #paired strides with per-stride and windowed (last n strides) asymmetry
+    t = df[time_col].to_numpy(dtype=np.float64)
+    right, left = (leg_events(df[col].to_numpy(), t, **kwargs) for col in legs.values())
+    pairs = pair_strides(right, left)
+    pairs['stride_asym'] = gait_asymmetry(pairs['stride_R'], pairs['stride_L'])
+    pairs['swing_asym'] = gait_asymmetry(pairs['swing_R'], pairs['swing_L'])
+    pairs['Asymmetry'] = gait_asymmetry(_windowed_mean(pairs['swing_R'], n_strides),
+                                        _windowed_mean(pairs['swing_L'], n_strides))
+    return pairs
+
+
+def summarize(pairs):
+    #whole-trial values: GA of the mean swing / stride times
+    return {
+        'n_strides': int(pairs['stride_R'].notna().sum()),
+        'stride_time_R': pairs['stride_R'].mean(),
+        'stride_time_L': pairs['stride_L'].mean(),
+        'swing_time_R': pairs['swing_R'].mean(),
+        'swing_time_L': pairs['swing_L'].mean(),
+        'stride_asym': float(gait_asymmetry(pairs['stride_R'].mean(), pairs['stride_L'].mean())),
+        'swing_asym': float(gait_asymmetry(pairs['swing_R'].mean(), pairs['swing_L'].mean())),
+    }
+
+
+def _one(path):
+    df = pd.read_csv(path)
+    if not set(LEGS.values()) <= set(df.columns):
+        return None
+    pairs = compute_strides(df)
+    return path, pairs, summarize(pairs)
+
+
+def batch_strides(paths, workers=None, pattern='*.csv'):
+    #paths: csv files or a directory of them; one trial per worker process, files
+    #without shank channels are skipped
+    if isinstance(paths, (str, os.PathLike)) and os.path.isdir(paths):
+        paths = sorted(glob.glob(os.path.join(paths, pattern)))
+    paths = list(paths)
+    if workers == 1 or len(paths) < 2:
+        results = [_one(p) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_one, paths))
+    results = [r for r in results if r is not None]
+    events, summary = [], []
+    for path, pairs, summ in results:
+        key = os.path.basename(path)
+        events.append(pairs.assign(recording=key))
+        summary.append({'recording': key, **summ})
+    if not results:
+        return pd.DataFrame(columns=['recording', 'Time']), pd.DataFrame(columns=['recording'])
+    events = pd.concat(events, ignore_index=True)
+    return events[['recording'] + [c for c in events.columns if c != 'recording']], pd.DataFrame(summary)
+
+
+if __name__ == '__main__':
+    #python strides.py data/titrations/shankav_*.csv > strides_table.csv
+    #python strides.py data/titrations > strides_table.csv
+    args = sys.argv[1:]
+    _, summary = batch_strides(args[0] if len(args) == 1 and os.path.isdir(args[0]) else args)
+    summary.to_csv(sys.stdout, index=False)
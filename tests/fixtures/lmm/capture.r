@@ -0,0 +1,49 @@
+library(lme4)
+library(lmerTest)
+library(emmeans)
+library(effectsize)
+
+# Rscript tests/fixtures/lmm/capture.r
+# fits the stats_sip.r / stats_tbc.r models to <name>_input.csv and writes every number
+# tests/test_lmm_parity.py compares to <name>_r.csv. emmeans uses Satterthwaite df, as
+# in stats_sip.r / stats_tbc.r and lmm.py.
+
+fixture_dir <- "tests/fixtures/lmm"
+specs <- list(
+  sip = list(rhs = "Condition", outcomes = c("freezes", "full_arrhythm", "mean_shank_av")),
+  tbc = list(rhs = "Condition + Task", outcomes = c("mean_freezing", "arrhythmicity", "mean_shankav"))
+)
+
+block <- function(outcome, table, row, estimate = NA, se = NA, df = NA, stat = NA, p = NA) {
+  data.frame(outcome = outcome, table = table, row = row, estimate = estimate, se = se,
+             df = df, stat = stat, p = p)
+}
+
+for (name in names(specs)) {
+  d <- read.csv(file.path(fixture_dir, paste0(name, "_input.csv")))
+  d$Condition <- factor(d$Condition, levels = c("OFF", "cDBS", "KaDBS", "iDBS"))
+  if ("Task" %in% names(d)) d$Task <- factor(d$Task)
+  d$patient_num <- factor(d$patient_num)
+  rows <- list()
+  for (o in specs[[name]]$outcomes) {
+    model <- lmer(as.formula(paste(o, "~", specs[[name]]$rhs, "+ (1|patient_num)")), data = d)
+
+    fe <- as.data.frame(coef(summary(model)))
+    rows[[length(rows) + 1]] <- block(o, "fixef", rownames(fe), fe$Estimate, fe[["Std. Error"]],
+                                      fe$df, fe[["t value"]], fe[["Pr(>|t|)"]])
+    vc <- as.data.frame(VarCorr(model))
+    rows[[length(rows) + 1]] <- block(o, "varcomp", vc$grp, vc$vcov)
+    a <- as.data.frame(anova(model))
+    rows[[length(rows) + 1]] <- block(o, "anova", rownames(a), df = a$DenDF,
+                                      stat = a[["F value"]], p = a[["Pr(>F)"]])
+    eta <- as.data.frame(effectsize::eta_squared(model, partial = TRUE))
+    rows[[length(rows) + 1]] <- block(o, "eta2", eta$Parameter, eta$Eta2_partial)
+    emm <- emmeans(model, "Condition", lmer.df = "satterthwaite")
+    s <- as.data.frame(emm)
+    rows[[length(rows) + 1]] <- block(o, "emmeans", as.character(s$Condition), s$emmean, s$SE, s$df)
+    ct <- as.data.frame(contrast(emm, method = "trt.vs.ctrl", ref = "OFF", adjust = "sidak"))
+    rows[[length(rows) + 1]] <- block(o, "contrasts", as.character(ct$contrast), ct$estimate,
+                                      ct$SE, ct$df, ct$t.ratio, ct$p.value)
+  }
+  write.csv(do.call(rbind, rows), file.path(fixture_dir, paste0(name, "_r.csv")), row.names = FALSE)
+}
@@ -0,0 +1,88 @@
+import os
+import sys
+
+import numpy as np
+from scipy.signal import find_peaks
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from arrhythmicity import MAX_PENDING_PEAKS, _LegTracker, _enforce_distance, find_swing_peaks
+
+
+def _noisy_shank(seconds=120, fs=128.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * fs)) / fs
+    phase = np.cumsum(2 * np.pi * (0.9 + 0.15 * rng.standard_normal(len(t))) / fs)
+    x = 200 * np.sin(phase) + 40 * rng.standard_normal(len(t))
+    return t, x
+
+
+def test_enforce_distance_is_height_ordered_greedy():
+    #scipy's distance rule on integer positions is the reference greedy
+    rng = np.random.default_rng(1)
+    for _ in range(300):
+        pos = np.unique(rng.integers(1, 200, 40)) * 2
+        heights = rng.random(len(pos))
+        x = np.zeros(pos[-1] + 2)
+        x[pos] = heights + 1
+        ref, _ = find_peaks(x, distance=8)
+        keep = _enforce_distance(pos.astype(float), heights, 8)
+        assert np.array_equal(pos[keep], ref)
+
+
+def test_reported_case():
+    pos = np.array([2, 13, 23, 26, 29, 33, 41, 44, 47, 50, 53, 56, 58], dtype=float)
+    heights = np.array([5, 5, 9, 3, 8, 7, 9, 2, 3, 9, 1, 2, 8], dtype=float)
+    keep = _enforce_distance(pos, heights, 8)
+    assert pos[keep].tolist() == [2, 13, 23, 33, 41, 50, 58]
+
+
+class _Recorder(_LegTracker):
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.strides = []
+
+    def _push_stride(self, stride):
+        self.strides.append(stride)
+        super()._push_stride(stride)
+
+
+def test_batch_matches_stream_on_noisy_data():
+    for seed in range(5):
+        t, x = _noisy_shank(seed=seed)
+        peaks = find_swing_peaks(x, t)
+        tracker = _Recorder(50.0, 0.5, 2.5, 6)
+        for ti, xi in zip(t, x):
+            tracker.update(ti, xi)
+        if tracker.pending:
+            tracker._finalize()
+        assert np.allclose(tracker.strides, np.diff(t[peaks]))
+
+
+def _run(tracker, t, x):
+    longest = 0
+    for ti, xi in zip(t, x):
+        tracker.update(ti, xi)
+        longest = max(longest, len(tracker.pending))
+    if tracker.pending:
+        tracker._finalize()
+    return longest
+
+
+def test_tremor_run_is_split_exactly():
+    #6 Hz tremor above threshold: one run of close peaks for the whole minute
+    rng = np.random.default_rng(2)
+    fs = 128.0
+    t = np.arange(int(60 * fs)) / fs
+    x = (150 + 60 * rng.random(len(t))) * np.sin(2 * np.pi * 6 * t)
+    peaks = find_swing_peaks(x, t)
+    tracker = _Recorder(50.0, 0.5, 2.5, 6)
+    assert _run(tracker, t, x) < MAX_PENDING_PEAKS // 2
+    assert np.allclose(tracker.strides, np.diff(t[peaks]))
+
+
+def test_rising_run_is_bounded():
+    fs = 128.0
+    t = np.arange(int(60 * fs)) / fs
+    x = (60 + 10 * t) * np.sin(2 * np.pi * 6 * t)
+    assert _run(_Recorder(50.0, 0.5, 2.5, 6), t, x) <= MAX_PENDING_PEAKS
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import derived_cache
+from derived_cache import _code_digest, memoize
+
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    monkeypatch.setenv('KADBS_CACHE', str(tmp_path))
+    monkeypatch.setattr(derived_cache, 'ENABLED', True)
+    derived_cache.clear()
+    yield
+    derived_cache.clear()
+
+
+@memoize('test_column_sum')
+def _column_sum(df):
+    return df['x'].sum()
+
+
+@memoize('test_doubled')
+def _doubled(df):
+    return df.assign(x=df['x'] * 2)
+
+
+def test_in_place_change_is_a_new_key():
+    df = pd.DataFrame({'x': [1.0, 2.0, 3.0]})
+    assert _column_sum(df) == 6
+    df.loc[0, 'x'] = 10
+    assert _column_sum(df) == 15
+    df['x'] = 0.0
+    assert _column_sum(df) == 0
+
+
+def test_callers_cannot_change_the_cached_value():
+    df = pd.DataFrame({'x': [1.0, 2.0]})
+    first = _doubled(df)
+    first.loc[0, 'x'] = -1
+    first['y'] = 1
+    again = _doubled(df)
+    assert again['x'].tolist() == [2.0, 4.0]
+    assert 'y' not in again
+
+    @memoize('test_array', disk=False)
+    def array(n):
+        return np.arange(n)
+    out = array(3)
+    with pytest.raises(ValueError):
+        out[0] = 5
+    assert array(3).tolist() == [0, 1, 2]
+
+
+class _Scaler:
+
+    def apply(self, v):
+        return v * 2
+
+
+def _scaled(v):
+    return _Scaler().apply(v)
+
+
+def _digest(fn):
+    h = hashlib.sha1()
+    _code_digest(fn, h, set())
+    return h.hexdigest()
+
+
+def test_same_module_class_methods_are_hashed(monkeypatch):
+    before = _digest(_scaled)
+    monkeypatch.setattr(_Scaler, 'apply', lambda self, v: v * 3)
+    assert _digest(_scaled) != before
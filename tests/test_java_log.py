@@ -0,0 +1,38 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import java_log
+from java_log import read_java_log
+
+
+def _write_log(path, metric_lines):
+    lines = []
+    for i, metrics in enumerate(metric_lines):
+        lines += ['x'] * 5 + [metrics, f'2,0,{1700000000000 + 100 * i}']
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+def test_lines_with_extra_or_missing_fields(tmp_path):
+    path = _write_log(tmp_path / 'log.txt', ['0.4', '0.3,0.2,0.1', '0.5,0.1,0.2,9,9',
+                                             '"a,b",0.2,0.1'])
+    table = read_java_log(path)
+    np.testing.assert_allclose(table['arrhythmicity'], [0.4, 0.3, 0.5, np.nan])
+    np.testing.assert_allclose(table['freeze_prob'], [np.nan, 0.1, 0.2, 0.1])
+    assert table['time_ms'].tolist() == [1700000000000 + 100 * i for i in range(4)]
+    #chunk boundaries do not change the result
+    assert read_java_log(path, chunk_bytes=40).equals(table)
+
+
+def test_parse_errors_surface(tmp_path, monkeypatch):
+    path = _write_log(tmp_path / 'log.txt', ['0.3,0.2,0.1'] * 3)
+
+    def fail(buf):
+        raise KeyError('bad record')
+    monkeypatch.setattr(java_log, '_parse_chunk', fail)
+    with pytest.raises(KeyError, match='bad record'):
+        read_java_log(path)
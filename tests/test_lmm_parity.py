@@ -0,0 +1,145 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, '..'))
+from lmm import fit_outcomes
+from plot_config import CONDITION_ORDER
+
+#parity of lmm.py with lme4 / lmerTest / emmeans / effectsize:
+#- captured R output (tests/fixtures/lmm/capture.r) on the committed inputs, when present
+#- closed forms for balanced designs, where REML, Satterthwaite df and the classical
+#  within-subject ANOVA coincide (and lme4/lmerTest reproduce them exactly)
+
+FIXTURES = os.path.join(HERE, 'fixtures', 'lmm')
+ANALYSES = {
+    'sip': (['freezes', 'full_arrhythm', 'mean_shank_av'], ['Condition']),
+    'tbc': (['mean_freezing', 'arrhythmicity', 'mean_shankav'], ['Condition', 'Task']),
+}
+RTOL = {'estimate': 1e-5, 'se': 1e-4, 'df': 1e-3, 'stat': 1e-4, 'p': 1e-3}
+
+
+def _fit(data, name):
+    outcomes, factors = ANALYSES[name]
+    return fit_outcomes(data, outcomes, factors, levels={'Condition': CONDITION_ORDER})
+
+
+def _python_tables(fit, outcome):
+    fe = fit.fixef(outcome)
+    vc = fit.varcomp(outcome)
+    a = fit.anova(outcome)
+    emm = fit.emmeans(outcome)
+    ct = fit.contrasts(outcome, 'Condition', 'OFF')
+    return {
+        'fixef': pd.DataFrame({'estimate': fe['Estimate'], 'se': fe['Std. Error'], 'df': fe['df'],
+                               'stat': fe['t value'], 'p': fe['Pr(>|t|)']}),
+        'varcomp': pd.DataFrame({'estimate': vc['Variance'].to_numpy()},
+                                index=['patient_num', 'Residual']),
+        'anova': pd.DataFrame({'df': a['DenDF'], 'stat': a['F value'], 'p': a['Pr(>F)']}),
+        'eta2': pd.DataFrame({'estimate': fit.eta_squared(outcome)['Eta2_partial']}),
+        'emmeans': pd.DataFrame({'estimate': emm['emmean'], 'se': emm['SE'], 'df': emm['df']}),
+        'contrasts': pd.DataFrame({'estimate': ct['estimate'], 'se': ct['SE'], 'df': ct['df'],
+                                   'stat': ct['t.ratio'], 'p': ct['p.value']}),
+    }
+
+
+@pytest.mark.parametrize('name', list(ANALYSES))
+def test_matches_captured_r_output(name):
+    expected = os.path.join(FIXTURES, f'{name}_r.csv')
+    if not os.path.exists(expected):
+        pytest.skip('no captured R output, run Rscript tests/fixtures/lmm/capture.r')
+    r = pd.read_csv(expected)
+    fit = _fit(pd.read_csv(os.path.join(FIXTURES, f'{name}_input.csv')), name)
+    for outcome, by_outcome in r.groupby('outcome', sort=False):
+        ours = _python_tables(fit, outcome)
+        for table, rows in by_outcome.groupby('table', sort=False):
+            mine = ours[table]
+            for _, row in rows.iterrows():
+                for col, rtol in RTOL.items():
+                    if pd.isna(row[col]) or col not in mine.columns:
+                        continue
+                    assert mine.loc[row['row'], col] == pytest.approx(row[col], rel=rtol, abs=1e-8), \
+                        (outcome, table, row['row'], col)
+
+
+def _balanced(n_patients, tasks, seed):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_patients):
+        b = rng.normal(0, 8)
+        for c, cond in enumerate(CONDITION_ORDER):
+            for k, task in enumerate(tasks):
+                rows.append({'patient_num': f'P{i:02d}', 'Condition': cond, 'Task': task,
+                             'y': 30 + b + 3 * c - 2 * k + rng.normal(0, 4)})
+    return pd.DataFrame(rows)
+
+
+def _classical(data, tasks):
+    #subject + condition (+ task) fixed-effects ANOVA: the balanced REML answer
+    p, c, t = data['patient_num'].nunique(), len(CONDITION_ORDER), len(tasks)
+    y = data['y'].to_numpy()
+    grand = y.mean()
+    subj = data.groupby('patient_num')['y'].transform('mean').to_numpy()
+    cond = data.groupby('Condition')['y'].transform('mean').to_numpy()
+    task = data.groupby('Task')['y'].transform('mean').to_numpy()
+    resid = y - subj - cond - task + 2 * grand
+    df_e = p * c * t - p - (c - 1) - (t - 1)
+    mse = (resid ** 2).sum() / df_e
+    ms_subj = ((subj - grand) ** 2).sum() / (p - 1)
+    ss_cond = ((cond - grand) ** 2).sum()
+    means = data.groupby('Condition')['y'].mean().reindex(CONDITION_ORDER).to_numpy()
+    emm_var = (ms_subj + (c - 1) * mse) / (c * t * p)
+    emm_df = (ms_subj + (c - 1) * mse) ** 2 / (ms_subj ** 2 / (p - 1) + ((c - 1) * mse) ** 2 / df_e)
+    return {'p': p, 'c': c, 't': t, 'df_e': df_e, 'mse': mse, 'ms_subj': ms_subj,
+            'F': ss_cond / (c - 1) / mse, 'means': means, 'emm_var': emm_var, 'emm_df': emm_df,
+            'sigma_b2': (ms_subj - mse) / (c * t)}
+
+
+@pytest.mark.parametrize('tasks', [['SIP'], ['Ellipses', 'Figure8']])
+def test_balanced_design_closed_forms(tasks):
+    data = _balanced(8, tasks, seed=len(tasks))
+    factors = ['Condition'] + (['Task'] if len(tasks) > 1 else [])
+    fit = fit_outcomes(data, ['y'], factors, levels={'Condition': CONDITION_ORDER})
+    ref = _classical(data, tasks)
+    c, df_e = ref['c'], ref['df_e']
+
+    vc = fit.varcomp('y')['Variance'].to_numpy()
+    assert vc == pytest.approx([ref['sigma_b2'], ref['mse']], rel=1e-5)
+
+    a = fit.anova('y').loc['Condition']
+    assert a['NumDF'] == c - 1
+    assert a['DenDF'] == pytest.approx(df_e, rel=1e-4)
+    assert a['F value'] == pytest.approx(ref['F'], rel=1e-5)
+    assert a['Pr(>F)'] == pytest.approx(stats.f.sf(ref['F'], c - 1, df_e), rel=1e-4)
+    eta = fit.eta_squared('y').loc['Condition', 'Eta2_partial']
+    assert eta == pytest.approx(ref['F'] * (c - 1) / (ref['F'] * (c - 1) + df_e), rel=1e-5)
+
+    emm = fit.emmeans('y')
+    assert emm['emmean'].to_numpy() == pytest.approx(ref['means'], rel=1e-6)
+    assert emm['SE'].to_numpy() == pytest.approx(np.full(c, np.sqrt(ref['emm_var'])), rel=1e-4)
+    assert emm['df'].to_numpy() == pytest.approx(np.full(c, ref['emm_df']), rel=1e-3)
+
+    ct = fit.contrasts('y', 'Condition', 'OFF')
+    se = np.sqrt(2 * ref['mse'] / (ref['p'] * ref['t']))
+    est = ref['means'][1:] - ref['means'][0]
+    t = est / se
+    p_sidak = 1 - (1 - 2 * stats.t.sf(np.abs(t), df_e)) ** (c - 1)
+    assert ct['estimate'].to_numpy() == pytest.approx(est, rel=1e-6)
+    assert ct['SE'].to_numpy() == pytest.approx(np.full(c - 1, se), rel=1e-4)
+    assert ct['df'].to_numpy() == pytest.approx(np.full(c - 1, df_e), rel=1e-4)
+    assert ct['p.value'].to_numpy() == pytest.approx(p_sidak, rel=1e-3)
+
+
+@pytest.mark.parametrize('name', list(ANALYSES))
+def test_fixture_inputs_fit(name):
+    #the committed inputs are unbalanced (dropped cells, missing outcomes) and must fit
+    data = pd.read_csv(os.path.join(FIXTURES, f'{name}_input.csv'))
+    fit = _fit(data, name)
+    for outcome in ANALYSES[name][0]:
+        fe = fit.fixef(outcome)
+        assert np.isfinite(fe[['Estimate', 'Std. Error', 'df']].to_numpy()).all()
@@ -0,0 +1,34 @@
+import itertools
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from resampling import resample_contrasts
+
+
+def _cohort(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(7):
+        base = rng.normal(30, 5)
+        #KaDBS and OFF differ, cDBS/iDBS sit far away from both
+        for cond, shift in (('OFF', 0), ('cDBS', 40), ('KaDBS', 3), ('iDBS', -40)):
+            rows.append({'patient_num': f'P{i}', 'Condition': cond,
+                         'y': base + shift + rng.normal(0, 1)})
+    return pd.DataFrame(rows)
+
+
+def test_p_matches_exact_sign_flip_test():
+    data = _cohort()
+    wide = data.pivot(index='patient_num', columns='Condition', values='y')
+    d = (wide['KaDBS'] - wide['OFF']).to_numpy()
+    flips = np.array(list(itertools.product([-1, 1], repeat=len(d))))
+    exact = (np.abs((flips * d).mean(axis=1)) >= abs(d.mean()) - 1e-12).mean()
+    out = resample_contrasts(data, ['y'], n_perm=20000, n_boot=100, seed=1)
+    row = out.set_index('contrast').loc['KaDBS - OFF']
+    #other conditions are far away and must not enter the null of this contrast
+    assert abs(row['p_perm'] - exact) < 0.01
+    assert row['estimate'] == np.mean(d)
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from titration import therapeutic_windows
+
+LEVELS = [0, 20, 40, 60, 80, 100]
+
+
+def _table(**responses):
+    return pd.concat([pd.DataFrame({'titration': name, 'Stim Level': LEVELS, 'freezes': y})
+                      for name, y in responses.items()], ignore_index=True)
+
+
+def test_rising_fit_has_no_window():
+    out = therapeutic_windows(_table(down=[60, 58, 40, 12, 8, 7], up=[5, 6, 10, 35, 50, 52]))
+    down, up = out.set_index('titration').loc[['down', 'up']].itertuples()
+    assert down.decreasing and down.top > down.bottom
+    assert LEVELS[0] <= down.window_low <= down.window_high <= LEVELS[-1]
+    assert not up.decreasing
+    assert np.isnan(up.window_low) and np.isnan(up.window_high)
+
+
+def test_no_titrations_is_an_empty_table():
+    full = therapeutic_windows(_table(down=[60, 58, 40, 12, 8, 7]))
+    for table in [_table(down=[60, 58, 40, 12, 8, 7]).iloc[:0],
+                  _table(down=[np.nan] * 6)]:
+        out = therapeutic_windows(table)
+        assert out.empty and list(out.columns) == list(full.columns)
@@ -0,0 +1,161 @@
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+from instrument import traced
+
+#dose-response fits for stimulation titrations: one decreasing 4-parameter logistic per
+#titration, all fit together by a batched Levenberg-Marquardt, therapeutic window read
+#off the fitted curve
+
+LEVEL_COL = 'Stim Level'
+RESPONSE_COL = 'freezes'
+PATTERN = 'titrations_Output*.csv'
+EFFECT_FRACTION = 0.9   # window opens once 90% of the achievable reduction is reached
+MAX_ITER = 200
+TOL = 1e-10
+
+
+def load_titrations(data_dir='data', pattern=PATTERN):
+    #every titration file under data_dir, stacked; the id is the path relative to data_dir
+    frames = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '**', pattern), recursive=True)):
+        df = pd.read_csv(path)
+        df.insert(0, 'titration', os.path.splitext(os.path.relpath(path, data_dir))[0])
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['titration', LEVEL_COL, RESPONSE_COL])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _padded(table, level_col, response_col):
+    #ragged titrations -> (titrations, max levels) arrays plus a mask
+    table = table.dropna(subset=[level_col, response_col]).sort_values(['titration', level_col])
+    ids, codes = np.unique(table['titration'].to_numpy(dtype=str), return_inverse=True)
+    pos = table.groupby(codes).cumcount().to_numpy()
+    #no usable rows: (0, 1) arrays, which the batched fit turns into an empty table
+    x = np.zeros((len(ids), pos.max(initial=0) + 1))
+    y = np.zeros_like(x)
+    m = np.zeros_like(x, dtype=bool)
+    x[codes, pos] = table[level_col].to_numpy(dtype=np.float64)
+    y[codes, pos] = table[response_col].to_numpy(dtype=np.float64)
+    m[codes, pos] = True
+    return ids, x, y, m
+
+
+def logistic(x, params):
+    #top at low stimulation, bottom at high; params (..., 4): top, bottom, x50, log slope
+    top, bottom, x50, logk = np.moveaxis(params, -1, 0)
+    z = np.exp(logk)[..., None] * (x - x50[..., None])
+    g = 0.5 * (1 - np.tanh(z / 2))
+    return bottom[..., None] + (top - bottom)[..., None] * g
+
+
+def _jacobian(x, params):
+    top, bottom, x50, logk = np.moveaxis(params, -1, 0)
+    k = np.exp(logk)[:, None]
+    z = k * (x - x50[:, None])
+    g = 0.5 * (1 - np.tanh(z / 2))
+    dg = g * (1 - g)
+    span = (top - bottom)[:, None]
+    return np.stack([g, 1 - g, span * dg * k, -span * dg * (x - x50[:, None]) * k], axis=-1)
+
+
+def _initial(x, y, m):
+    lo = np.where(m, x, np.inf).min(axis=1)
+    hi = np.where(m, x, -np.inf).max(axis=1)
+    first = y[:, 0]
+    last = y[np.arange(len(y)), m.sum(axis=1) - 1]
+    width = np.maximum(hi - lo, 1e-6)
+    return np.column_stack([first, last, (lo + hi) / 2, np.log(4 / width)]), lo, hi
+
+
+def fit_dose_response(x, y, m):
+    #batched Levenberg-Marquardt on (titrations, levels) arrays, masked to observed levels
+    p, lo, hi = _initial(x, y, m)
+    width = np.maximum(hi - lo, 1e-6)
+    bounds_lo = np.column_stack([np.full_like(lo, -np.inf), np.full_like(lo, -np.inf),
+                                 lo - width, np.log(0.1 / width)])
+    bounds_hi = np.column_stack([np.full_like(lo, np.inf), np.full_like(lo, np.inf),
+                                 hi + width, np.log(100 / width)])
+    w = m.astype(np.float64)
+
+    def sse(params):
+        return (w * (y - logistic(x, params)) ** 2).sum(axis=1)
+
+    mu = np.full(len(p), 1e-3)
+    cost = sse(p)
+    converged = np.zeros(len(p), dtype=bool)
+    eye = np.eye(p.shape[1])
+    for _ in range(MAX_ITER):
+        J = _jacobian(x, p) * w[..., None]
+        r = (y - logistic(x, p)) * w
+        JtJ = np.einsum('blp,blq->bpq', J, J)
+        grad = np.einsum('blp,bl->bp', J, r)
+        damp = mu[:, None, None] * (JtJ * eye + 1e-12 * eye)
+        step = np.linalg.solve(JtJ + damp, grad[..., None])[..., 0]
+        trial = np.clip(p + step, bounds_lo, bounds_hi)
+        new = sse(trial)
+        better = (new < cost) & ~converged
+        gain = np.where(better, cost - new, 0.0)
+        p = np.where(better[:, None], trial, p)
+        converged |= better & (gain <= TOL * np.maximum(cost, 1e-12))
+        converged |= ~better & (mu > 1e10)
+        cost = np.where(better, new, cost)
+        mu = np.where(better, mu / 3, mu * 2)
+        if converged.all():
+            break
+    return p, cost, converged
+
+
+def window_bounds(params, x, y, m, fraction=EFFECT_FRACTION):
+    #opens where the fit reaches `fraction` of the top-to-bottom reduction; closes at the
+    #tested level with the least observed response at or above that point. A fit that
+    #rises with stimulation (top < bottom) has no reduction and no window: NaN bounds
+    top, bottom, x50, logk = params.T
+    low = x50 + np.log(fraction / (1 - fraction)) / np.exp(logk)
+    hi = np.where(m, x, -np.inf).max(axis=1)
+    low = np.clip(low, np.where(m, x, np.inf).min(axis=1), hi)
+    beyond = m & (x >= low[:, None] - 1e-9)
+    best = np.argmin(np.where(beyond, y, np.inf), axis=1)
+    high = np.where(beyond.any(axis=1), x[np.arange(len(x)), best], hi)
+    decreasing = top >= bottom
+    return np.where(decreasing, low, np.nan), np.where(decreasing, np.maximum(high, low), np.nan)
+
+
+@traced('transform.therapeutic_windows')
+def therapeutic_windows(table, level_col=LEVEL_COL, response_col=RESPONSE_COL,
+                        fraction=EFFECT_FRACTION):
+    #cohort table: one row per titration with window bounds, fit parameters and fit quality
+    ids, x, y, m = _padded(table, level_col, response_col)
+    params, cost, converged = fit_dose_response(x, y, m)
+    low, high = window_bounds(params, x, y, m, fraction)
+    n = m.sum(axis=1)
+    mean = np.where(m, y, 0).sum(axis=1) / n
+    ss_tot = (m * (y - mean[:, None]) ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r2 = 1 - cost / ss_tot
+    return pd.DataFrame({
+        'titration': ids,
+        'n_levels': n,
+        'window_low': low,
+        'window_high': high,
+        'top': params[:, 0],
+        'bottom': params[:, 1],
+        'x50': params[:, 2],
+        'slope': np.exp(params[:, 3]),
+        'r2': r2,
+        'rmse': np.sqrt(cost / n),
+        'converged': converged,
+        'decreasing': params[:, 0] >= params[:, 1],
+    })
+
+
+if __name__ == '__main__':
+    from ingest import data_path
+    table = load_titrations(sys.argv[1] if len(sys.argv) > 1 else data_path())
+    print(therapeutic_windows(table).to_csv(index=False), end='')